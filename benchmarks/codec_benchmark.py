@@ -0,0 +1,72 @@
+#!/usr/bin/python
+"""compare the redis codec against json for real-time train schedules
+
+run from the project root:  python -m benchmarks.codec_benchmark
+"""
+import json
+import os
+import timeit
+import xml.etree.ElementTree as ET
+from datetime import datetime
+import pytz
+from models import codec
+from njtransit.api import NJTransitAPI
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tests', 'data')
+BOARDS = ['NY_train_schedule.xml', 'CM_train_schedule.xml', 'train_schedule.xml']
+REPEAT = 200
+
+
+def read_board(filename: str) -> list:
+    """parse one of our canned real-time train schedules"""
+    return NJTransitAPI.parse_train_schedule(ET.parse(os.path.join(DATA, filename)).getroot())
+
+
+def json_encode(trains: list) -> bytes:
+    """what we'd store without the codec"""
+    return json.dumps(trains, default=lambda value: value.timestamp()).encode('utf-8')
+
+
+def json_decode(value: bytes) -> list:
+    """json & turn the times back into datetimes"""
+    timezone = pytz.timezone("America/New_York")
+    trains = json.loads(value.decode('utf-8'))
+    for train in trains:
+        train['departure'] = datetime.fromtimestamp(train['departure'], timezone)
+        for stop in train['stops'].values():
+            if 'time' in stop:
+                stop['time'] = datetime.fromtimestamp(stop['time'], timezone)
+    return trains
+
+
+def measure(name: str, trains: list) -> None:
+    """print size & encode/decode time for json and the codec"""
+    as_json = json_encode(trains)
+    as_codec = codec.encode_train_schedule(trains)
+    results = []
+    for label, encode, decode, encoded in (('json', json_encode, json_decode, as_json),
+                                           ('codec', codec.encode_train_schedule,
+                                            codec.decode_train_schedule, as_codec)):
+        encode_us = timeit.timeit(lambda: encode(trains), number=REPEAT) / REPEAT * 1e6
+        decode_us = timeit.timeit(lambda: decode(encoded), number=REPEAT) / REPEAT * 1e6
+        results.append((label, len(encoded), encode_us, decode_us))
+
+    print('{0} ({1} trains)'.format(name, len(trains)))
+    for label, size, encode_us, decode_us in results:
+        print('  {0:6s} {1:8d} bytes  encode {2:8.1f}us  decode {3:8.1f}us'.
+              format(label, size, encode_us, decode_us))
+
+
+def main():
+    for filename in BOARDS:
+        measure(filename, read_board(filename))
+
+    # a big hub at rush hour, every board together
+    trains = []
+    for filename in BOARDS:
+        trains.extend(read_board(filename))
+    measure('combined', trains)
+
+
+if __name__ == '__main__':
+    main()
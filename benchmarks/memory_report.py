@@ -0,0 +1,52 @@
+#!/usr/bin/python
+"""how much memory the long-lived globals & a parsed board take
+
+run from the project root:  python -m benchmarks.memory_report
+"""
+import os
+import tracemalloc
+import xml.etree.ElementTree as ET
+from controllers import station_names
+from gtfs import timetable, transfers
+from models import memory
+from njtransit.api import NJTransitAPI
+from benchmarks.codec_benchmark import DATA, BOARDS, read_board
+
+
+def read_station_list() -> dict:
+    """the canned station list, name <-> abbreviation"""
+    root = ET.parse(os.path.join(DATA, 'train_stations.xml')).getroot()
+    stations = {}
+    for station in root:
+        abbreviation = station.findtext('STATION_2CHAR')
+        name = station.findtext('STATIONNAME')
+        if abbreviation and name and '\n' not in name:
+            stations[name] = abbreviation
+            stations[abbreviation] = name
+    return stations
+
+
+def main():
+    diagnostics = memory.initialize_diagnostics(enabled=True)
+
+    train_stations = read_station_list()
+    NJTransitAPI.share_train_stations(train_stations)
+    diagnostics.run('load_globals', lambda: (timetable.initialize_timetable(),
+                                             transfers.initialize_transfer_table(train_stations),
+                                             station_names.initialize_station_index(
+                                                 train_stations)))
+    for filename in BOARDS:
+        boards = diagnostics.run('parse ' + filename, read_board, filename)
+        print('{0}: {1} trains, {2:.1f}KB deep size'.
+              format(filename, len(boards), memory.deep_size(boards) / 1024))
+
+    report = diagnostics.last_report
+    print('long-lived globals:')
+    for name, size in sorted(report['globals'].items()):
+        print('  {0:20s} {1:10.1f}KB'.format(name, size / 1024))
+    print('traced peak {0:.1f}KB'.format(tracemalloc.get_traced_memory()[1] / 1024))
+    memory.initialize_diagnostics(enabled=False)
+
+
+if __name__ == '__main__':
+    main()
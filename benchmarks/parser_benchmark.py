@@ -0,0 +1,57 @@
+#!/usr/bin/python
+"""parse time & memory of each XML parser backend on big generated boards
+
+run from the project root:  python -m benchmarks.parser_benchmark
+"""
+import os
+import re
+import timeit
+import tracemalloc
+from njtransit import parsers
+from benchmarks.codec_benchmark import DATA
+
+REPEAT = 20
+SIZES = [1, 10, 50]  # copies of the New York board's trains
+
+
+def generate_board(copies: int) -> bytes:
+    """the New York board with its trains repeated"""
+    with open(os.path.join(DATA, 'NY_train_schedule.xml'), 'rb') as board_file:
+        board = board_file.read()
+    items = re.search(rb'<ITEMS>(.*)</ITEMS>', board, re.DOTALL)
+    return board[:items.start(1)] + items.group(1) * copies + board[items.end(1):]
+
+
+def measure(backend, parse: str, content: bytes) -> tuple:
+    """average milliseconds & peak KB allocated to parse the content"""
+    def run():
+        return getattr(backend, parse)(backend.decode(content))
+
+    milliseconds = timeit.timeit(run, number=REPEAT) / REPEAT * 1000
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return milliseconds, peak / 1024
+
+
+def main():
+    print('backends: {0}'.format(', '.join(parsers.BACKENDS)))
+    for copies in SIZES:
+        content = generate_board(copies)
+        trains = len(parsers.get_backend('etree').train_schedule(content.decode('utf-8')))
+        print('train schedule, {0} trains ({1:.0f}KB)'.format(trains, len(content) / 1024))
+        for name in parsers.BACKENDS:
+            milliseconds, peak = measure(parsers.get_backend(name), 'train_schedule', content)
+            print('  {0:6s} {1:8.2f}ms  peak {2:8.1f}KB'.format(name, milliseconds, peak))
+
+    with open(os.path.join(DATA, 'train_stations.xml'), 'rb') as stations_file:
+        content = stations_file.read()
+    print('station list ({0:.0f}KB)'.format(len(content) / 1024))
+    for name in parsers.BACKENDS:
+        milliseconds, peak = measure(parsers.get_backend(name), 'station_list', content)
+        print('  {0:6s} {1:8.2f}ms  peak {2:8.1f}KB'.format(name, milliseconds, peak))
+
+
+if __name__ == '__main__':
+    main()
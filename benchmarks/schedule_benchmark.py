@@ -0,0 +1,61 @@
+#!/usr/bin/python
+"""compare the loop & the NumPy masks for picking candidate trains at a busy hub
+
+run from the project root:  python -m benchmarks.schedule_benchmark
+"""
+import copy
+import timeit
+from datetime import timedelta
+from controllers import board_arrays
+from controllers.train_scheduler import TrainSchedule
+from benchmarks.codec_benchmark import read_board
+
+REPEAT = 200
+COPIES = 8  # the New York board repeated, shifted 15 minutes each time
+
+
+def hub_board() -> list:
+    """a New York board at rush hour, well over 100 trains"""
+    trains = []
+    board = read_board('NY_train_schedule.xml')
+    for copy_number in range(COPIES):
+        shift = timedelta(minutes=15 * copy_number)
+        for train in copy.deepcopy(board):
+            train['tid'] = '{0}-{1}'.format(train['tid'], copy_number)
+            train['departure'] += shift
+            for stop in train['stops'].values():
+                if stop.get('time') is not None:
+                    stop['time'] += shift
+            trains.append(train)
+    return trains
+
+
+def main():
+    if not board_arrays.available():
+        print('NumPy is not installed')
+        return
+
+    trains = hub_board()
+    departure_time = min(train['departure'] for train in trains)
+    routes = (('New York', 'Chatham'), ('New York', 'Trenton'), ('New York', 'Long Branch'))
+    print('New York hub ({0} trains)'.format(len(trains)))
+    for start, end in routes:
+        loop_us = timeit.timeit(lambda: TrainSchedule.select_candidates(trains, start, end,
+                                                                        departure_time),
+                                number=REPEAT) / REPEAT * 1e6
+        # a fresh board every time, what the first route for a board costs
+        cold_us = timeit.timeit(lambda: board_arrays.select_candidates(
+            board_arrays.BoardArrays(trains), start, end, departure_time),
+                                number=REPEAT) / REPEAT * 1e6
+        # the arrays already built, what later routes for the board cost
+        board = board_arrays.BoardArrays(trains)
+        board_arrays.select_candidates(board, start, end, departure_time)
+        warm_us = timeit.timeit(lambda: board_arrays.select_candidates(board, start, end,
+                                                                       departure_time),
+                                number=REPEAT) / REPEAT * 1e6
+        print('  {0:12s} loop {1:8.1f}us  numpy {2:8.1f}us  numpy (arrays built) {3:8.1f}us'.
+              format(end, loop_us, cold_us, warm_us))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,31 @@
+#!/usr/bin/python
+"""what each worker pays to get the timetable: reading the GTFS files
+vs attaching to the compiled image in shared memory
+
+run from the project root:  python -m benchmarks.shared_timetable_benchmark
+"""
+import time
+import tracemalloc
+from gtfs import timetable, shared_timetable
+
+
+def measure(label: str, load) -> timetable.Timetable:
+    tracemalloc.start()
+    start = time.perf_counter()
+    schedule = load()
+    elapsed = time.perf_counter() - start
+    allocated = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print('{0:8s} {1:8.1f}ms {2:10.1f}KB private'.format(label, elapsed * 1000, allocated / 1024))
+    return schedule
+
+
+def main():
+    schedule = measure('parse', timetable.Timetable)
+    with shared_timetable.TimetableImage(schedule) as image:
+        print('image    {0:10.1f}KB shared'.format(image.size / 1024))
+        measure('attach', lambda: shared_timetable.attach(image.name))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,38 @@
+#!/usr/bin/python
+"""how long resolving a spoken station name takes, exact & fuzzy
+
+run from the project root:  python -m benchmarks.station_name_benchmark
+"""
+import os
+import timeit
+import xml.etree.ElementTree as ET
+from controllers import station_names
+from benchmarks.codec_benchmark import DATA
+
+REPEAT = 1000
+SLOT_VALUES = ('Chatham', 'newark penn station', 'chatam', 'newark pen', 'bogus')
+
+
+def read_stations() -> dict:
+    """the station list from our canned XML test data"""
+    station_list = {}
+    for station in ET.parse(os.path.join(DATA, 'train_stations.xml')).getroot():
+        abbreviation = station.find('STATION_2CHAR').text
+        station_name = station.find('STATIONNAME').text
+        if '\n' not in station_name:
+            station_list.update({station_name: abbreviation, abbreviation: station_name})
+    return station_list
+
+
+def main():
+    index = station_names.StationNameIndex(read_stations())
+    print('{0} names'.format(len(index)))
+    for slot_value in SLOT_VALUES:
+        resolve_us = timeit.timeit(lambda: index.resolve(slot_value),
+                                   number=REPEAT) / REPEAT * 1e6
+        print('  {0:22s} -> {1!s:14s} {2:8.1f}us'.format(repr(slot_value),
+                                                         index.resolve(slot_value), resolve_us))
+
+
+if __name__ == '__main__':
+    main()
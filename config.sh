@@ -19,6 +19,22 @@ echo "REDIS_PASSWORD =" \"$REDIS_PASSWORD\" >> prod_config.py
 echo "USERNAME = " \"$NJT_USERNAME\" >> prod_config.py
 echo "APIKEY = " \"$NJT_APIKEY\" >> prod_config.py
 echo "HOSTNAME =" \"$NJT_URL\" >> prod_config.py
+echo "GTFS_OFFLINE =" ${GTFS_OFFLINE:-False} >> prod_config.py
+echo "REALTIME_WINDOW_MINUTES =" ${REALTIME_WINDOW_MINUTES:-30} >> prod_config.py
+echo "BOARD_CACHE_SECONDS =" ${BOARD_CACHE_SECONDS:-90} >> prod_config.py
+echo "PREWARM_STATIONS =" ${PREWARM_STATIONS:-10} >> prod_config.py
+echo "VECTORIZED_SCHEDULE =" ${VECTORIZED_SCHEDULE:-False} >> prod_config.py
+echo "PROFILE_SAMPLE_RATE =" ${PROFILE_SAMPLE_RATE:-0.0} >> prod_config.py
+echo "MEMORY_DIAGNOSTICS =" ${MEMORY_DIAGNOSTICS:-False} >> prod_config.py
+echo "REQUEST_TIMEOUT_SECONDS =" ${REQUEST_TIMEOUT_SECONDS:-3.0} >> prod_config.py
+echo "BREAKER_FAILURES =" ${BREAKER_FAILURES:-5} >> prod_config.py
+echo "STALE_BOARD_SECONDS =" ${STALE_BOARD_SECONDS:-3600} >> prod_config.py
+echo "STOP_LIST_CACHE =" ${STOP_LIST_CACHE:-True} >> prod_config.py
+echo "XML_PARSER =" \"${XML_PARSER:-etree}\" >> prod_config.py
+echo "PRELOAD =" ${PRELOAD:-True} >> prod_config.py
+echo "PRECOMPUTE_ROUTES =" ${PRECOMPUTE_ROUTES:-0} >> prod_config.py
+echo "EMF_METRICS =" ${EMF_METRICS:-True} >> prod_config.py
+echo "TRACING =" ${TRACING:-False} >> prod_config.py
 
 # generate a configuration file from environment variables
 # (overwrite bogus file that already exists)
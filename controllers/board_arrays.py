@@ -0,0 +1,84 @@
+#!/usr/bin/python
+"""a station's train schedule held as NumPy arrays, so the trains that
+qualify for a route are picked with boolean masks instead of a loop.
+NumPy is optional, without it TrainSchedule uses the loop"""
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+
+def available() -> bool:
+    """True if NumPy is installed"""
+    return numpy is not None
+
+
+class BoardArrays:
+    """the trains of one board & the time each reaches a station, as
+    epoch seconds (NaN where the train doesn't stop). Arrays for a
+    station are built the first time they're asked for & kept, so a
+    board used for many routes only pays for the conversion once"""
+
+    def __init__(self, trains: list):
+        self.trains = trains
+        self.train_index = numpy.arange(len(trains))
+        self._times = {}  # station name -> array of times
+        self._serves = {}  # station name -> mask of trains stopping there
+
+    def __len__(self) -> int:
+        return len(self.trains)
+
+    def serves(self, station_name: str):
+        """mask of the trains that stop at the station"""
+        mask = self._serves.get(station_name)
+        if mask is None:
+            mask = numpy.fromiter((station_name in train['stops'] for train in self.trains),
+                                  dtype=bool, count=len(self.trains))
+            self._serves[station_name] = mask
+        return mask
+
+    def times(self, station_name: str):
+        """when each train is at the station, NaN if it doesn't stop there"""
+        times = self._times.get(station_name)
+        if times is None:
+            nan = float('nan')
+            times = numpy.fromiter((BoardArrays._timestamp(train['stops'].get(station_name), nan)
+                                    for train in self.trains),
+                                   dtype=float, count=len(self.trains))
+            self._times[station_name] = times
+        return times
+
+    @staticmethod
+    def _timestamp(stop: dict, missing: float) -> float:
+        if not stop or stop.get('time') is None:
+            return missing
+        return stop['time'].timestamp()
+
+    def select(self, mask) -> list:
+        """the trains picked by the mask, in board order"""
+        return [self.trains[index] for index in self.train_index[mask]]
+
+
+def select_candidates(board: BoardArrays, starting_station_name: str,
+                      ending_station_name: str, departure_time) -> tuple:
+    """the vectorized TrainSchedule.select_candidates
+    :return: (direct trains, possible indirect trains)
+    """
+    departure = departure_time.timestamp()
+    origin = board.times(starting_station_name)
+    destination = board.times(ending_station_name)
+    with numpy.errstate(invalid='ignore'):  # NaN compares False, which is what we want
+        leaving = origin >= departure
+        direct = leaving & (destination > departure) & (destination > origin)
+    indirect = leaving & ~board.serves(ending_station_name)
+    return board.select(direct), board.select(indirect)
+
+
+def select_transfers(board: BoardArrays, starting_station_name: str,
+                     ending_station_name: str, departure_time) -> list:
+    """trains at the destination that could finish an indirect route,
+    they don't stop at the start (that'd be direct) & arrive after we leave"""
+    departure = departure_time.timestamp()
+    with numpy.errstate(invalid='ignore'):
+        arriving = board.times(ending_station_name) > departure
+    return board.select(arriving & ~board.serves(starting_station_name))
@@ -0,0 +1,246 @@
+#!/usr/bin/python
+"""precomputed answers for the busiest routes. Most NextTrain requests
+are commuters asking for the same few routes from their home station,
+so once a night we work out the best train from the GTFS timetable for
+every minute a train leaves the start of each busy route, and store
+them in a redis sorted set scored by that minute. The best train for
+any time is the answer with the first score at or after it, so a
+request is a single ZRANGEBYSCORE plus the cached real-time board
+(if the pre-warmer has it) for the current times.
+
+run from the project root:  python -m controllers.precompute [count]
+"""
+import json
+import sys
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime, timedelta
+import pytz
+from controllers import train_scheduler
+from gtfs import provider, timetable
+from models import cloudredis, metrics
+from models.settings import setting
+
+# where commuters from a home station are usually going
+DEFAULT_DESTINATIONS = ['NY', 'NP', 'HB']
+# the longest a journey (with a transfer) takes, trains leaving
+# later than this after the departure time can't be the answer
+JOURNEY_WINDOW = timedelta(hours=3)
+ANSWER_SECONDS = 2 * 24 * 60 * 60  # a night's answers outlive the next night's run
+TIMEZONE = pytz.timezone("America/New_York")
+
+
+def route_count() -> int:
+    """how many routes are precomputed, 0 (the default) is none"""
+    return int(setting('PRECOMPUTE_ROUTES', 0))
+
+
+def top_routes(train_stations: dict, count: int) -> list:
+    """the most requested routes, topped up with the popular home
+    stations to the usual destinations
+    :param train_stations: NJTransit station list, name <-> abbreviation
+    :return: [(start abbreviation, destination abbreviation), ...]
+    """
+    routes = cloudredis.top_routes(count)
+    for home_station in cloudredis.top_home_stations(count):
+        start = train_stations.get(home_station)
+        for destination in DEFAULT_DESTINATIONS:
+            if len(routes) >= count:
+                return routes
+            if start and start != destination and (start, destination) not in routes:
+                routes.append((start, destination))
+    return routes
+
+
+def encode_answer(route: dict, station_names: tuple) -> bytes:
+    """a best route (see TrainSchedule.best_route) with only the stops
+    we need to say it, times as epoch seconds"""
+    def trimmed(train: dict) -> dict:
+        return {'tid': train.get('tid'),
+                'destination': train.get('destination'),
+                'stops': {name: int(stop['time'].timestamp())
+                          for name, stop in train['stops'].items()
+                          if name in station_names}}
+
+    if 'direct' in route:
+        answer = {'direct': trimmed(route['direct'])}
+    else:
+        indirect = route['indirect']
+        station_names += (indirect['station'], indirect.get('walk_to'))
+        answer = {'indirect': {'start': trimmed(indirect['start']),
+                               'transfer': trimmed(indirect['transfer']),
+                               'station': indirect['station']}}
+        if indirect.get('walk_to'):
+            answer['indirect']['walk_to'] = indirect['walk_to']
+    return json.dumps(answer, sort_keys=True, separators=(',', ':')).encode('utf-8')
+
+
+def decode_answer(value: bytes) -> dict:
+    """reverse of encode_answer, in the format of TrainSchedule.best_route"""
+    def train(trimmed: dict) -> dict:
+        return {'tid': trimmed['tid'],
+                'destination': trimmed['destination'],
+                'stops': {name: {'time': datetime.fromtimestamp(seconds, TIMEZONE),
+                                 'status': 'Scheduled'}
+                          for name, seconds in trimmed['stops'].items()}}
+
+    answer = json.loads(value.decode('utf-8'))
+    if 'direct' in answer:
+        return {'direct': train(answer['direct'])}
+    indirect = answer['indirect']
+    decoded = {'indirect': {'start': train(indirect['start']),
+                            'transfer': train(indirect['transfer']),
+                            'station': indirect['station']}}
+    if 'walk_to' in indirect:
+        decoded['indirect']['walk_to'] = indirect['walk_to']
+    return decoded
+
+
+class Board:
+    """a day's trains from the timetable, sliced by departure time"""
+
+    def __init__(self, trains: list):
+        self.trains = trains
+        self.departures = [train['departure'] for train in trains]
+
+    def window(self, start: datetime, end: datetime) -> list:
+        """the trains leaving from start up to & including end"""
+        first = bisect_left(self.departures, start)
+        return self.trains[first:bisect_right(self.departures, end, first)]
+
+
+class RoutePrecomputer:
+    """works out a route's answers for a service day from the timetable"""
+
+    def __init__(self, tso: train_scheduler.TrainSchedule = None,
+                 schedule: timetable.Timetable = None):
+        """
+        :param tso: schedules the routes, its real-time API supplies the station list
+        :param schedule: the timetable, defaults to the shared one
+        """
+        self.tso = tso if tso else train_scheduler.TrainSchedule(offline=False, vectorized=False)
+        self.schedule = schedule if schedule else timetable.initialize_timetable()
+        # long enough for the last train of the day to find a connection
+        self.provider = provider.OfflineScheduleProvider(self.tso.njt,
+                                                         horizon=timedelta(hours=24) +
+                                                         JOURNEY_WINDOW,
+                                                         schedule=self.schedule)
+        self._boards = {}  # (abbreviation, service date) -> Board
+
+    def board(self, station_abbreviation: str, service_date: date) -> Board:
+        key = (station_abbreviation, service_date)
+        if key not in self._boards:
+            trains = self.provider.scheduled_trains(station_abbreviation,
+                                                    self.schedule.service_day_start(service_date))
+            self._boards[key] = Board(trains or [])
+        return self._boards[key]
+
+    def answers(self, starting_abbreviation: str, ending_abbreviation: str,
+                service_date: date) -> list:
+        """the best route for each time a train leaves the start on the
+        service day, [(departure time, best route), ...]"""
+        start_board = self.board(starting_abbreviation, service_date)
+        end_board = self.board(ending_abbreviation, service_date)
+        starting_name = self.tso.train_stations(starting_abbreviation)
+        ending_name = self.tso.train_stations(ending_abbreviation)
+
+        # later trains are the next service day's
+        day_end = self.schedule.service_day_start(service_date + timedelta(days=1))
+        answers = []
+        for departure_time in sorted({train['departure'] for train in start_board.trains
+                                      if train['departure'] < day_end}):
+            end = departure_time + JOURNEY_WINDOW
+            self.tso.boards = {starting_abbreviation: start_board.window(departure_time, end),
+                               ending_abbreviation: end_board.window(departure_time, end)}
+            try:
+                routes = self.tso.schedule(starting_abbreviation, ending_abbreviation,
+                                           departure_time, record_traffic=False)
+            finally:
+                self.tso.boards = None
+            best = train_scheduler.TrainSchedule.best_route(starting_name, ending_name, routes)
+            if best:
+                answers.append((departure_time, best))
+        return answers
+
+    def store(self, starting_abbreviation: str, ending_abbreviation: str,
+              service_date: date) -> int:
+        """precompute & store a route's answers for the day
+        :return: the number of answers
+        """
+        station_names = (self.tso.train_stations(starting_abbreviation),
+                         self.tso.train_stations(ending_abbreviation))
+        answers = self.answers(starting_abbreviation, ending_abbreviation, service_date)
+        encoded = {}
+        for departure_time, best in answers:
+            # the score makes each answer unique, the same train can be
+            # the best for several departure times
+            member = b'%d:' % departure_time.timestamp() + encode_answer(best, station_names)
+            encoded[member] = departure_time.timestamp()
+        day_end = self.schedule.service_day_start(service_date + timedelta(days=1))
+        cloudredis.cache_answers(starting_abbreviation, ending_abbreviation, encoded,
+                                 day_end.timestamp(), ANSWER_SECONDS)
+        return len(encoded)
+
+
+def precompute(count: int = None, service_date: date = None) -> dict:
+    """the nightly job, precompute the answers for the busiest routes
+    :param count: how many routes, defaults to the PRECOMPUTE_ROUTES setting
+    :param service_date: defaults to today (Eastern)
+    :return: {'start_destination': answers stored, ...}, empty if the
+    timetable doesn't cover the day (it'd only store no answers)
+    """
+    if count is None:
+        count = route_count()
+    if service_date is None:
+        service_date = datetime.now(TIMEZONE).date()
+    precomputer = RoutePrecomputer()
+    stored = {}
+    if not precomputer.schedule.has_service(service_date):
+        return stored
+    for start, destination in top_routes(precomputer.tso.njt.train_stations, count):
+        if not (precomputer.tso.validate_station_name(start) and
+                precomputer.tso.validate_station_name(destination)):
+            continue
+        stored['{0}_{1}'.format(start, destination)] = \
+            precomputer.store(start, destination, service_date)
+    return stored
+
+
+def overlay(route: dict, starting_abbreviation: str, ending_abbreviation: str) -> dict:
+    """replace the timetable's times & status with the real-time ones, for
+    trains on the cached boards of the start & destination. Never calls
+    NJTransit, the pre-warmer keeps the busy boards cached"""
+    live = {}
+    for abbreviation in (starting_abbreviation, ending_abbreviation):
+        for train in cloudredis.train_schedule(abbreviation) or ():
+            live.setdefault(train.get('tid'), train)
+
+    trains = [route['direct']] if 'direct' in route else \
+        [route['indirect']['start'], route['indirect']['transfer']]
+    for train in trains:
+        live_train = live.get(train['tid'])
+        if live_train is None:
+            continue
+        for name, stop in train['stops'].items():
+            live_stop = live_train['stops'].get(name)
+            if live_stop and live_stop.get('time') is not None:
+                stop['time'] = live_stop['time']
+                stop['status'] = live_stop.get('status')
+    return route
+
+
+def lookup(starting_abbreviation: str, ending_abbreviation: str,
+           departure_time: datetime) -> dict:
+    """the precomputed best route leaving at or after the departure time,
+    with the real-time overlay. None if the route isn't precomputed"""
+    value = cloudredis.answer(starting_abbreviation, ending_abbreviation,
+                              departure_time.timestamp())
+    metrics.EMF.count('Cache.precomputed.Hit' if value is not None else 'Cache.precomputed.Miss')
+    if value is None:
+        return None
+    return overlay(decode_answer(value.split(b':', 1)[1]),
+                   starting_abbreviation, ending_abbreviation)
+
+
+if __name__ == '__main__':
+    cloudredis.initialize_cloud_redis()
+    print(precompute(int(sys.argv[1]) if len(sys.argv) > 1 else None))
@@ -0,0 +1,117 @@
+#!/usr/bin/python
+"""work moved into the Lambda init phase. At import (before the first,
+billed, request) we connect to redis, fetch the station list, read the
+timetable & build the indexes, then freeze what's been allocated so
+the garbage collector doesn't rescan it on every request.
+
+The init timings are logged with the first request's, once per container:
+    [INIT]: {"preloaded": true, "init": {"redis": 0.01, ...}, "first_request": 0.2}
+"""
+import gc
+import json
+import time
+import xml.etree.ElementTree as ET
+import redis
+import requests
+from controllers import train_scheduler
+from njtransit import api
+from gtfs import timetable
+from models import cloudredis
+from models.settings import setting
+
+
+class Preloader:
+    """runs & times the init phase steps, then times the first request"""
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.steps = {}  # step name -> seconds
+        self.failed = {}  # step name -> why
+        self.frozen = 0  # objects moved to the permanent generation
+        self.preloaded = False
+        self.first_request = None  # seconds, once it's finished
+        self.reported = False
+
+    def step(self, name: str, func, *args):
+        """run & time one step. A step that can't reach redis or NJTransit
+        is skipped, the first request will try again"""
+        start = self.clock()
+        try:
+            return func(*args)
+        except (redis.RedisError, requests.RequestException, ET.ParseError, OSError) as error:
+            self.failed[name] = str(error)
+            return None
+        finally:
+            self.steps[name] = round(self.clock() - start, 6)
+
+    def run(self) -> None:
+        """everything the first request would otherwise have to build"""
+        gc.disable()  # nothing to collect yet, it's all long lived
+        try:
+            self.step('redis', self._connect)
+            stations = self.step('station_list', self._station_list)
+            tso = train_scheduler.TrainSchedule()
+            self.step('timetable', timetable.initialize_timetable)
+            if stations:
+                self.step('station_index', lambda: tso.station_index)
+                self.step('transfer_table', lambda: tso.transfers)
+                self.step('station_grid', lambda: tso.station_grid.footpaths())
+        finally:
+            gc.enable()
+        self.step('freeze', self._freeze)
+        self.preloaded = True
+
+    @staticmethod
+    def _connect() -> None:
+        cloudredis.initialize_cloud_redis()
+        cloudredis.REDIS_SERVER.ping()
+
+    @staticmethod
+    def _station_list() -> dict:
+        stations = api.NJTransitAPI().train_stations
+        api.NJTransitAPI.share_train_stations(stations)
+        return stations
+
+    def _freeze(self) -> None:
+        """collect once, then move the survivors out of the GC's sight"""
+        gc.collect()
+        if hasattr(gc, 'freeze'):  # python 3.7+
+            gc.freeze()
+            self.frozen = gc.get_freeze_count()
+
+    def request_finished(self, seconds: float) -> None:
+        """the first request's duration is the one we care about"""
+        if self.first_request is None:
+            self.first_request = round(seconds, 6)
+
+    def report(self) -> dict:
+        """the init & first request timings"""
+        return {'preloaded': self.preloaded,
+                'init': self.steps,
+                'init_total': round(sum(self.steps.values()), 6),
+                'failed': self.failed,
+                'frozen': self.frozen,
+                'first_request': self.first_request}
+
+    def log(self, log) -> None:
+        """log the report once, after the first request"""
+        if self.reported or self.first_request is None:
+            return
+        self.reported = True
+        log('[INIT]: {0}'.format(json.dumps(self.report(), sort_keys=True)))
+
+
+PRELOADER = Preloader()
+
+
+def initialize_preloader(enabled: bool = None) -> Preloader:
+    """called at import of the lambda function, the Lambda init phase
+    :param enabled: defaults to the PRELOAD setting
+    """
+    global PRELOADER  # pylint: disable=W0603
+    if enabled is None:
+        enabled = setting('PRELOAD', False)
+    PRELOADER = Preloader()
+    if enabled:
+        PRELOADER.run()
+    return PRELOADER
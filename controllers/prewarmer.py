@@ -0,0 +1,60 @@
+#!/usr/bin/python
+"""refresh the busiest stations' train schedules ahead of demand"""
+import requests
+from controllers import train_scheduler
+from models import cloudredis, setuplogging
+from njtransit.breaker import CircuitOpenError
+from configuration import config
+
+# until we've seen some traffic, these are the busy ones
+DEFAULT_HOT_STATIONS = ['NY', 'HB', 'NP', 'SE']
+
+
+def hot_stations(count: int) -> list:
+    """the most requested stations, topped up with the usual suspects"""
+    stations = cloudredis.top_stations(count)
+    for station in DEFAULT_HOT_STATIONS:
+        if len(stations) >= count:
+            break
+        if station not in stations:
+            stations.append(station)
+    return stations
+
+
+def prewarm(count: int = None) -> list:
+    """called on a schedule (not by Alexa). Refreshes the cached real-time
+    train schedules for the busiest stations so user requests find them
+    in the cache, and the ones served stale while NJTransit was down.
+    Also keeps the redis & NJTransit connections warm.
+    :param count: how many stations to refresh, default PREWARM_STATIONS
+    :return: the stations refreshed
+    """
+    if not setuplogging.LOGGING_HANDLER:
+        setuplogging.initialize_logging(mocking=True)
+    if count is None:
+        count = getattr(config, 'PREWARM_STATIONS', 10)
+
+    cloudredis.REDIS_SERVER.ping()
+    tso = train_scheduler.TrainSchedule()
+    refreshed = []
+    # stations someone was given a stale schedule for come first
+    pending = cloudredis.pending_refreshes()
+    stations = pending + [station for station in hot_stations(count) if station not in pending]
+    for station_abbreviation in stations:
+        if not tso.validate_station_name(station_abbreviation):
+            continue
+        try:
+            tso.refresh_train_schedule(station_abbreviation)
+        except CircuitOpenError:  # still down, try again next time
+            for station in pending:
+                if station not in refreshed:
+                    cloudredis.request_refresh(station)
+            break
+        except requests.RequestException as error:  # just this station, try the rest
+            setuplogging.LOGGING_HANDLER('[PREWARM]: {0} not refreshed, {1}'.
+                                         format(station_abbreviation, error))
+            if station_abbreviation in pending:
+                cloudredis.request_refresh(station_abbreviation)
+            continue
+        refreshed.append(station_abbreviation)
+    return refreshed
@@ -0,0 +1,107 @@
+#!/usr/bin/python
+"""arrive-by queries: the train (or pair of trains, with one transfer)
+that leaves the start as late as possible & still gets to the
+destination by a time. Each hop of a train, one stop to its next, is a
+connection. They're scanned once, latest first, keeping the latest
+time we can leave each station & still make it (a reverse connection
+scan), rather than scheduling again & again for earlier departures."""
+from datetime import datetime, timedelta
+
+
+def connections(trains: list) -> list:
+    """every hop of every train, latest departure first
+    :return: [(departure, arrival, from station, to station, train index), ...]
+    """
+    hops = []
+    for index, train in enumerate(trains):
+        stops = sorted(((stop['time'], name) for name, stop in train['stops'].items()
+                        if stop.get('time') is not None),
+                       key=lambda stop: stop[0])
+        for (departure, from_station), (arrival, to_station) in zip(stops, stops[1:]):
+            hops.append((departure, arrival, from_station, to_station, index))
+    hops.sort(key=lambda hop: hop[0], reverse=True)
+    return hops
+
+
+def unique_trains(trains: list) -> list:
+    """a train can be on the start's & the destination's boards, keep one"""
+    seen = set()
+    unique = []
+    for train in trains:
+        key = (train.get('tid'), train.get('departure'))
+        if train.get('tid') is None or key not in seen:
+            seen.add(key)
+            unique.append(train)
+    return unique
+
+
+def connect(direct: dict, index: int, station: str, arrival: datetime,
+            transfer_time, walks: dict) -> tuple:
+    """the latest train, from the station or a walk away, a train arriving
+    at the station can change to & still get to the destination in time
+    :param direct: station -> (latest departure, train index) reaching the destination
+    :param walks: station name -> walking seconds, from this station
+    :return: (station, onward train index, station walked to or None), None if there isn't one
+    """
+    best = None
+    changes = [(station, transfer_time(station), None)]
+    changes += [(other, timedelta(seconds=seconds), other) for other, seconds in walks.items()]
+    for change_station, change_time, walk_to in changes:
+        onward = direct.get(change_station)
+        if onward is None or onward[1] == index or arrival + change_time > onward[0]:
+            continue
+        if best is None or onward[0] > best[0]:
+            best = (onward[0], (station, onward[1], walk_to))
+    return best[1] if best else None
+
+
+def latest_route(trains: list, starting_station: str, ending_station: str,
+                 arrival_time: datetime, departure_time: datetime, transfer_time,
+                 footpaths: dict = None) -> dict:
+    """the route leaving the start latest that arrives by the arrival time
+    :param trains: the trains to consider, e.g. the start's & destination's boards
+    :param departure_time: the earliest we can leave
+    :param transfer_time: station name -> the minimum time (timedelta) to change trains
+    :param footpaths: station name -> {station name: walking seconds}, where
+    you can change trains by walking to a nearby station
+    :return: {'direct': train} or {'indirect': {'start', 'transfer', 'station'}},
+    like TrainSchedule.best_route, {} if nothing gets there in time. A
+    transfer that walks to another station has it as 'walk_to'
+    """
+    footpaths = footpaths or {}
+    trains = unique_trains(trains)
+    direct = {}  # station -> (latest departure, train index) of a train reaching the destination
+    indirect = {}  # station -> (latest departure, train index, transfer station, onward index)
+    reaches = set()  # trains that get to the destination in time
+    connects = {}  # train index -> (transfer station, onward train index, walk to)
+    for departure, arrival, from_station, to_station, index in connections(trains):
+        if departure < departure_time:
+            break  # the rest have already left
+        if to_station == ending_station:
+            if arrival <= arrival_time:
+                reaches.add(index)
+        elif index not in connects:
+            connection = connect(direct, index, to_station, arrival, transfer_time,
+                                 footpaths.get(to_station, {}))
+            if connection is not None:
+                connects[index] = connection
+
+        # on a tie the first one found is kept
+        if index in reaches:
+            if from_station not in direct or departure > direct[from_station][0]:
+                direct[from_station] = (departure, index)
+        elif index in connects:
+            if from_station not in indirect or departure > indirect[from_station][0]:
+                indirect[from_station] = (departure, index) + connects[index]
+
+    best_direct = direct.get(starting_station)
+    best_indirect = indirect.get(starting_station)
+    if best_direct is not None and (best_indirect is None or best_direct[0] >= best_indirect[0]):
+        return {'direct': trains[best_direct[1]]}
+    if best_indirect is not None:
+        _, index, station, onward, walk_to = best_indirect
+        route = {'start': trains[index], 'transfer': trains[onward], 'station': station}
+        if walk_to is not None:
+            route['walk_to'] = walk_to
+        return {'indirect': route}
+    return {}
@@ -0,0 +1,152 @@
+#!/usr/bin/python
+"""resolve what the user said (an Alexa slot value) to a station name"""
+import re
+from gtfs import timetable
+
+DEFAULT_MATCH_THRESHOLD = 0.6  # Dice coefficient of the trigrams
+DEFAULT_MATCH_MARGIN = 0.1  # how far the best match has to lead any other station
+
+# the words station names are abbreviated differently in NJTransit,
+# GTFS & speech, every form is compared as the short one
+ABBREVIATIONS = {
+    'avenue': 'ave',
+    'av': 'ave',
+    'center': 'ctr',
+    'centre': 'ctr',
+    'heights': 'hts',
+    'junction': 'jct',
+    'landing': 'ldg',
+    'mills': 'mls',
+    'mount': 'mt',
+    'route': 'rt',
+    'rte': 'rt',
+    'square': 'sq',
+    'state': 'st',
+    'station': 'stn',
+    'street': 'st',
+    'upper': 'upp',
+}
+
+# what riders call stations that neither NJTransit nor GTFS name that way
+SPOKEN_NAMES = {
+    'montclair state': 'MSU',
+    'montclair state university': 'MSU',
+}
+
+
+def trigrams(normalized_name: str) -> set:
+    """the 3 character sequences of a name, padded so the
+    start of a word counts for more than the middle"""
+    padded = '  ' + normalized_name + ' '
+    return {padded[index:index + 3] for index in range(len(padded) - 2)}
+
+
+def canonical_name(station_name: str) -> str:
+    """normalized, with every abbreviated word in its short form
+    so 'Princeton Junction' is 'Princeton Jct.'"""
+    return ' '.join(ABBREVIATIONS.get(word, word)
+                    for word in timetable.normalize_name(station_name).split())
+
+
+def numbers(normalized_name: str) -> tuple:
+    """the numbers in a name, 'route 17' is never 'route 23'"""
+    return tuple(re.findall(r'\d+', normalized_name))
+
+
+class StationNameIndex:
+    """canonical (casefolded, punctuation stripped, abbreviated) station
+    names and their aliases, with a trigram index for names that don't
+    match exactly. Everything resolves to the NJTransit station name."""
+
+    def __init__(self, train_stations: dict, threshold: float = DEFAULT_MATCH_THRESHOLD,
+                 margin: float = DEFAULT_MATCH_MARGIN):
+        """
+        :param train_stations: NJTransit station list, name <-> abbreviation
+        :param threshold: how similar a fuzzy match has to be, 0 to 1
+        :param margin: how much more similar than any other station, 0 to 1
+        """
+        self.threshold = threshold
+        self.margin = margin
+        self.train_stations = train_stations
+        self._names = {}  # canonical name -> NJTransit station name
+        for name, abbreviation in train_stations.items():
+            if len(name) > 2:
+                self._names.setdefault(canonical_name(name), name)
+                self._names.setdefault(abbreviation.casefold(), name)
+
+        # the GTFS names are the long form, 'Newark Penn Station' vs 'Newark Penn'
+        schedule = timetable.initialize_timetable()
+        if not schedule.station_names:
+            schedule.resolve_stations(train_stations)
+        for stop_id, name in schedule.station_names.items():
+            if name not in train_stations:
+                continue
+            self._names.setdefault(canonical_name(schedule.stops[stop_id].stop_name), name)
+        for alias, name in list(timetable.STATION_ALIASES.items()) + list(SPOKEN_NAMES.items()):
+            if name in train_stations:
+                self._names.setdefault(canonical_name(alias), name)
+
+        self._keys = list(self._names)
+        self._key_trigrams = [trigrams(key) for key in self._keys]
+        self._key_numbers = [numbers(key) for key in self._keys]
+        self._trigram_keys = {}  # trigram -> [key index, ...]
+        for index, key_trigrams in enumerate(self._key_trigrams):
+            for trigram in key_trigrams:
+                self._trigram_keys.setdefault(trigram, []).append(index)
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def fuzzy_match(self, canonical: str) -> str:
+        """the most similar station above the threshold, None if none
+        are or another station is nearly as similar ('newark' could be
+        Newark Penn, Newark Broad or Newark Airport)"""
+        query = trigrams(canonical)
+        query_numbers = numbers(canonical)
+        shared = {}
+        for trigram in query:
+            for index in self._trigram_keys.get(trigram, ()):
+                shared[index] = shared.get(index, 0) + 1
+
+        scores = {}  # NJTransit station name -> best score of its names
+        for index, count in shared.items():
+            if self._key_numbers[index] != query_numbers:
+                continue
+            name = self._names[self._keys[index]]
+            score = 2.0 * count / (len(query) + len(self._key_trigrams[index]))
+            scores[name] = max(score, scores.get(name, 0.0))
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        if not ranked or ranked[0][1] < self.threshold:
+            return None
+        if len(ranked) > 1 and ranked[0][1] - ranked[1][1] < self.margin:
+            return None
+        return ranked[0][0]
+
+    def resolve(self, station_name: str) -> str:
+        """the NJTransit station name for what was said, None if
+        we can't tell what station was meant"""
+        if station_name in self.train_stations:
+            return station_name if len(station_name) > 2 else \
+                self.train_stations[station_name]
+
+        canonical = canonical_name(station_name)
+        resolved = self._names.get(canonical)
+        if resolved is None and canonical:
+            resolved = self.fuzzy_match(canonical)
+        return resolved
+
+
+STATION_INDEX = None
+
+
+def initialize_station_index(train_stations: dict) -> StationNameIndex:
+    """build the name index once per container, it's shared by all requests.
+    Only rebuilt for a new station list, it's the same dict from one
+    request to the next once it's shared (NJTransitAPI.train_stations)
+    :param train_stations: NJTransit station list, name <-> abbreviation
+    """
+    global STATION_INDEX  # pylint: disable=W0603
+    if STATION_INDEX is None or STATION_INDEX.train_stations is not train_stations:
+        STATION_INDEX = StationNameIndex(train_stations)
+    return STATION_INDEX
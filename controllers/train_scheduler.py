@@ -1,13 +1,22 @@
 #!/usr/bin/python
 """orchestration for our train schedules"""
+import heapq
+import multiprocessing
 from datetime import datetime, timedelta
-from njtransit import api
-from models import cloudredis
+import requests
+from njtransit import api, breaker
+from models import cloudredis, metrics, tracing
+from gtfs import provider, transfers, timetable, shared_timetable, station_grid
+from controllers import station_names, board_arrays, reverse_scan
+from configuration import config
 
 
 class TrainSchedule:
     """will produce train schedules"""
     _njt = None  # object for NJTransit API
+    board_cache_seconds = getattr(config, 'BOARD_CACHE_SECONDS', 0)  # 0 is no caching
+    # how long the last good schedule is kept for when NJTransit is down, 0 is never
+    stale_board_seconds = getattr(config, 'STALE_BOARD_SECONDS', 0)
 
     def train_stations(self, value: str) -> str:
         """dereference our NJTransit property"""
@@ -18,12 +27,134 @@ class TrainSchedule:
         """property to hold our NJTransit API object"""
         return self._njt
 
-    def __init__(self):
+    def __init__(self, offline: bool = None, vectorized: bool = None):
+        """
+        :param offline: serve schedules from the GTFS timetable, only using
+        the real-time API for trains about to leave. Defaults to the
+        GTFS_OFFLINE configuration setting
+        :param vectorized: pick candidate trains with NumPy masks (if NumPy
+        is installed). Defaults to the VECTORIZED_SCHEDULE configuration setting
+        """
+        if vectorized is None:
+            vectorized = getattr(config, 'VECTORIZED_SCHEDULE', False)
+        self.vectorized = vectorized and board_arrays.available()
+        self._boards = {}  # id of a train list -> BoardArrays
+        self.stale_stations = set()  # stations we served an old schedule for
+        self.boards = None  # abbreviation -> trains, while a batch shares them
+        self.stale_boards = set()  # the batch's boards that were served stale
         self._njt = api.NJTransitAPI()
+        self._timetable_provider = None  # the timetable, when we aren't offline
+        if offline is None:
+            offline = getattr(config, 'GTFS_OFFLINE', False)
+        if offline:
+            window = timedelta(minutes=getattr(config, 'REALTIME_WINDOW_MINUTES', 30))
+            self._njt = provider.OfflineScheduleProvider(self._njt,
+                                                         realtime_window=window)
+
+    @property
+    def timetable_provider(self) -> provider.OfflineScheduleProvider:
+        """the timetable's trains, the njt object itself when we're offline"""
+        if isinstance(self._njt, provider.OfflineScheduleProvider):
+            return self._njt
+        if self._timetable_provider is None:
+            self._timetable_provider = provider.OfflineScheduleProvider(self._njt)
+        return self._timetable_provider
+
+    @property
+    def transfers(self) -> transfers.TransferTable:
+        """the precomputed transfer stations, built from the GTFS timetable"""
+        return transfers.initialize_transfer_table(self.njt.train_stations)
+
+    @property
+    def station_grid(self) -> station_grid.StationGrid:
+        """where the stations are, from the GTFS timetable"""
+        return station_grid.initialize_station_grid(self.njt.train_stations)
+
+    def nearest_station(self, latitude: float, longitude: float) -> str:
+        """the station nearest a location (e.g. the device's), None if
+        there isn't one within station_grid.NEAREST_STATION_METERS"""
+        nearest = self.station_grid.nearest(latitude, longitude,
+                                            max_meters=station_grid.NEAREST_STATION_METERS)
+        return nearest[0][1] if nearest else None
+
+    @property
+    def station_index(self) -> station_names.StationNameIndex:
+        """normalized & fuzzy station name lookup, shared by all requests"""
+        return station_names.initialize_station_index(self.njt.train_stations)
+
+    def resolve_station_name(self, station_name: str) -> str:
+        """the station name for what the user said, None if not a station"""
+        return self.station_index.resolve(station_name)
 
     def validate_station_name(self, station_name: str) -> bool:
         """make sure the station name is valid"""
-        return station_name in self.njt.train_stations
+        return self.resolve_station_name(station_name) is not None
+
+    def arrays_for(self, trains: list) -> board_arrays.BoardArrays:
+        """the train list as NumPy arrays, built once per list"""
+        board = self._boards.get(id(trains))
+        if board is None or board.trains is not trains:
+            board = board_arrays.BoardArrays(trains)
+            self._boards[id(trains)] = board
+        return board
+
+    @property
+    def caching(self) -> bool:
+        """True if real-time train schedules are cached in redis"""
+        return self.board_cache_seconds > 0 and cloudredis.REDIS_SERVER is not None
+
+    def train_schedule(self, station_abbreviation: str,
+                       test_argument: str = None) -> list:
+        """the station's real-time train schedule, from the cache
+        if the pre-warmer (or an earlier request) fetched it recently"""
+        if self.boards is not None and station_abbreviation in self.boards:
+            if station_abbreviation in self.stale_boards:
+                self.stale_stations.add(station_abbreviation)
+            return self.boards[station_abbreviation]
+        if self.caching:
+            trains = cloudredis.train_schedule(station_abbreviation)
+            metrics.EMF.count('Cache.redis.Hit' if trains is not None else 'Cache.redis.Miss')
+            if trains is not None:
+                return trains
+        if self.serving_stale and breaker.BREAKER.state() == 'open':
+            # don't wait on NJTransit, it's down
+            trains = self.stale_train_schedule(station_abbreviation)
+            if trains is not None:
+                return trains
+        try:
+            return self.refresh_train_schedule(station_abbreviation, test_argument)
+        except requests.RequestException:
+            trains = self.stale_train_schedule(station_abbreviation) \
+                if self.serving_stale else None
+            if trains is None:
+                raise
+            return trains
+
+    @property
+    def serving_stale(self) -> bool:
+        """True if we keep the last good schedules for when NJTransit is down"""
+        return self.caching and self.stale_board_seconds > 0
+
+    def stale_train_schedule(self, station_abbreviation: str) -> list:
+        """the last good schedule, None if there isn't one. The station is
+        queued for the scheduled pre-warmer, nothing refreshes it before
+        that runs (its refresh is what probes NJTransit)"""
+        trains = cloudredis.stale_train_schedule(station_abbreviation)
+        metrics.EMF.count('Cache.stale.Hit' if trains is not None else 'Cache.stale.Miss')
+        if trains is not None:
+            self.stale_stations.add(station_abbreviation)
+            cloudredis.request_refresh(station_abbreviation)
+        return trains
+
+    def refresh_train_schedule(self, station_abbreviation: str,
+                               test_argument: str = None) -> list:
+        """fetch the station's train schedule & cache it for the next request"""
+        trains = self.njt.train_schedule(station_abbreviation, test_argument)
+        if self.caching and trains:
+            cloudredis.cache_train_schedule(station_abbreviation, trains,
+                                            self.board_cache_seconds,
+                                            self.stale_board_seconds)
+        return trains
 
     @staticmethod
     def optimize_indirect_routes(indirect_routes: list, destination: str) -> list:
@@ -67,6 +198,7 @@ class TrainSchedule:
 
         return optimized
 
+    @tracing.traced('TrainSchedule.schedule_indirect_routes')
     def schedule_indirect_routes(self, possible_indirect_trains: list,
                                  starting_station: str,
                                  ending_station_abbreviated: str,
@@ -84,57 +216,102 @@ class TrainSchedule:
         """
         # let's get all trains that will be at our
         # ending station, using abbreviated name
-        ending_station_trains = self.njt.train_schedule(ending_station_abbreviated,
-                                                        test_argument)
+        ending_station_trains = self.train_schedule(ending_station_abbreviated,
+                                                    test_argument)
 
         ending_station = self.train_stations(ending_station_abbreviated)
+        if self.vectorized:
+            ending_station_trains = board_arrays.select_transfers(
+                self.arrays_for(ending_station_trains),
+                starting_station, ending_station, departure_time)
+
+        # the transfer table knows where the lines meet, so we only look
+        # at those stations (& the ones a short walk from another line)
+        transfer_stations = self.transfer_stations(starting_station, ending_station,
+                                                   departure_time)
+        footpaths = self.station_grid.footpaths()
 
         # we are looking for all routes where there's an intersection
         # between the 'possible_indirect_trains' and this list.
         transfer_routes = []
         transfer_threshold = timedelta(minutes=5)  # allow at least 5 minutes to transfer
         for start_train in possible_indirect_trains:
+            leaves_start = start_train['stops'][starting_station]['time']
+            if transfer_stations is None:
+                start_train_transfers = start_train['stops']
+            else:
+                start_train_transfers = [station for station in start_train['stops']
+                                         if station in transfer_stations or
+                                         station in footpaths]
+                if not start_train_transfers:
+                    continue
             for transfer_train in ending_station_trains:
                 if starting_station in transfer_train['stops']:
                     continue  # already have this in direct route
+                if ending_station not in transfer_train['stops']:
+                    continue  # on the board but its stop list doesn't say so
                 arrival_time = transfer_train['stops'][ending_station]['time']
                 if arrival_time <= departure_time:
                     continue
 
                 # we need to find the intersection of the 'start_train'
                 # and our tentative 'transfer_train'
-                for start_stations in start_train['stops']:
+                for start_stations in start_train_transfers:
 
                     # if this is the starting station, skip
                     if start_stations == starting_station:
                         continue
 
                     # ignore trains that have already left or going in wrong direction
-                    start_time = start_train['stops'][start_stations]['time']
+                    start_time = start_train['stops'][start_stations].get('time')
+                    if start_time is None:
+                        continue  # the board doesn't say when it's there
                     if start_time < departure_time or start_time >= arrival_time:
                         continue
-                    # if intersection station isn't in transfer train, skip
-                    if start_stations not in transfer_train['stops']:
+                    # timetable stop lists include the stops before ours
+                    if start_time <= leaves_start:
                         continue
-                    transfer_station = transfer_train['stops'][start_stations]
-                    # to transfer, the transfer has to arrive after the intersection train
-                    if transfer_station['time'] <= start_time:
-                        continue  # no time
-
-                    # make sure the transfer train is going the correct direction!!
-                    if transfer_train['stops'][ending_station]['time'] < transfer_station['time']:
-                        continue  # wrong direction!
-
-                    # finally, make sure we have enough time to catch the train
-                    wait_time = transfer_station['time'] - \
-                        start_train['stops'][start_stations]['time']
-                    if wait_time < transfer_threshold:
+                    # change trains here, or walk to a station nearby
+                    changes = [(start_stations, 0)] + \
+                        sorted(footpaths.get(start_stations, {}).items())
+                    change_station = None
+                    for station, walk_seconds in changes:
+                        # if intersection station isn't in transfer train, skip
+                        if station not in transfer_train['stops']:
+                            continue
+                        if walk_seconds and station in start_train['stops']:
+                            continue  # no need to walk, stay on the train
+
+                        transfer_station = transfer_train['stops'][station]
+                        # to transfer, the transfer has to arrive after the intersection train
+                        if transfer_station.get('time') is None or \
+                                transfer_station['time'] <= start_time:
+                            continue  # no time
+
+                        # make sure the transfer train is going the correct direction!!
+                        if transfer_train['stops'][ending_station]['time'] < \
+                                transfer_station['time']:
+                            continue  # wrong direction!
+
+                        # finally, make sure we have enough time to catch the train
+                        wait_time = transfer_station['time'] - start_time
+                        if wait_time < max(transfer_threshold, timedelta(seconds=walk_seconds)):
+                            continue
+                        if transfer_stations and station == start_stations and \
+                                wait_time.total_seconds() < transfer_stations.get(station, 0):
+                            continue
+                        change_station = station
+                        break
+                    if change_station is None:
                         continue
 
                     # It looks like we found a winner!
-                    transfer_routes.append({'start': start_train,
-                                            'transfer': transfer_train,
-                                            'station': start_stations})
+                    route = {'start': start_train,
+                             'transfer': transfer_train,
+                             'station': start_stations}
+                    if change_station != start_stations:
+                        route['walk_to'] = change_station  # like reverse_scan's
+                    transfer_routes.append(route)
                     break
 
         # remove any redundant routes from the list
@@ -158,91 +335,60 @@ class TrainSchedule:
         :return: dictionary, either {'direct':[]} or {'indirect':[]}
         """
 
-        # simple case of empty schedule
-        if 'direct' not in routes and 'indirect' not in routes:
-            return {}
-
-        best_direct_train = {}
-        if 'direct' in routes:
-            leaves = None
-            arrives = None
-            for train in routes['direct']:
-                if leaves is None:
-                    leaves = train['stops'][starting_station_name]['time']
-                if arrives is None:
-                    arrives = train['stops'][ending_station_name]['time']
-                    best_direct_train = train
-                if best_direct_train != train:
-                    if arrives == train['stops'][ending_station_name]['time']:
-                        if leaves < train['stops'][starting_station_name]['time']:
-                            best_direct_train = train
-                            leaves = train['stops'][ending_station_name]['time']
-
-                    if arrives > train['stops'][ending_station_name]['time']:
-                        best_direct_train = train
-                        arrives = train['stops'][ending_station_name]['time']
-
-        # now find the best indirect, same criteria as the best direct
-        best_indirect_train = {}
-        if 'indirect' in routes:
-            leaves = None
-            arrives = None
-            for train in routes['indirect']:
-                if leaves is None:
-                    leaves = train['start']['stops'][starting_station_name]['time']
-                if arrives is None:
-                    arrives = train['transfer']['stops'][ending_station_name]['time']
-                    best_indirect_train = train
-                if best_indirect_train != train:
-                    if arrives == train['transfer']['stops'][ending_station_name]['time']:
-                        if leaves < train['start']['stops'][starting_station_name]['time']:
-                            best_indirect_train = train
-                            leaves = train['transfer']['stops'][ending_station_name]['time']
-
-                    if arrives > train['transfer']['stops'][ending_station_name]['time']:
-                        best_indirect_train = train
-                        arrives = train['transfer']['stops'][ending_station_name]['time']
-
-        if best_direct_train and not best_indirect_train:
-            return {'direct': best_direct_train}
-        if best_indirect_train and not best_direct_train:
-            return {'indirect': best_indirect_train}
-
-        # this would be very strange indeed
-        if not best_direct_train and not best_direct_train:
-            return {}
-
-        # TBD: should we worry about 'ties' at the destination and look for latest
-        # leaving starting station?
-        if best_indirect_train['transfer']['stops'][ending_station_name]['time'] < \
-                best_direct_train['stops'][ending_station_name]['time']:
-            return {'indirect': best_indirect_train}
-
-        return {'direct': best_direct_train}
+        best = TrainSchedule.best_routes(starting_station_name, ending_station_name, routes, 1)
+        return best[0] if best else {}
 
-    def schedule(self, starting_station_abbreviated: str,
-                 ending_station_abbreviated:
-                 str, departure_time: datetime,
-                 test_argument: str = None) -> dict:
-        """given two stations, find all trains scheduled
-        for the specified departure time"""
-        assert self.njt
-        assert self.validate_station_name(starting_station_abbreviated)
-        assert self.validate_station_name(ending_station_abbreviated)
+    @staticmethod
+    def best_routes(starting_station_name: str, ending_station_name: str, routes: dict,
+                    count: int) -> list:
+        """
+        the next count routes, direct & indirect merged on a heap by when
+        they arrive at the destination. A tie goes to the one leaving the
+        start later, then to a direct train (no change), then to the
+        order the scheduler found them. Each train from the start is
+        offered once, with the best route it's part of.
 
-        # lookup schedule with abbreviated name
-        starting_station_trains = self.njt.train_schedule(
-            starting_station_abbreviated,
-            test_argument)
+        :param routes: dictionary of {'direct':[], 'indirect':[]}, can be empty
+        :param count: how many routes
+        :return: [{'direct': train} or {'indirect': route}, ...] best first
+        """
+        candidates = []
+        for position, train in enumerate(routes.get('direct') or ()):
+            leaves = train['stops'][starting_station_name]['time']
+            candidates.append((train['stops'][ending_station_name]['time'],
+                               -leaves.timestamp(), 0, position, train, {'direct': train}))
+        for position, route in enumerate(routes.get('indirect') or ()):
+            leaves = route['start']['stops'][starting_station_name]['time']
+            candidates.append((route['transfer']['stops'][ending_station_name]['time'],
+                               -leaves.timestamp(), 1, position, route['start'],
+                               {'indirect': route}))
+        heapq.heapify(candidates)
+
+        best = []
+        offered = set()  # starting trains, (train id, time it leaves the start)
+        while candidates and len(best) < count:
+            _, leaves, _, _, start_train, route = heapq.heappop(candidates)
+            key = (start_train.get('tid'), leaves)
+            if key not in offered:
+                offered.add(key)
+                best.append(route)
+        return best
 
+    @staticmethod
+    def select_candidates(starting_station_trains: list,
+                          starting_station_name: str,
+                          ending_station_name: str,
+                          departure_time: datetime) -> tuple:
+        """split the trains leaving the starting station into direct
+        routes & trains that might be part of an indirect route
+        :return: (direct trains, possible indirect trains)
+        """
         # easy stuff first, direct routes where
         # the train goes directly to the ending station
         # ignore trains that are leaving after our proposed
         # departure time
         direct_trains = []
         possible_indirect_trains = []
-        starting_station_name = self.train_stations(starting_station_abbreviated)
-        ending_station_name = self.train_stations(ending_station_abbreviated)
         try:
             for train in starting_station_trains:
                 if starting_station_name not in train['stops']:  # weird case to catch
@@ -260,6 +406,48 @@ class TrainSchedule:
         except (KeyError, TypeError) as e:
             raise
 
+        return direct_trains, possible_indirect_trains
+
+    @tracing.traced('TrainSchedule.schedule')
+    def schedule(self, starting_station_abbreviated: str,
+                 ending_station_abbreviated:
+                 str, departure_time: datetime,
+                 test_argument: str = None,
+                 record_traffic: bool = True) -> dict:
+        """given two stations, find all trains scheduled
+        for the specified departure time
+        :param record_traffic: count the request towards the station's
+        popularity, batches (not users) don't
+        """
+        assert self.njt
+        assert self.validate_station_name(starting_station_abbreviated)
+        assert self.validate_station_name(ending_station_abbreviated)
+        # 'stale' is about this query's boards, not every one we've served
+        earlier_stale, self.stale_stations = self.stale_stations, set()
+        tracing.annotate(start=starting_station_abbreviated,
+                         destination=ending_station_abbreviated)
+
+        # remember what's asked for, the busy stations get pre-warmed
+        if self.caching and record_traffic:
+            cloudredis.record_station_request(starting_station_abbreviated)
+            cloudredis.record_station_request(ending_station_abbreviated)
+
+        # lookup schedule with abbreviated name
+        starting_station_trains = self.train_schedule(
+            starting_station_abbreviated,
+            test_argument)
+
+        starting_station_name = self.train_stations(starting_station_abbreviated)
+        ending_station_name = self.train_stations(ending_station_abbreviated)
+        if self.vectorized:
+            direct_trains, possible_indirect_trains = board_arrays.select_candidates(
+                self.arrays_for(starting_station_trains),
+                starting_station_name, ending_station_name, departure_time)
+        else:
+            direct_trains, possible_indirect_trains = TrainSchedule.select_candidates(
+                starting_station_trains,
+                starting_station_name, ending_station_name, departure_time)
+
         # okay we have our direct routes, now we need to
         # look for indirect routes. We created a list
         # of possibles, which will undoubtedly include
@@ -271,12 +459,164 @@ class TrainSchedule:
                                                         departure_time,
                                                         test_argument)
 
-        return {'direct': direct_trains, 'indirect': transfer_routes}
+        stale = bool(self.stale_stations)
+        self.stale_stations |= earlier_stale
+        return {'direct': direct_trains, 'indirect': transfer_routes, 'stale': stale}
+
+    def transfer_stations(self, starting_station: str, ending_station: str,
+                          departure_time: datetime) -> dict:
+        """the transfer table's stations between the start & destination,
+        None if we have to look at every stop: the timetable doesn't know
+        a station, or doesn't cover the day (a train it doesn't have can
+        stop where none of its trains do)"""
+        if starting_station not in self.transfers or ending_station not in self.transfers:
+            return None
+        schedule = timetable.initialize_timetable()
+        if not schedule.has_service(departure_time.astimezone(schedule.timezone).date()):
+            return None
+        return self.transfers.transfer_stations(starting_station, ending_station)
+
+    def transfer_time(self, station_name: str) -> timedelta:
+        """the minimum time to change trains at the station"""
+        seconds = transfers.DEFAULT_TRANSFER_SECONDS
+        if station_name in self.transfers:
+            seconds = self.transfers.minimum_transfer[station_name]
+        return timedelta(seconds=seconds)
+
+    def arrive_by(self, starting_station_abbreviated: str,
+                  ending_station_abbreviated: str,
+                  arrival_time: datetime, departure_time: datetime,
+                  test_argument: str = None) -> dict:
+        """the route that leaves the start latest & still gets to the
+        destination by the arrival time, found in one backwards pass
+        over the start's & destination's trains (see reverse_scan)
+        :param departure_time: the earliest we can leave, usually now
+        :return: {'direct': train} or {'indirect': route} like best_route,
+        {} if nothing gets there in time, None if we can't see that far
+        ahead (see arrive_by_board)
+        """
+        assert self.njt
+        assert self.validate_station_name(starting_station_abbreviated)
+        assert self.validate_station_name(ending_station_abbreviated)
+
+        if self.caching:
+            cloudredis.record_station_request(starting_station_abbreviated)
+            cloudredis.record_station_request(ending_station_abbreviated)
+
+        trains = []
+        for station in (starting_station_abbreviated, ending_station_abbreviated):
+            board = self.arrive_by_board(station, arrival_time, departure_time, test_argument)
+            if board is None:
+                return None
+            trains += board
+        return reverse_scan.latest_route(trains,
+                                         self.train_stations(starting_station_abbreviated),
+                                         self.train_stations(ending_station_abbreviated),
+                                         arrival_time, departure_time, self.transfer_time,
+                                         self.station_grid.footpaths())
+
+    def arrive_by_board(self, station_abbreviation: str, arrival_time: datetime,
+                        departure_time: datetime, test_argument: str = None) -> list:
+        """the station's trains leaving up to the arrival time. A real-time
+        board only covers the next hour or two, after its last train
+        the timetable's trains fill in (like RoutePrecomputer.board)
+        :return: list of trains, None if the board ends before the arrival
+        time & the timetable doesn't cover the day
+        """
+        trains = self.train_schedule(station_abbreviation, test_argument)
+        covered_until = max((train['departure'] for train in trains), default=None)
+        if covered_until is not None and covered_until >= arrival_time:
+            return trains  # anything leaving later arrives too late
+
+        scheduled = self.timetable_provider.scheduled_trains(
+            station_abbreviation, departure_time,
+            horizon=max(arrival_time - departure_time, timedelta(0)))
+        if scheduled is None:
+            return None
+        live_ids = {train['tid'] for train in trains}
+        return trains + [train for train in scheduled
+                         if (covered_until is None or train['departure'] > covered_until) and
+                         train['tid'] not in live_ids]
+
+    def schedule_batch(self, queries: list, processes: int = 0,
+                       test_argument: str = None) -> list:
+        """schedule many (start, destination, departure time) queries. Each
+        distinct station's train schedule is fetched once & shared by all
+        the queries that need it.
+
+        :param queries: [(starting abbreviation, ending abbreviation, departure time), ...]
+        :param processes: compute the routes in a pool of this many processes,
+        0 does them here (a Lambda can't run a pool, it has no /dev/shm)
+        :param test_argument: Unit Tests Only! passed to NJTransit
+        :return: the routes for each query, in the order of the queries
+        """
+        stations = []
+        for start, end, _ in queries:
+            for station in (start, end):
+                if station not in stations:
+                    stations.append(station)
+
+        self.boards = {}
+        try:
+            for station in stations:
+                self.boards[station] = self.train_schedule(station, test_argument)
+            self.stale_boards = self.stale_stations & set(stations)
+            if processes > 0 and len(queries) > 1:
+                return self._schedule_pool(queries, processes)
+            return [self.schedule(start, end, departure_time, test_argument,
+                                  record_traffic=False)
+                    for start, end, departure_time in queries]
+        finally:
+            self.boards = None
+            self.stale_boards = set()
+
+    def _schedule_pool(self, queries: list, processes: int) -> list:
+        """schedule_batch's queries in a pool of processes, if we've loaded
+        the GTFS timetable the pool attaches to a shared copy of it. The
+        processes are forked (attach needs that), each drops the redis
+        connection & NJTransit session it inherited"""
+        image = None
+        if timetable.TIMETABLE is not None:
+            image = shared_timetable.TimetableImage(timetable.TIMETABLE)
+        try:
+            context = multiprocessing.get_context('fork')
+            with context.Pool(processes, initializer=_initialize_batch_worker,
+                              initargs=(self.njt.train_stations, self.boards,
+                                        self.stale_boards, self.vectorized,
+                                        image.name if image else None)) as pool:
+                return pool.map(_schedule_batch_query, queries)
+        finally:
+            if image is not None:
+                image.unlink()
+
+
+BATCH_SCHEDULE = None  # the TrainSchedule in a batch worker process
+
+
+def _initialize_batch_worker(train_stations: dict, boards: dict, stale_boards: set,
+                             vectorized: bool, timetable_name: str = None) -> None:
+    """a pool process gets the boards fetched by the parent, it never calls NJTransit"""
+    global BATCH_SCHEDULE  # pylint: disable=W0603
+    cloudredis.REDIS_SERVER = None  # never share a connection across a fork
+    api.SESSION = requests.Session()
+    if timetable_name is not None:
+        shared_timetable.attach_timetable(timetable_name)
+    api.NJTransitAPI.share_train_stations(train_stations)
+    BATCH_SCHEDULE = TrainSchedule(offline=False, vectorized=vectorized)
+    BATCH_SCHEDULE.boards = boards
+    BATCH_SCHEDULE.stale_boards = stale_boards
+
+
+def _schedule_batch_query(query: tuple) -> dict:
+    """one query's routes, 'stale' if the boards it used were"""
+    start, end, departure_time = query
+    return BATCH_SCHEDULE.schedule(start, end, departure_time, record_traffic=False)
 
 
 class ScheduleUser:
     """Perform user-specific actions """
     @staticmethod
+    @tracing.traced('ScheduleUser.get_home_station')
     def get_home_station(user_id: str) -> str:
         """get the home station, if set"""
         home_key = cloudredis.home_key(user_id)
@@ -286,12 +626,16 @@ class ScheduleUser:
         return cloudredis.REDIS_SERVER.get(home_key).decode('utf-8')
 
     @staticmethod
-    def set_home_station(station: str, user_id: str) -> bool:
-        """set a home station. Make sure it's a valid station"""
+    @tracing.traced('ScheduleUser.set_home_station')
+    def set_home_station(station: str, user_id: str) -> str:
+        """set a home station. Make sure it's a valid station
+        :return: the station name it resolved to, None if it isn't a station"""
         ts = TrainSchedule()
-        if not ts.validate_station_name(station):
-            return False
+        station_name = ts.resolve_station_name(station)
+        if station_name is None:
+            return None
 
-        cloudredis.REDIS_SERVER.set(cloudredis.home_key(user_id), station)
-        return True
+        cloudredis.REDIS_SERVER.set(cloudredis.home_key(user_id), station_name)
+        cloudredis.record_home_station(station_name)  # the popular ones are precomputed
+        return station_name
 
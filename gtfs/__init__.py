@@ -0,0 +1 @@
+"""static GTFS timetable data published by NJTransit"""
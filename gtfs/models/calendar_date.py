@@ -0,0 +1,17 @@
+"""a service exception from calendar_dates.txt"""
+from datetime import datetime
+from gtfs.models.gtfsobject import GtfsObject
+
+SERVICE_ADDED = 1
+SERVICE_REMOVED = 2
+
+
+class CalendarDate(GtfsObject):
+    """calendar_dates.txt, one row per service per date"""
+    _FILE_NAME = 'calendar_dates.txt'
+    _FIELD_NAMES = ['service_id', 'date', 'exception_type']
+    __slots__ = _FIELD_NAMES
+
+    def convert(self) -> None:
+        self.date = datetime.strptime(self.date, '%Y%m%d').date()
+        self.exception_type = int(self.exception_type)
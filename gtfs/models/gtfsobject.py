@@ -1,11 +1,46 @@
 #!/usr/bin/python3.6
+"""base object for reading GTFS files"""
+import csv
+import os
 
 
 class GtfsObject(object):
     """our base object for all GTFS file reading
 
     Derived classes will override the following:
+        _FILE_NAME   - name of the GTFS file, e.g. 'stops.txt'
+        _FIELD_NAMES - columns we keep from that file
+    and may override convert() to turn the text columns
+    into something more useful (ints, seconds, etc.)
     """
 
+    # name of the GTFS file in the data directory
+    _FILE_NAME = None
+
     # list of field names for the GTFS object
-    _FIELD_NAMES = []
\ No newline at end of file
+    _FIELD_NAMES = []
+
+    __slots__ = ()
+
+    def __init__(self, row: dict):
+        for field in self._FIELD_NAMES:
+            setattr(self, field, row.get(field))
+        self.convert()
+
+    def convert(self) -> None:
+        """convert the text columns, default is to leave them alone"""
+
+    @classmethod
+    def read(cls, data_dir: str) -> list:
+        """read every row of our GTFS file into a list of objects"""
+        path_n_name = os.path.join(data_dir, cls._FILE_NAME)
+        with open(path_n_name, mode='r', encoding='utf-8-sig', newline='') as file_pointer:
+            return [cls(row) for row in csv.DictReader(file_pointer)]
+
+
+def gtfs_seconds(gtfs_time: str) -> int:
+    """convert a GTFS 'HH:MM:SS' time to seconds past the start
+    of the service day. Note hours can exceed 24 for trains that
+    run past midnight"""
+    hours, minutes, seconds = gtfs_time.split(':')
+    return int(hours) * 3600 + int(minutes) * 60 + int(seconds)
@@ -0,0 +1,15 @@
+"""a train line from routes.txt"""
+from gtfs.models.gtfsobject import GtfsObject
+
+ROUTE_TYPE_LIGHT_RAIL = 0
+ROUTE_TYPE_RAIL = 2
+
+
+class Route(GtfsObject):
+    """routes.txt, one row per line"""
+    _FILE_NAME = 'routes.txt'
+    _FIELD_NAMES = ['route_id', 'route_long_name', 'route_type']
+    __slots__ = _FIELD_NAMES
+
+    def convert(self) -> None:
+        self.route_type = int(self.route_type)
@@ -0,0 +1,13 @@
+"""a station from stops.txt"""
+from gtfs.models.gtfsobject import GtfsObject
+
+
+class Stop(GtfsObject):
+    """stops.txt, one row per station"""
+    _FILE_NAME = 'stops.txt'
+    _FIELD_NAMES = ['stop_id', 'stop_code', 'stop_name', 'stop_lat', 'stop_lon']
+    __slots__ = _FIELD_NAMES
+
+    def convert(self) -> None:
+        self.stop_lat = float(self.stop_lat)
+        self.stop_lon = float(self.stop_lon)
@@ -0,0 +1,14 @@
+"""a train's stop at a station from stop_times.txt"""
+from gtfs.models.gtfsobject import GtfsObject, gtfs_seconds
+
+
+class StopTime(GtfsObject):
+    """stop_times.txt, one row per train per station"""
+    _FILE_NAME = 'stop_times.txt'
+    _FIELD_NAMES = ['trip_id', 'arrival_time', 'departure_time', 'stop_id', 'stop_sequence']
+    __slots__ = _FIELD_NAMES
+
+    def convert(self) -> None:
+        self.arrival_time = gtfs_seconds(self.arrival_time)
+        self.departure_time = gtfs_seconds(self.departure_time)
+        self.stop_sequence = int(self.stop_sequence)
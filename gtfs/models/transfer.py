@@ -0,0 +1,15 @@
+"""a rule for changing trains from transfers.txt"""
+from gtfs.models.gtfsobject import GtfsObject
+
+MINIMUM_TIME = 2  # transfer_type, the transfer needs min_transfer_time seconds
+
+
+class Transfer(GtfsObject):
+    """transfers.txt, optional, one row per pair of stops"""
+    _FILE_NAME = 'transfers.txt'
+    _FIELD_NAMES = ['from_stop_id', 'to_stop_id', 'transfer_type', 'min_transfer_time']
+    __slots__ = _FIELD_NAMES
+
+    def convert(self) -> None:
+        self.transfer_type = int(self.transfer_type or 0)
+        self.min_transfer_time = int(self.min_transfer_time) if self.min_transfer_time else None
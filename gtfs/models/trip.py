@@ -0,0 +1,15 @@
+"""a single scheduled train run from trips.txt"""
+from gtfs.models.gtfsobject import GtfsObject
+
+
+class Trip(GtfsObject):
+    """trips.txt, one row per train run. The block_id
+    is the train number NJTransit reports as the TRAIN_ID"""
+    _FILE_NAME = 'trips.txt'
+    _FIELD_NAMES = ['route_id', 'service_id', 'trip_id', 'trip_headsign', 'block_id']
+    __slots__ = _FIELD_NAMES
+
+    @property
+    def train_id(self) -> str:
+        """the train id as the real-time API reports it (no leading zeros)"""
+        return self.block_id.lstrip('0') or self.block_id
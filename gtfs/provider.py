@@ -0,0 +1,148 @@
+#!/usr/bin/python
+"""serve train schedules from the static GTFS timetable, only
+calling the NJTransit real-time API for trains about to leave"""
+import math
+from datetime import datetime, timedelta
+import pytz
+from gtfs import timetable
+
+
+class OfflineScheduleProvider:
+    """a drop-in for NJTransitAPI as used by the TrainSchedule
+    controller. Trains departing within the real-time window come
+    from the real-time API (they have the current status), every
+    train after that comes from the timetable with no network I/O"""
+
+    def __init__(self, realtime_api, realtime_window: timedelta = timedelta(minutes=30),
+                 horizon: timedelta = timedelta(hours=12),
+                 schedule: timetable.Timetable = None,
+                 clock=None):
+        """
+        :param realtime_api: NJTransitAPI object for the real-time fallback
+        :param realtime_window: trains leaving sooner than this use real-time data
+        :param horizon: how far ahead of now to report scheduled trains
+        :param schedule: the timetable, defaults to the shared one
+        :param clock: returns the current time, for testing
+        """
+        self._realtime = realtime_api
+        self.realtime_window = realtime_window
+        self.horizon = horizon
+        self._timetable = schedule if schedule else timetable.initialize_timetable()
+        self._clock = clock if clock else OfflineScheduleProvider.utc_now
+
+    @staticmethod
+    def utc_now() -> datetime:
+        """the current time, timezone aware"""
+        return pytz.timezone('UTC').localize(datetime.utcnow())
+
+    @property
+    def realtime(self):
+        """the real-time API we fall back to"""
+        return self._realtime
+
+    @property
+    def train_stations(self) -> dict:
+        """the station list is always the NJTransit one"""
+        return self._realtime.train_stations
+
+    @train_stations.setter
+    def train_stations(self, value: dict) -> None:
+        self._realtime.train_stations = value
+
+    def _resolve_stations(self) -> None:
+        """map the GTFS stops to NJTransit names, once"""
+        if not self._timetable.station_names:
+            self._timetable.resolve_stations(self.train_stations)
+
+    def scheduled_trains(self, station_abbreviation: str, now: datetime,
+                         horizon: timedelta = None) -> list:
+        """trains leaving the station between now and the horizon, in the
+        same format as NJTransitAPI.train_schedule. None if the timetable
+        can't answer (date not covered or station unknown)
+        :param horizon: how far ahead, defaults to the provider's
+        """
+        self._resolve_stations()
+        station_name = self.train_stations.get(station_abbreviation)
+        stop_ids = self._timetable.station_stops.get(station_name)
+        if not stop_ids:
+            return None
+
+        local_now = now.astimezone(self._timetable.timezone)
+        end = now + (self.horizon if horizon is None else horizon)
+        # trains running past midnight belong to the previous service day
+        service_date = local_now.date() - timedelta(days=1)
+        covered = False
+        train_list = []
+        while service_date <= end.astimezone(self._timetable.timezone).date():
+            if self._timetable.has_service(service_date):
+                covered = covered or service_date >= local_now.date()
+                day_start = self._timetable.service_day_start(service_date)
+                start_seconds = max(0, math.ceil((now - day_start).total_seconds()))
+                end_seconds = int((end - day_start).total_seconds())
+                for stop_id in stop_ids:
+                    for departure, trip_id in self._timetable.departures(stop_id, service_date,
+                                                                         start_seconds,
+                                                                         end_seconds):
+                        departure_time = day_start + timedelta(seconds=departure)
+                        train_list.append(self._train(trip_id, day_start,
+                                                      departure_time, now))
+            service_date += timedelta(days=1)
+
+        if not covered:
+            return None
+
+        train_list.sort(key=lambda train: train['departure'])
+        for index, train in enumerate(train_list):
+            train['index'] = index
+        return train_list
+
+    def _train(self, trip_id: str, day_start: datetime,
+               departure_time: datetime, now: datetime) -> dict:
+        """build a train the way NJTransitAPI.parse_train_schedule does"""
+        trip = self._timetable.trips[trip_id]
+        tz_normalize = self._timetable.timezone.normalize
+        stop_list = {}
+        for stop_id, _, departure in self._timetable.trip_stops[trip_id]:
+            station_name = self._timetable.station_names.get(stop_id)
+            if station_name is None:
+                continue
+            stop_time = tz_normalize(day_start + timedelta(seconds=departure))
+            stop_list.update({station_name: {'time': stop_time,
+                                             'status': 'Scheduled',
+                                             'departed': stop_time < now}})
+
+        return {'tid': trip.train_id,
+                'destination': trip.trip_headsign,
+                'departure': tz_normalize(departure_time),
+                'index': None,
+                'stops': stop_list}
+
+    def train_schedule(self, station_abbreviation: str,
+                       test_argument: str = None) -> list:
+        """returns all the trains departing this station, see
+        NJTransitAPI.train_schedule. Trains leaving within the
+        real-time window are replaced with the real-time board
+
+        :param station_abbreviation: 2 character abbreviation for station
+        :param test_argument: Unit Tests Only! passed to the real-time API
+        :return: list of trains
+        """
+        now = self._clock()
+        scheduled = self.scheduled_trains(station_abbreviation, now)
+        if scheduled is None:
+            return self._realtime.train_schedule(station_abbreviation, test_argument)
+
+        cutoff = now + self.realtime_window
+        if all(train['departure'] > cutoff for train in scheduled):
+            return scheduled  # nothing imminent, no need to ask NJTransit
+
+        live_trains = self._realtime.train_schedule(station_abbreviation, test_argument)
+        if not live_trains:
+            return scheduled  # real-time is unavailable, the timetable will do
+        live_ids = {train['tid'] for train in live_trains}
+        train_list = live_trains + [train for train in scheduled
+                                    if train['departure'] > cutoff and
+                                    train['tid'] not in live_ids]
+        for index, train in enumerate(train_list):
+            train['index'] = index
+        return train_list
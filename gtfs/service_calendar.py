@@ -0,0 +1,88 @@
+#!/usr/bin/python
+"""which services (and so which trips) run on a given day"""
+from datetime import date
+from gtfs.models.calendar_date import SERVICE_ADDED, SERVICE_REMOVED
+
+
+class ServiceCalendar:
+    """an index of calendar_dates.txt built once at load time.
+
+    Each service id gets a bit, each date maps to the bitset of
+    services running that day. Each trip gets a bit too, so each date
+    also maps to a bitmap of the trips that run - filtering trips for
+    a date is then a single lookup & a bit test instead of a scan."""
+
+    def __init__(self, calendar_dates: list, trip_services: list):
+        """
+        :param calendar_dates: CalendarDate objects from calendar_dates.txt
+        :param trip_services: service id of each trip, by trip index
+        """
+        self.service_bits = {}  # service_id -> bit number
+        for service_id in sorted({calendar_date.service_id for calendar_date in calendar_dates}
+                                 | set(trip_services)):
+            self.service_bits[service_id] = len(self.service_bits)
+
+        # there's no calendar.txt, so every date starts with no
+        # service and the exceptions add (or remove) services
+        added = {}
+        removed = {}
+        for calendar_date in calendar_dates:
+            bit = 1 << self.service_bits[calendar_date.service_id]
+            if calendar_date.exception_type == SERVICE_ADDED:
+                added[calendar_date.date] = added.get(calendar_date.date, 0) | bit
+            elif calendar_date.exception_type == SERVICE_REMOVED:
+                removed[calendar_date.date] = removed.get(calendar_date.date, 0) | bit
+        self._date_services = {service_date: services & ~removed.get(service_date, 0)
+                               for service_date, services in added.items()}
+
+        # trips bitmap for each service, then OR them together for each date
+        service_trips = [0] * len(self.service_bits)
+        for trip_index, service_id in enumerate(trip_services):
+            service_trips[self.service_bits[service_id]] |= 1 << trip_index
+        self._date_trips = {}
+        for service_date, services in self._date_services.items():
+            trips = 0
+            for bit, trip_mask in enumerate(service_trips):
+                if services >> bit & 1:
+                    trips |= trip_mask
+            self._date_trips[service_date] = trips
+
+    @classmethod
+    def from_bitmaps(cls, service_bits: dict, date_services: dict,
+                     date_trips: dict) -> 'ServiceCalendar':
+        """a calendar that's already been built, e.g. by another process
+        :param service_bits: service_id -> bit number
+        :param date_services: date -> bitset of services
+        :param date_trips: date -> bitmap of trips
+        """
+        calendar = cls.__new__(cls)
+        calendar.service_bits = service_bits
+        calendar._date_services = date_services  # pylint: disable=W0212
+        calendar._date_trips = date_trips  # pylint: disable=W0212
+        return calendar
+
+    def bitmaps(self) -> tuple:
+        """(date -> services, date -> trips), what from_bitmaps takes"""
+        return self._date_services, self._date_trips
+
+    def services(self, service_date: date) -> int:
+        """bitset of the services running on the date"""
+        return self._date_services.get(service_date, 0)
+
+    def service_ids(self, service_date: date) -> set:
+        """the service ids running on the date"""
+        services = self.services(service_date)
+        return {service_id for service_id, bit in self.service_bits.items()
+                if services >> bit & 1}
+
+    def trips(self, service_date: date) -> int:
+        """bitmap of the trips (by trip index) running on the date"""
+        return self._date_trips.get(service_date, 0)
+
+    def runs(self, trip_index: int, service_date: date) -> bool:
+        """True if the trip runs on the date"""
+        return bool(self._date_trips.get(service_date, 0) >> trip_index & 1)
+
+    def has_service(self, service_date: date) -> bool:
+        """True if anything runs on the date"""
+        return self._date_services.get(service_date, 0) != 0
@@ -0,0 +1,259 @@
+#!/usr/bin/python
+"""the timetable compiled to flat arrays & shared between processes
+
+The parent reads the GTFS files once and publishes the compiled image
+in shared memory (a file we mmap before python 3.8). Workers attach to
+it read-only: the departures & stop lists are views of the shared
+arrays, only the trips, stops & calendar (a few hundred KB) are
+python objects in each worker. Nothing is parsed from the GTFS files
+by a worker, & adding workers doesn't add copies of the stop times.
+
+Image layout:
+    header  - magic, version, metadata length
+    metadata - utf-8 json: trips, stops, calendar & where each stop's
+              departures & each trip's stops are in the arrays
+    arrays  - int32: departure times, trip indexes & stop sequences by
+              stop, then stop numbers, arrivals & departures by trip
+"""
+import json
+import mmap
+import os
+import struct
+import tempfile
+import uuid
+from array import array
+from collections.abc import Mapping
+from datetime import date
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # pragma: no cover, python < 3.8
+    shared_memory = None
+from gtfs import timetable
+from gtfs.models.stop import Stop
+from gtfs.models.trip import Trip
+from gtfs.service_calendar import ServiceCalendar
+from gtfs.stop_index import StopDepartures, StopIndex
+
+MAGIC = b'JTTT'
+VERSION = 1
+TYPECODE = 'i'  # every array is int32
+_HEADER = struct.Struct('!4sHI')  # magic, version, metadata length
+_ALIGNMENT = 8
+_DATE_FORMAT = '%Y%m%d'
+
+
+class ImageError(ValueError):
+    """the buffer isn't a compiled timetable, or is a newer version"""
+
+
+if shared_memory is not None:
+    class _Segment(shared_memory.SharedMemory):
+        """an attached segment that can go before the views of it do"""
+
+        def __del__(self):
+            try:
+                self.close()
+            except BufferError:
+                pass  # views are still alive, the mapping goes with the last of them
+
+
+def compile_timetable(schedule: timetable.Timetable) -> bytes:
+    """the timetable as a single buffer SharedTimetable can use in place"""
+    stop_ids = list(schedule.stops)
+    stop_numbers = {stop_id: number for number, stop_id in enumerate(stop_ids)}
+
+    times, trips, sequences = array(TYPECODE), array(TYPECODE), array(TYPECODE)
+    departures = []  # [[stop_id, first, count], ...]
+    for stop_id in schedule.stop_index.stop_ids:
+        stop_departures = schedule.stop_index.stop_departures(stop_id)
+        departures.append([stop_id, len(times), len(stop_departures)])
+        times.fromlist(stop_departures.times.tolist())
+        trips.fromlist(stop_departures.trips.tolist())
+        sequences.fromlist(stop_departures.sequences.tolist())
+
+    numbers, arrivals, leaving = array(TYPECODE), array(TYPECODE), array(TYPECODE)
+    trip_stops = []  # [[first, count], ...] by trip index
+    for trip_id in schedule.trip_ids:
+        stops = schedule.trip_stops.get(trip_id, ())
+        trip_stops.append([len(numbers), len(stops)])
+        for stop_id, arrival, departure in stops:
+            numbers.append(stop_numbers[stop_id])
+            arrivals.append(arrival)
+            leaving.append(departure)
+
+    date_services, date_trips = schedule.calendar.bitmaps()
+    metadata = {
+        'trips': [[getattr(schedule.trips[trip_id], field) for field in Trip.__slots__]
+                  for trip_id in schedule.trip_ids],
+        'stops': [[getattr(schedule.stops[stop_id], field) for field in Stop.__slots__]
+                  for stop_id in stop_ids],
+        'station_names': schedule.station_names,
+        'calendar': {
+            'service_bits': schedule.calendar.service_bits,
+            'services': {service_date.strftime(_DATE_FORMAT): services
+                         for service_date, services in date_services.items()},
+            'trips': {service_date.strftime(_DATE_FORMAT): '{0:x}'.format(running)
+                      for service_date, running in date_trips.items()},
+        },
+        'departures': departures,
+        'trip_stops': trip_stops,
+        'lengths': [len(times), len(numbers)],
+    }
+    encoded = json.dumps(metadata, separators=(',', ':')).encode('utf-8')
+    padding = -(_HEADER.size + len(encoded)) % _ALIGNMENT
+    return b''.join([_HEADER.pack(MAGIC, VERSION, len(encoded)), encoded, b'\0' * padding,
+                     times.tobytes(), trips.tobytes(), sequences.tobytes(),
+                     numbers.tobytes(), arrivals.tobytes(), leaving.tobytes()])
+
+
+class TripStops(Mapping):
+    """trip_id -> [(stop_id, arrival, departure), ...] like Timetable.trip_stops,
+    but each list is made from the shared arrays when it's asked for"""
+
+    def __init__(self, stop_ids: list, offsets: dict, numbers, arrivals, departures):
+        """
+        :param stop_ids: stop_id of each stop number
+        :param offsets: trip_id -> (first, count) in the arrays
+        """
+        self._stop_ids = stop_ids
+        self._offsets = offsets
+        self._numbers = numbers
+        self._arrivals = arrivals
+        self._departures = departures
+
+    def __getitem__(self, trip_id: str) -> list:
+        first, count = self._offsets[trip_id]
+        last = first + count
+        return [(self._stop_ids[number], arrival, departure)
+                for number, arrival, departure in zip(self._numbers[first:last],
+                                                      self._arrivals[first:last],
+                                                      self._departures[first:last])]
+
+    def __iter__(self):
+        return iter(self._offsets)
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+
+class SharedTimetable(timetable.Timetable):
+    """a Timetable over a compiled image, the departure & stop arrays
+    are views of the buffer (so read-only if the buffer is)"""
+
+    def __init__(self, buffer: memoryview, segment=None):  # pylint: disable=W0231
+        """
+        :param buffer: the compiled image, bytes format
+        :param segment: what the buffer is mapped from, kept open as long as we are
+        """
+        magic, version, length = _HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC:
+            raise ImageError('not a compiled timetable')
+        if version > VERSION:
+            raise ImageError('unsupported version {0}'.format(version))
+        metadata = json.loads(bytes(buffer[_HEADER.size:_HEADER.size + length]).decode('utf-8'))
+        start = _HEADER.size + length
+        start += -start % _ALIGNMENT
+        departure_count, stop_count = metadata['lengths']
+        itemsize = array(TYPECODE).itemsize
+        arrays = buffer[start:start + itemsize * 3 * (departure_count + stop_count)].\
+            cast(TYPECODE)
+        times, trips, sequences = (arrays[index * departure_count:(index + 1) * departure_count]
+                                   for index in range(3))
+        stops_start = 3 * departure_count
+        numbers, arrivals, departures = (arrays[stops_start + index * stop_count:
+                                                stops_start + (index + 1) * stop_count]
+                                         for index in range(3))
+
+        trip_list = [Trip(dict(zip(Trip.__slots__, values))) for values in metadata['trips']]
+        self.trips = {trip.trip_id: trip for trip in trip_list}
+        stop_list = [Stop(dict(zip(Stop.__slots__, values))) for values in metadata['stops']]
+        self.stops = {stop.stop_id: stop for stop in stop_list}
+        self.trip_ids = [trip.trip_id for trip in trip_list]
+        self.trip_index = {trip_id: index for index, trip_id in enumerate(self.trip_ids)}
+
+        calendar = metadata['calendar']
+        self.calendar = ServiceCalendar.from_bitmaps(
+            calendar['service_bits'],
+            {SharedTimetable._date(service_date): services
+             for service_date, services in calendar['services'].items()},
+            {SharedTimetable._date(service_date): int(running, 16)
+             for service_date, running in calendar['trips'].items()})
+
+        self.trip_stops = TripStops([stop.stop_id for stop in stop_list],
+                                    {trip_id: tuple(offset)
+                                     for trip_id, offset in zip(self.trip_ids,
+                                                                metadata['trip_stops'])
+                                     if offset[1]},
+                                    numbers, arrivals, departures)
+        self.stop_index = StopIndex.from_departures(
+            {stop_id: StopDepartures.from_arrays(times[first:first + count],
+                                                 trips[first:first + count],
+                                                 sequences[first:first + count])
+             for stop_id, first, count in metadata['departures']})
+
+        self.station_names = metadata['station_names']
+        self.station_stops = {}
+        for stop_id, name in self.station_names.items():
+            self.station_stops.setdefault(name, []).append(stop_id)
+        self._segment = segment
+
+    @staticmethod
+    def _date(value: str) -> date:
+        return date(int(value[:4]), int(value[4:6]), int(value[6:]))  # strptime is slow
+
+
+class TimetableImage:
+    """a compiled timetable published by the parent process, workers
+    attach() with its name. The parent unlinks it when they're done"""
+
+    def __init__(self, schedule: timetable.Timetable, name: str = None):
+        image = compile_timetable(schedule)
+        self.size = len(image)
+        if shared_memory is not None:
+            self._segment = shared_memory.SharedMemory(name=name, create=True, size=self.size)
+            self._segment.buf[:self.size] = image
+            self.name = self._segment.name
+        else:
+            self._segment = None
+            self.name = name or os.path.join(tempfile.gettempdir(),
+                                             'jerseytrains-{0}.timetable'.format(uuid.uuid4().hex))
+            with open(self.name, mode='wb') as file_pointer:
+                file_pointer.write(image)
+
+    def unlink(self) -> None:
+        """remove the image, workers already attached keep their mapping"""
+        if self._segment is not None:
+            self._segment.close()
+            self._segment.unlink()
+            self._segment = None
+        elif os.path.exists(self.name):
+            os.remove(self.name)
+
+    def __enter__(self) -> 'TimetableImage':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.unlink()
+
+
+def attach(name: str) -> SharedTimetable:
+    """map a published image read-only. Workers should be forked so they
+    share the parent's resource tracker (before python 3.13 an attached
+    segment is tracked, & a spawned worker's tracker would unlink it)"""
+    if shared_memory is not None:
+        try:
+            segment = _Segment(name=name, track=False)
+        except TypeError:  # python < 3.13, always tracked
+            segment = _Segment(name=name)
+        return SharedTimetable(segment.buf.toreadonly(), segment)
+
+    with open(name, mode='rb') as file_pointer:
+        segment = mmap.mmap(file_pointer.fileno(), 0, access=mmap.ACCESS_READ)
+    return SharedTimetable(memoryview(segment), segment)
+
+
+def attach_timetable(name: str) -> SharedTimetable:
+    """attach a worker to the parent's image, it becomes the process'
+    TIMETABLE so initialize_timetable() never reads the GTFS files"""
+    timetable.TIMETABLE = attach(name)
+    return timetable.TIMETABLE
@@ -0,0 +1,166 @@
+#!/usr/bin/python
+"""where the stations are. stops.txt has every station's latitude &
+longitude, they're bucketed into a grid of square cells (about a
+kilometre across) so the nearest station to a point is a look at the
+point's cell & the rings of cells around it, not a pass over every
+stop. Built once per container, like the transfer table.
+
+The same grid gives the walking transfers (footpaths) between stations
+close enough to walk, e.g. Glen Rock Boro Hall & Glen Rock Main Line."""
+import math
+from gtfs import timetable
+
+EARTH_RADIUS_METERS = 6371008.8
+CELL_METERS = 1000
+NEAREST_STATION_METERS = 10 * CELL_METERS  # further than this isn't near a station
+WALKING_METERS = 1000  # further than this isn't a transfer, it's a hike
+WALKING_SPEED = 1.2  # meters per second, with luggage & crossings
+MINIMUM_WALK_SECONDS = 5 * 60  # off one platform & onto another
+
+
+def distance(latitude: float, longitude: float,
+             other_latitude: float, other_longitude: float) -> float:
+    """great circle (haversine) distance in meters"""
+    phi, other_phi = math.radians(latitude), math.radians(other_latitude)
+    half_chord = math.sin((other_phi - phi) / 2) ** 2 + \
+        math.cos(phi) * math.cos(other_phi) * \
+        math.sin(math.radians(other_longitude - longitude) / 2) ** 2
+    return 2 * EARTH_RADIUS_METERS * math.asin(math.sqrt(half_chord))
+
+
+def walking_seconds(meters: float) -> int:
+    """how long the walk between two stations takes"""
+    return max(MINIMUM_WALK_SECONDS, int(math.ceil(meters / WALKING_SPEED)))
+
+
+class StationGrid:
+    """stations bucketed by location. Cells are square in an
+    equirectangular projection about the stations' mean latitude,
+    which over New Jersey is within a few percent of the true distance;
+    the answers are ranked by the true distance."""
+
+    def __init__(self, locations: dict, cell_meters: float = CELL_METERS):
+        """
+        :param locations: station name -> (latitude, longitude)
+        :param cell_meters: width of a cell
+        """
+        self.locations = locations
+        self.cell_meters = cell_meters
+        latitudes = [latitude for latitude, _ in locations.values()] or [0.0]
+        mean_latitude = math.radians(sum(latitudes) / len(latitudes))
+        meters_per_degree = math.radians(1) * EARTH_RADIUS_METERS
+        # a few percent slack, the projection stretches away from the mean latitude
+        self._reach = 0.95 * cell_meters
+        self._y_scale = meters_per_degree / cell_meters
+        self._x_scale = self._y_scale * math.cos(mean_latitude)
+
+        self.cells = {}  # (x, y) -> [station name, ...]
+        for name, (latitude, longitude) in locations.items():
+            self.cells.setdefault(self.cell(latitude, longitude), []).append(name)
+        xs = [x for x, _ in self.cells] or [0]
+        ys = [y for _, y in self.cells] or [0]
+        self._bounds = (min(xs), max(xs), min(ys), max(ys))
+        # past this many cells it's quicker to look at every station
+        self._scan_cells = len(locations)
+        self._footpaths = {}  # max meters -> footpaths
+
+    @classmethod
+    def from_timetable(cls, schedule: timetable.Timetable,
+                       cell_meters: float = CELL_METERS) -> 'StationGrid':
+        """the stations (NJTransit names) of a timetable with resolved stations,
+        a station with several stops (Secaucus) is at their middle"""
+        locations = {}
+        for name, stop_ids in schedule.station_stops.items():
+            stops = [schedule.stops[stop_id] for stop_id in stop_ids]
+            locations[name] = (sum(stop.stop_lat for stop in stops) / len(stops),
+                               sum(stop.stop_lon for stop in stops) / len(stops))
+        return cls(locations, cell_meters)
+
+    def cell(self, latitude: float, longitude: float) -> tuple:
+        return (int(math.floor(longitude * self._x_scale)),
+                int(math.floor(latitude * self._y_scale)))
+
+    def _ring(self, center: tuple, radius: int):
+        """the cells on the edge of the square radius cells from the center"""
+        center_x, center_y = center
+        if radius == 0:
+            yield center
+            return
+        for x in range(center_x - radius, center_x + radius + 1):
+            yield x, center_y - radius
+            yield x, center_y + radius
+        for y in range(center_y - radius + 1, center_y + radius):
+            yield center_x - radius, y
+            yield center_x + radius, y
+
+    def nearest(self, latitude: float, longitude: float, count: int = 1,
+                max_meters: float = None) -> list:
+        """the stations nearest the point
+        :param count: how many
+        :param max_meters: none further than this
+        :return: [(meters, station name), ...] nearest first
+        """
+        center = self.cell(latitude, longitude)
+        min_x, max_x, min_y, max_y = self._bounds
+        # the ring that takes in the last occupied cell
+        last_ring = max(abs(center[0] - min_x), abs(center[0] - max_x),
+                        abs(center[1] - min_y), abs(center[1] - max_y))
+        found = []
+        for radius in range(last_ring + 1):
+            if (2 * radius + 1) ** 2 > self._scan_cells:
+                return self._scan(latitude, longitude, count, max_meters)
+            for cell in self._ring(center, radius):
+                for name in self.cells.get(cell, ()):
+                    meters = distance(latitude, longitude, *self.locations[name])
+                    if max_meters is None or meters <= max_meters:
+                        found.append((meters, name))
+            # anything in the next ring is at least this far away
+            inner = radius * self._reach
+            if max_meters is not None and inner > max_meters:
+                break
+            if len(found) >= count and sorted(found)[count - 1][0] <= inner:
+                break
+        return sorted(found)[:count]
+
+    def _scan(self, latitude: float, longitude: float, count: int,
+              max_meters: float = None) -> list:
+        """nearest by looking at every station, for points far from them"""
+        found = [(distance(latitude, longitude, *location), name)
+                 for name, location in self.locations.items()]
+        if max_meters is not None:
+            found = [(meters, name) for meters, name in found if meters <= max_meters]
+        return sorted(found)[:count]
+
+    def within(self, latitude: float, longitude: float, meters: float) -> list:
+        """every station within the distance, [(meters, station name), ...] nearest first"""
+        return self.nearest(latitude, longitude, len(self.locations), meters)
+
+    def footpaths(self, max_meters: float = WALKING_METERS) -> dict:
+        """the walking transfers between stations
+        :return: station name -> {station name: walking seconds, ...}
+        """
+        if max_meters in self._footpaths:
+            return self._footpaths[max_meters]
+        paths = {}
+        for name, (latitude, longitude) in self.locations.items():
+            for meters, other in self.within(latitude, longitude, max_meters):
+                if other != name:
+                    paths.setdefault(name, {})[other] = walking_seconds(meters)
+        self._footpaths[max_meters] = paths
+        return paths
+
+
+STATION_GRID = None
+
+
+def initialize_station_grid(train_stations: dict) -> StationGrid:
+    """build the station grid once per container
+    :param train_stations: NJTransit station list, name <-> abbreviation
+    """
+    global STATION_GRID  # pylint: disable=W0603
+    if STATION_GRID is None:
+        schedule = timetable.initialize_timetable()
+        if not schedule.station_names:
+            schedule.resolve_stations(train_stations)
+        STATION_GRID = StationGrid.from_timetable(schedule)
+    return STATION_GRID
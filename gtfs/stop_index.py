@@ -0,0 +1,104 @@
+#!/usr/bin/python
+"""the trains leaving each station, sorted by departure time"""
+from array import array
+from bisect import bisect_left, bisect_right
+
+
+class StopDepartures:
+    """every departure from a single stop as parallel arrays,
+    sorted by departure time (seconds into the service day)"""
+    __slots__ = ('times', 'trips', 'sequences')
+
+    def __init__(self, departures: list):
+        """
+        :param departures: [(departure seconds, trip index, stop sequence), ...]
+        """
+        departures.sort()
+        self.times = array('l', (departure[0] for departure in departures))
+        self.trips = array('l', (departure[1] for departure in departures))
+        self.sequences = array('l', (departure[2] for departure in departures))
+
+    @classmethod
+    def from_arrays(cls, times, trips, sequences) -> 'StopDepartures':
+        """departures that are already sorted, e.g. views of a shared timetable"""
+        stop_departures = cls.__new__(cls)
+        stop_departures.times = times
+        stop_departures.trips = trips
+        stop_departures.sequences = sequences
+        return stop_departures
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def between(self, start: int, end: int = None) -> range:
+        """positions of the departures from start up to & including end"""
+        first = bisect_left(self.times, start)
+        last = len(self.times) if end is None else bisect_right(self.times, end, first)
+        return range(first, last)
+
+
+class StopIndex:
+    """inverted index of stop_times.txt, stop_id -> time sorted departures,
+    so "trains from X after T" is a binary search & a short scan instead
+    of a pass over every stop time"""
+
+    def __init__(self, trip_stops: list):
+        """
+        :param trip_stops: each trip's [(stop_id, arrival, departure), ...] by trip index
+        """
+        departures = {}
+        for trip_index, stops in enumerate(trip_stops):
+            for sequence, (stop_id, _, departure) in enumerate(stops):
+                departures.setdefault(stop_id, []).append((departure, trip_index, sequence))
+        self._stops = {stop_id: StopDepartures(stop_departures)
+                       for stop_id, stop_departures in departures.items()}
+
+    @classmethod
+    def from_departures(cls, stops: dict) -> 'StopIndex':
+        """an index of prebuilt StopDepartures
+        :param stops: stop_id -> StopDepartures
+        """
+        stop_index = cls.__new__(cls)
+        stop_index._stops = stops  # pylint: disable=W0212
+        return stop_index
+
+    def stop_departures(self, stop_id: str) -> StopDepartures:
+        """every departure from the stop, None if nothing leaves it"""
+        return self._stops.get(stop_id)
+
+    @property
+    def stop_ids(self) -> list:
+        """every stop with at least one departure"""
+        return list(self._stops)
+
+    def __contains__(self, stop_id: str) -> bool:
+        return stop_id in self._stops
+
+    def departures(self, stop_id: str, start: int = 0, end: int = None,
+                   running: int = -1) -> list:
+        """departures from the stop between start & end (seconds into the
+        service day) as (departure seconds, trip index, stop sequence).
+        The stop sequence is the stop's position in the trip's stop list
+        :param running: bitmap of trips running that day, default all trips
+        """
+        stop_departures = self._stops.get(stop_id)
+        if stop_departures is None:
+            return []
+        times = stop_departures.times
+        trips = stop_departures.trips
+        sequences = stop_departures.sequences
+        return [(times[position], trips[position], sequences[position])
+                for position in stop_departures.between(start, end)
+                if running >> trips[position] & 1]
+
+    def next_departure(self, stop_id: str, start: int, running: int = -1) -> tuple:
+        """the first departure at or after start, None if there isn't one"""
+        stop_departures = self._stops.get(stop_id)
+        if stop_departures is None:
+            return None
+        for position in stop_departures.between(start):
+            trip_index = stop_departures.trips[position]
+            if running >> trip_index & 1:
+                return (stop_departures.times[position], trip_index,
+                        stop_departures.sequences[position])
+        return None
@@ -0,0 +1,145 @@
+#!/usr/bin/python
+"""the static NJTransit rail timetable, read from the GTFS files"""
+import os
+import re
+from datetime import date, datetime, timedelta
+import pytz
+from gtfs.models.calendar_date import CalendarDate
+from gtfs.models.route import Route, ROUTE_TYPE_RAIL
+from gtfs.models.stop import Stop
+from gtfs.models.stop_time import StopTime
+from gtfs.models.trip import Trip
+from gtfs.service_calendar import ServiceCalendar
+from gtfs.stop_index import StopIndex
+
+
+GTFS_DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+# GTFS station names that don't match the NJTransit
+# real-time station names once case & punctuation are ignored
+STATION_ALIASES = {
+    'ANDERSON STREET': 'Anderson St.',
+    'BERKELEY HEIGHTS': 'Berkeley Hts',
+    'BROADWAY': 'Broadway-Fl',
+    'CONVENT': 'Convent Stn',
+    'EDISON STATION': 'Edison',
+    'GLEN ROCK BORO HALL': 'Glen Rock Boro',
+    'GLEN ROCK MAIN LINE': 'Glen Rock Main',
+    'HIGHLAND AVENUE': 'Highland Ave.',
+    'MONTCLAIR HEIGHTS': 'Montclair Hts.',
+    'MOUNTAIN AVENUE': 'Mountain Ave',
+    'MOUNTAIN STATION': 'Mountain Stn',
+    'NEW YORK PENN STATION': 'New York',
+    'NEWARK BROAD ST': 'Newark Broad',
+    'NEWARK PENN STATION': 'Newark Penn',
+    'NORTH ELIZABETH': 'North Elizab.',
+    'NEW BRIDGE LANDING': 'New Bridge Ldg',
+    'RADBURN': 'Radburn-Fl',
+    'SALISBURY MILLS-CORNWALL': 'Salisbury Mls',
+    'TRENTON TRANSIT CENTER': 'Trenton',
+    'UPPER MONTCLAIR': 'Upp. Montclair',
+    'WATCHUNG AVENUE': 'Watchung Ave.',
+    'WATSESSING AVENUE': 'Watsessing Ave',
+    'ABERDEEN-MATAWAN': 'Matawan',
+    'NEWARK AIRPORT RAILROAD STATION': 'Newark Airport',
+    'FRANK R LAUTENBERG SECAUCUS LOWER LEVEL': 'Secaucus',
+    'FRANK R LAUTENBERG SECAUCUS UPPER LEVEL': 'Secaucus ',
+    'RAMSEY ROUTE 17 STATION': 'Ramsey Rt 17',
+    'MOUNT ARLINGTON': 'Mt. Arlington',
+    'WAYNE/ROUTE 23 TRANSIT CENTER [RR]': 'Wayne Route 23',
+}
+
+
+def normalize_name(station_name: str) -> str:
+    """casefold & strip punctuation so names can be compared"""
+    return ' '.join(re.sub(r'[^\w ]', '', station_name.casefold()).split())
+
+
+class Timetable:
+    """the scheduled (not real-time) trains, indexed for lookup
+
+    Only heavy rail routes are kept, light rail isn't part
+    of the real-time API so we can't name its stations."""
+    timezone = pytz.timezone("America/New_York")
+
+    def __init__(self, data_dir: str = GTFS_DATA):
+        routes = {route.route_id: route for route in Route.read(data_dir)
+                  if route.route_type == ROUTE_TYPE_RAIL}
+        self.trips = {trip.trip_id: trip for trip in Trip.read(data_dir)
+                      if trip.route_id in routes}
+        self.stops = {stop.stop_id: stop for stop in Stop.read(data_dir)}
+
+        # trips are numbered so the calendar can keep a bitmap of them
+        self.trip_ids = list(self.trips)
+        self.trip_index = {trip_id: index for index, trip_id in enumerate(self.trip_ids)}
+        self.calendar = ServiceCalendar(CalendarDate.read(data_dir),
+                                        [self.trips[trip_id].service_id
+                                         for trip_id in self.trip_ids])
+
+        # every trip's stops in order: [(stop_id, arrival, departure), ...]
+        self.trip_stops = {}
+        for stop_time in sorted(StopTime.read(data_dir),
+                                key=lambda st: (st.trip_id, st.stop_sequence)):
+            if stop_time.trip_id not in self.trips:
+                continue
+            self.trip_stops.setdefault(stop_time.trip_id, []).\
+                append((stop_time.stop_id, stop_time.arrival_time, stop_time.departure_time))
+        self.stop_index = StopIndex([self.trip_stops.get(trip_id, [])
+                                     for trip_id in self.trip_ids])
+
+        self.station_names = {}  # stop_id -> NJTransit station name
+        self.station_stops = {}  # NJTransit station name -> [stop_id, ...]
+
+    def resolve_stations(self, train_stations: dict) -> None:
+        """map GTFS stops onto the NJTransit station names, the
+        names the real-time API (and so our controller) uses
+        :param train_stations: NJTransit station list, name <-> abbreviation
+        """
+        normalized = {normalize_name(name): name for name in train_stations
+                      if len(name) > 2}
+        self.station_names = {}
+        self.station_stops = {}
+        for stop_id in self.stop_index.stop_ids:
+            stop_name = self.stops[stop_id].stop_name
+            name = STATION_ALIASES.get(stop_name,
+                                       normalized.get(normalize_name(stop_name)))
+            if name is None or name not in train_stations:
+                continue
+            self.station_names[stop_id] = name
+            self.station_stops.setdefault(name, []).append(stop_id)
+
+    def active_services(self, service_date: date) -> set:
+        """the service ids running on the specified date"""
+        return self.calendar.service_ids(service_date)
+
+    def has_service(self, service_date: date) -> bool:
+        """True if the timetable covers the specified date"""
+        return self.calendar.has_service(service_date)
+
+    def service_day_start(self, service_date: date) -> datetime:
+        """GTFS times are measured from 'noon minus 12 hours', which
+        differs from midnight on the days daylight savings changes"""
+        noon = self.timezone.localize(datetime(service_date.year,
+                                               service_date.month,
+                                               service_date.day, 12))
+        return self.timezone.normalize(noon - timedelta(hours=12))
+
+    def departures(self, stop_id: str, service_date: date,
+                   start: int = 0, end: int = None) -> list:
+        """trips leaving the stop on the service date between start & end
+        (seconds into the service day) as (seconds, trip_id), by time"""
+        running = self.calendar.trips(service_date)
+        return [(departure, self.trip_ids[trip_index])
+                for departure, trip_index, _ in
+                self.stop_index.departures(stop_id, start, end, running)]
+
+
+TIMETABLE = None
+
+
+def initialize_timetable(data_dir: str = GTFS_DATA) -> Timetable:
+    """read the timetable once per container, it doesn't change"""
+    global TIMETABLE  # pylint: disable=W0603
+    if TIMETABLE is None:
+        TIMETABLE = Timetable(data_dir)
+    return TIMETABLE
@@ -0,0 +1,124 @@
+#!/usr/bin/python
+"""where you can change trains to get between two stations"""
+from gtfs import timetable
+from gtfs.models.transfer import Transfer, MINIMUM_TIME
+
+DEFAULT_TRANSFER_SECONDS = 5 * 60  # allow at least 5 minutes to transfer
+
+
+class TransferTable:
+    """precomputed from the timetable: the route patterns (distinct stop
+    orders of each line), the stations each pair of patterns share and a
+    minimum transfer time for each station (from transfers.txt where the
+    feed has one, else the default). Given a start & destination the
+    feasible transfer stations are then a lookup, not a search."""
+
+    def __init__(self, schedule: timetable.Timetable,
+                 transfer_seconds: int = DEFAULT_TRANSFER_SECONDS,
+                 station_transfer_seconds: dict = None):
+        """
+        :param schedule: timetable with its stations resolved to NJTransit names
+        :param transfer_seconds: minimum time to change trains
+        :param station_transfer_seconds: per station overrides of the minimum
+        """
+        pattern_index = {}
+        self.patterns = []  # [(route_id, (station name, ...)), ...]
+        for trip_id, stops in schedule.trip_stops.items():
+            names = []
+            for stop_id, _, _ in stops:
+                name = schedule.station_names.get(stop_id)
+                if name is not None and name not in names:
+                    names.append(name)
+            pattern = (schedule.trips[trip_id].route_id, tuple(names))
+            if pattern not in pattern_index:
+                pattern_index[pattern] = len(self.patterns)
+                self.patterns.append(pattern)
+
+        self.station_patterns = {}  # station name -> {pattern index, ...}
+        for index, (_, names) in enumerate(self.patterns):
+            for name in names:
+                self.station_patterns.setdefault(name, set()).add(index)
+
+        # stations shared by each pair of patterns, key is (lower, higher) index
+        self.shared = {}
+        for name, indexes in self.station_patterns.items():
+            ordered = sorted(indexes)
+            for position, first in enumerate(ordered):
+                for second in ordered[position + 1:]:
+                    self.shared.setdefault((first, second), set()).add(name)
+
+        self.minimum_transfer = {name: transfer_seconds for name in self.station_patterns}
+        if station_transfer_seconds:
+            self.minimum_transfer.update(station_transfer_seconds)
+
+        self._transfer_stations = {}  # (start, destination) -> {station: seconds}
+
+    def __contains__(self, station_name: str) -> bool:
+        return station_name in self.station_patterns
+
+    def transfer_stations(self, starting_station: str, ending_station: str) -> dict:
+        """stations where a train from the start can connect to a train to
+        the destination, with the minimum transfer time at each (seconds).
+        The first train has to reach the station after the start & the
+        second has to reach the destination after the station"""
+        key = (starting_station, ending_station)
+        if key in self._transfer_stations:
+            return self._transfer_stations[key]
+
+        stations = {}
+        for first in self.station_patterns.get(starting_station, ()):
+            first_names = self.patterns[first][1]
+            after_start = first_names[first_names.index(starting_station) + 1:]
+            for second in self.station_patterns.get(ending_station, ()):
+                if first == second:
+                    continue
+                shared = self.shared.get((min(first, second), max(first, second)))
+                if not shared:
+                    continue
+                second_names = self.patterns[second][1]
+                before_end = second_names[:second_names.index(ending_station)]
+                for name in shared.intersection(after_start, before_end):
+                    stations[name] = self.minimum_transfer[name]
+
+        self._transfer_stations[key] = stations
+        return stations
+
+
+def station_transfer_seconds(schedule: timetable.Timetable,
+                             data_dir: str = timetable.GTFS_DATA) -> dict:
+    """the minimum transfer times transfers.txt gives within a station,
+    the longest if its stops have several. The file is optional, {}
+    without it (NJTransit's feed doesn't have one)
+    :param schedule: timetable with its stations resolved to NJTransit names
+    :return: station name -> seconds
+    """
+    try:
+        rules = Transfer.read(data_dir)
+    except FileNotFoundError:
+        return {}
+    seconds = {}
+    for rule in rules:
+        if rule.transfer_type != MINIMUM_TIME or rule.min_transfer_time is None:
+            continue
+        name = schedule.station_names.get(rule.from_stop_id)
+        if name is None or name != schedule.station_names.get(rule.to_stop_id):
+            continue
+        seconds[name] = max(seconds.get(name, 0), rule.min_transfer_time)
+    return seconds
+
+
+TRANSFER_TABLE = None
+
+
+def initialize_transfer_table(train_stations: dict) -> TransferTable:
+    """build the transfer table once per container
+    :param train_stations: NJTransit station list, name <-> abbreviation
+    """
+    global TRANSFER_TABLE  # pylint: disable=W0603
+    if TRANSFER_TABLE is None:
+        schedule = timetable.initialize_timetable()
+        if not schedule.station_names:
+            schedule.resolve_stations(train_stations)
+        TRANSFER_TABLE = TransferTable(schedule,
+                                       station_transfer_seconds=station_transfer_seconds(schedule))
+    return TRANSFER_TABLE
@@ -1,10 +1,11 @@
 # -*- coding: utf-8 -*-
 """ Jersey Trains Alexa Skill! Returns the NJTransit train information """
 # pylint: disable-msg=R0911, W0401, R1705, W0613
-from datetime import datetime
+import time
+from datetime import datetime, timedelta
 import pytz
-from models import cloudredis, setuplogging
-from controllers import train_scheduler
+from models import cloudredis, setuplogging, profiling, metrics, memory, tracing
+from controllers import train_scheduler, prewarmer, preloader, precompute
 from configuration import config
 
 
@@ -27,7 +28,22 @@ NO_TRAINS = "I'm sorry, there are currently no trains running from {0} to {1}"
 NOT_IMPLEMENTED = "I'm sorry, this feature has not been implemented"
 NEXT_TRAIN_DIRECT = "The next train from {0} to {1} will leave at {2} and arrive at {3}"
 NEXT_TRAIN_INDIRECT = NEXT_TRAIN_DIRECT + " with a transfer at {4}"
+NEXT_TRAIN_WALKING = NEXT_TRAIN_DIRECT + ", changing at {4} & walking to {5}"
 PROBLEM_WITH_ROUTE = "There was a problem with the routing information, please try later"
+STALE_SCHEDULE = "NJTransit is not responding, so this may be out of date. "
+NEXT_TRAINS = "The next {0} trains from {1} to {2} leave at "
+NEXT_TRAINS_DIRECT = "{0} and arrive at {1}"
+NEXT_TRAINS_INDIRECT = NEXT_TRAINS_DIRECT + " with a transfer at {2}"
+NEXT_TRAINS_WALKING = NEXT_TRAINS_DIRECT + ", changing at {2} & walking to {3}"
+NEXT_TRAINS_OR = ", or at "
+MAX_NEXT_TRAINS = 3  # more than this is too much to listen to
+ARRIVE_BY_DIRECT = "To get to {1} by {2}, leave {0} at {3} and arrive at {4}"
+ARRIVE_BY_INDIRECT = ARRIVE_BY_DIRECT + " with a transfer at {5}"
+ARRIVE_BY_WALKING = ARRIVE_BY_DIRECT + ", changing at {5} & walking to {6}"
+NO_TRAINS_ARRIVE_BY = "I'm sorry, there are no trains from {0} that get to {1} by {2}"
+ARRIVE_BY_TOO_FAR = "I'm sorry, I can't see the trains from {0} to {1} that far ahead, " \
+                    "please ask again closer to {2}"
+ARRIVAL_TIME_INVALID = "I'm sorry, I need to know what time you want to arrive"
 
 
 def log(message: str) -> None:
@@ -36,12 +52,44 @@ def log(message: str) -> None:
     setuplogging.LOGGING_HANDLER(message)
 
 
+@profiling.profiled
 def lambda_handler(event, context):
 
     """  App entry point  """
     setuplogging.initialize_logging(mocking=False) # make sure logging is setup
     log('EVENT{}'.format(event)) # log the event
 
+    start = time.perf_counter()
+    name = event_name(event)
+    metrics.EMF.dimension('Intent', name)
+    failed = 1
+    try:
+        with tracing.TRACER.trace('lambda_handler', intent=name):
+            handled = dispatch_event(event)
+        failed = 0
+        return handled
+    finally:
+        metrics.EMF.count('Errors', failed)
+        metrics.EMF.observe('Latency', (time.perf_counter() - start) * 1000)
+        upstream = metrics.UPSTREAM.snapshot()
+        if upstream:
+            metrics.EMF.set_property('Upstream', upstream)
+        if metrics.EMF.flush():  # once per invocation, as one EMF line
+            metrics.UPSTREAM.reset()  # the totals went in the EMF line
+        else:
+            metrics.UPSTREAM.emit(log)  # EMF is off, once per invocation
+        tracing.TRACER.emit(log)  # the request's spans, as one record
+        preloader.PRELOADER.request_finished(time.perf_counter() - start)
+        preloader.PRELOADER.log(log)  # init vs first request, once per container
+
+
+def dispatch_event(event: dict) -> dict:
+    """hand the event to its handler"""
+    if is_scheduled_event(event):
+        if event.get('detail', {}).get('job') == 'precompute':
+            return on_nightly_event()
+        return on_scheduled_event()
+
     if event['session']['new']:
         on_session_started()
 
@@ -54,6 +102,42 @@ def lambda_handler(event, context):
 
     return None
 
+
+def event_name(event: dict) -> str:
+    """what the metrics are dimensioned by, the intent's name or the kind of event"""
+    if is_scheduled_event(event):
+        return event.get('detail', {}).get('job', 'prewarm')
+    request = event.get('request', {})
+    if request.get('type') == 'IntentRequest':
+        return request.get('intent', {}).get('name', 'IntentRequest')
+    return request.get('type', 'Unknown')
+
+
+def is_scheduled_event(event: dict) -> bool:
+    """CloudWatch scheduled events (not Alexa) look like:
+    {"source": "aws.events", "detail-type": "Scheduled Event", ...}"""
+    return event.get('source') == 'aws.events' and \
+        event.get('detail-type') == 'Scheduled Event'
+
+
+def on_nightly_event(fake_redis=None) -> dict:
+    """precompute the busy routes' answers for the day, the rule's
+    input has "detail": {"job": "precompute"}"""
+    if cloudredis.REDIS_SERVER is None:
+        cloudredis.initialize_cloud_redis(injected_server=fake_redis)
+    routes = precompute.precompute()
+    log("[PRECOMPUTE]: stored {0}".format(routes))
+    return {'precomputed': routes}
+
+
+def on_scheduled_event(fake_redis=None) -> dict:
+    """refresh the busy stations before anyone asks for them"""
+    if cloudredis.REDIS_SERVER is None:
+        cloudredis.initialize_cloud_redis(injected_server=fake_redis)
+    stations = prewarmer.prewarm()
+    log("[PREWARM]: refreshed {0}".format(stations))
+    return {'prewarmed': stations}
+
 # --------------- Response handlers -----------------
 
 
@@ -62,10 +146,10 @@ def set_home_station(request: dict, session: dict) -> dict:
     try:
         station = request['intent']['slots']['station']['value']
         aws_user_id = session['user']['userId']
-        success = train_scheduler.ScheduleUser.set_home_station(station=station,
-                                                user_id=aws_user_id)
-        if success:
-            return response(speech_response(HOME_STATION_SET.format(station), True))
+        station_name = train_scheduler.ScheduleUser.set_home_station(station=station,
+                                                                     user_id=aws_user_id)
+        if station_name:
+            return response(speech_response(HOME_STATION_SET.format(station_name), True))
 
         # some problem, tell the user. TBD validate brewery & other things,
         # perhaps ask for clarification
@@ -89,19 +173,22 @@ def get_home_station(request: dict, session: dict) -> dict:
     return response(speech_response(CURRENT_HOME_STATION.format(station), True))
 
 
-def next_train_indirect_response(start: str, destination: str, indirect_route: dict) -> dict:
+def next_train_indirect_response(start: str, destination: str, indirect_route: dict,
+                                 stale: bool = False) -> dict:
     """passed only 1 indirect route, the best one found"""
     try:
         start_time = indirect_route['start']['stops'][start]['time']
         arrival_time = indirect_route['transfer']['stops'][destination]['time']
         transfer_station = indirect_route['station']
-        transfer_time = indirect_route['transfer']['stops'][transfer_station]['time']
+        walk_to = indirect_route.get('walk_to')
 
-        indirect_response = NEXT_TRAIN_INDIRECT. \
+        indirect_response = (NEXT_TRAIN_WALKING if walk_to else NEXT_TRAIN_INDIRECT). \
             format(start, destination,
                    format_speech_time(start_time),
                    format_speech_time(arrival_time),
-                   transfer_station)
+                   transfer_station, walk_to)
+        if stale:
+            indirect_response = STALE_SCHEDULE + indirect_response
         return response(speech_response(indirect_response, True))
     except (KeyError, TypeError):
         return response(speech_response(PROBLEM_WITH_ROUTE, True))
@@ -114,7 +201,8 @@ def format_speech_time(train_time: datetime) -> str:
     return '{0}:{1:02d}'.format(train_time.hour, train_time.minute) + ' AM'
 
 
-def next_train_direct_response(start: str, destination: str, direct_route: dict) -> dict:
+def next_train_direct_response(start: str, destination: str, direct_route: dict,
+                               stale: bool = False) -> dict:
     """passed only 1 direct route, the best"""
     try:
         start_time = direct_route['stops'][start]['time']
@@ -124,58 +212,210 @@ def next_train_direct_response(start: str, destination: str, direct_route: dict)
         direct_response = NEXT_TRAIN_DIRECT.format(start, destination,
                                                    format_speech_time(start_time),
                                                    format_speech_time(arrival_time))
+        if stale:
+            direct_response = STALE_SCHEDULE + direct_response
 
         return response(speech_response_ssml(direct_response, True))
     except (KeyError, TypeError):
         return response(speech_response(PROBLEM_WITH_ROUTE, True))
 
 
-def next_train_response(start_station: str, destination_station: str, train_routes: dict) -> dict:
-    """okay, we should have a route (or more), so create our speech response"""
+def next_train_response(start_station: str, destination_station: str, train_routes: dict,
+                        stale: bool = False) -> dict:
+    """okay, we should have a route (or more), so create our speech response
+    :param stale: the schedule is an old copy, NJTransit didn't answer
+    """
     if train_routes:
         if 'direct' in train_routes and train_routes['direct']:
-            return next_train_direct_response(start_station, destination_station, train_routes['direct'])
+            return next_train_direct_response(start_station, destination_station,
+                                              train_routes['direct'], stale)
 
         if 'indirect' in train_routes and train_routes['indirect']:
-            next_train_indirect_response(start_station, destination_station, train_routes['indirect'])
+            return next_train_indirect_response(start_station, destination_station,
+                                                train_routes['indirect'], stale)
 
     log("NextTrain: No Trains from {0} -> {1} ??".format(start_station, destination_station))
     return response(speech_response(NO_TRAINS.format(start_station, destination_station), True))
 
 
-def next_train(request: dict, session: dict) -> dict:
-    """find the next train leaving the user's home station"""
+def next_trains_response(start_station: str, destination_station: str, best_routes: list,
+                         stale: bool = False) -> dict:
+    """more than one route, best first (see TrainSchedule.best_routes)"""
+    if len(best_routes) < 2:
+        return next_train_response(start_station, destination_station,
+                                   best_routes[0] if best_routes else {}, stale)
+    try:
+        options = []
+        for route in best_routes:
+            if 'direct' in route:
+                options.append(NEXT_TRAINS_DIRECT.format(
+                    format_speech_time(route['direct']['stops'][start_station]['time']),
+                    format_speech_time(route['direct']['stops'][destination_station]['time'])))
+            else:
+                indirect = route['indirect']
+                walk_to = indirect.get('walk_to')
+                options.append((NEXT_TRAINS_WALKING if walk_to else NEXT_TRAINS_INDIRECT).format(
+                    format_speech_time(indirect['start']['stops'][start_station]['time']),
+                    format_speech_time(indirect['transfer']['stops'][destination_station]['time']),
+                    indirect['station'], walk_to))
+        trains_response = NEXT_TRAINS.format(len(best_routes), start_station, destination_station) + \
+            NEXT_TRAINS_OR.join(options)
+        if stale:
+            trains_response = STALE_SCHEDULE + trains_response
+        return response(speech_response(trains_response, True))
+    except (KeyError, TypeError):
+        return response(speech_response(PROBLEM_WITH_ROUTE, True))
+
+
+def train_count_slot(request: dict) -> int:
+    """how many trains they asked for, 'the next two trains'"""
+    try:
+        count = int(request['intent']['slots']['count']['value'])
+    except (KeyError, TypeError, ValueError):
+        return 1
+    return min(max(count, 1), MAX_NEXT_TRAINS)
+
+
+def route_stations(request: dict, session: dict, tso) -> tuple:
+    """the user's home station & the destination they asked for
+    :return: (start station, destination station, None) or, if they
+    can't be routed, (None, None, the response saying why)
+    """
     aws_user_id = session['user']['userId']
     start_station = train_scheduler.ScheduleUser.get_home_station(user_id=aws_user_id)
     if not start_station: # didn't find a home
-        return response(speech_response(NO_HOME_STATION_SET, True))
+        return None, None, response(speech_response(NO_HOME_STATION_SET, True))
 
     # we have a home station, figure out the destination
-    destination_station = request['intent']['slots']['station']['value']
+    spoken_station = request['intent']['slots']['station']['value']
+
+    # validate the destination station, what was said may
+    # not be exactly how NJTransit names the station
+    destination_station = tso.resolve_station_name(spoken_station)
+    if destination_station is None:
+        return None, None, response(speech_response(DESTINATION_INVALID.format(spoken_station),
+                                                    True))
 
     if start_station == destination_station:
-        return response(speech_response(DESTINATION_SAME_AS_HOME, True))
+        return None, None, response(speech_response(DESTINATION_SAME_AS_HOME, True))
+    return start_station, destination_station, None
 
-    # validate the destination station
-    tso = train_scheduler.TrainSchedule()
-    if not tso.validate_station_name(destination_station):
-        return response(speech_response(DESTINATION_INVALID.format(destination_station), True))
 
-    # okay the start & destination are valid, so it's time to do some routing
+def request_time(request: dict) -> datetime:
+    """now, unless the (test) request says otherwise"""
+    if 'time' in request['intent']:
+        return request['intent']['time']
     current_time = datetime.utcnow()
     timezone = pytz.timezone('UTC')
-    current_time = timezone.localize(current_time)
-    if 'time' in request['intent']:
-        current_time = request['intent']['time']
+    return timezone.localize(current_time)
+
+
+def next_train(request: dict, session: dict) -> dict:
+    """find the next train leaving the user's home station"""
+    tso = train_scheduler.TrainSchedule()
+    start_station, destination_station, error = route_stations(request, session, tso)
+    if error:
+        return error
+
+    # okay the start & destination are valid, so it's time to do some routing
+    current_time = request_time(request)
     start_abbreviated = tso.train_stations(start_station)
     destination_abbreviated = tso.train_stations(destination_station)
     log("[NEXT_TRAIN]: start {0}, destination {1}, departure_time ={2}".
         format(start_abbreviated, destination_abbreviated, current_time))
+
+    count = train_count_slot(request)
+
+    # the busy routes are answered from the nightly precomputed answers
+    if precompute.route_count() > 0:
+        cloudredis.record_route_request(start_abbreviated, destination_abbreviated)
+        # only the best route is precomputed
+        best_route = precompute.lookup(start_abbreviated, destination_abbreviated,
+                                       current_time) if count == 1 else None
+        if best_route:
+            return next_train_response(start_station, destination_station, best_route)
+
     train_routes = tso.schedule(start_abbreviated, destination_abbreviated, departure_time=current_time)
 
+    if count > 1:
+        best_routes = tso.best_routes(start_station, destination_station, train_routes, count)
+        return next_trains_response(start_station, destination_station, best_routes,
+                                    train_routes.get('stale', False))
+
     # we have some routes, both direct & indirect, let's pick the "best" one for our response
     best_route = tso.best_route(start_station, destination_station, train_routes)
-    return next_train_response(start_station, destination_station, best_route)
+    return next_train_response(start_station, destination_station, best_route,
+                               train_routes.get('stale', False))
+
+
+def arrival_time_slot(value: str, current_time: datetime) -> datetime:
+    """Alexa's AMAZON.TIME slot ('09:00') as the next time it's that time
+    in New Jersey. ValueError if it's not a time of day ('EV', 'MO', ...)"""
+    timezone = pytz.timezone('America/New_York')
+    hour, minute = (int(part) for part in value.split(':'))
+    local_now = current_time.astimezone(timezone)
+    arrival_date = local_now.date()
+    if (hour, minute) < (local_now.hour, local_now.minute):  # they mean tomorrow
+        arrival_date += timedelta(days=1)
+    return timezone.localize(datetime(arrival_date.year, arrival_date.month, arrival_date.day,
+                                      hour, minute))
+
+
+def arrive_by_response(start: str, destination: str, arrival_time: datetime,
+                       route: dict) -> dict:
+    """the latest route that gets there by the arrival time,
+    None is a route past what the schedules cover"""
+    if route is None:
+        return response(speech_response(ARRIVE_BY_TOO_FAR.format(
+            start, destination, format_speech_time(arrival_time)), True))
+    try:
+        if route.get('direct'):
+            leave_time = route['direct']['stops'][start]['time']
+            arrive_time = route['direct']['stops'][destination]['time']
+            speech = ARRIVE_BY_DIRECT.format(start, destination,
+                                             format_speech_time(arrival_time),
+                                             format_speech_time(leave_time),
+                                             format_speech_time(arrive_time))
+        elif route.get('indirect'):
+            leave_time = route['indirect']['start']['stops'][start]['time']
+            arrive_time = route['indirect']['transfer']['stops'][destination]['time']
+            walk_to = route['indirect'].get('walk_to')
+            arrive_by_speech = ARRIVE_BY_WALKING if walk_to else ARRIVE_BY_INDIRECT
+            speech = arrive_by_speech.format(start, destination,
+                                             format_speech_time(arrival_time),
+                                             format_speech_time(leave_time),
+                                             format_speech_time(arrive_time),
+                                             route['indirect']['station'], walk_to)
+        else:
+            speech = NO_TRAINS_ARRIVE_BY.format(start, destination,
+                                                format_speech_time(arrival_time))
+        return response(speech_response(speech, True))
+    except (KeyError, TypeError):
+        return response(speech_response(PROBLEM_WITH_ROUTE, True))
+
+
+def arrive_by(request: dict, session: dict) -> dict:
+    """find the latest train from the user's home station that gets
+    to the destination by the time they asked for"""
+    tso = train_scheduler.TrainSchedule()
+    start_station, destination_station, error = route_stations(request, session, tso)
+    if error:
+        return error
+
+    current_time = request_time(request)
+    try:
+        arrival_time = arrival_time_slot(request['intent']['slots']['time']['value'],
+                                         current_time)
+    except (KeyError, ValueError):
+        return response(speech_response(ARRIVAL_TIME_INVALID, True))
+
+    start_abbreviated = tso.train_stations(start_station)
+    destination_abbreviated = tso.train_stations(destination_station)
+    log("[ARRIVE_BY]: start {0}, destination {1}, arrival_time ={2}".
+        format(start_abbreviated, destination_abbreviated, arrival_time))
+    route = tso.arrive_by(start_abbreviated, destination_abbreviated,
+                          arrival_time, departure_time=current_time)
+    return arrive_by_response(start_station, destination_station, arrival_time, route)
 
 
 def on_intent(request, session, fake_redis=None):
@@ -187,8 +427,13 @@ def on_intent(request, session, fake_redis=None):
     if cloudredis.REDIS_SERVER is None:
         cloudredis.initialize_cloud_redis(injected_server=fake_redis)
 
-    # process the intents
+    if memory.DIAGNOSTICS is not None:
+        return memory.DIAGNOSTICS.run(intent_name, handle_intent, intent_name, request, session)
+    return handle_intent(intent_name, request, session)
 
+
+def handle_intent(intent_name: str, request: dict, session: dict) -> dict:
+    """ process the intents """
     if intent_name == "AMAZON.HelpIntent":
         return get_help_response()
     elif intent_name == "AMAZON.StopIntent":
@@ -203,6 +448,8 @@ def on_intent(request, session, fake_redis=None):
         return set_home_station(request, session)
     elif intent_name == 'NextTrain':
         return next_train(request, session)
+    elif intent_name == 'ArriveBy':
+        return arrive_by(request, session)
 
     log("Unrecognized intent! {0}".format(intent_name))
     return get_help_response()
@@ -296,3 +543,7 @@ def response(speech_message) -> dict:
         'response': speech_message,
         'build_number': config.BUILD_NUMBER
     }
+
+
+# the Lambda init phase isn't billed, do the slow setup now (PRELOAD setting)
+preloader.initialize_preloader()
@@ -2,10 +2,14 @@
 import redis
 from configuration import config
 from ast import literal_eval
-import json
+from models import codec, tracing
 
 
 REDIS_SERVER = None
+STATION_TRAFFIC_KEY = 'JerseyTrains_station_traffic'
+REFRESH_KEY = 'JerseyTrains_refresh'
+ROUTE_TRAFFIC_KEY = 'JerseyTrains_route_traffic'
+HOME_STATIONS_KEY = 'JerseyTrains_home_stations'
 
 
 def read_configuration():
@@ -45,20 +49,25 @@ def initialize_cloud_redis(injected_server=None):
     return
 
 
+@tracing.traced()
 def exists(redis_key: str) -> bool:
     """returns True if the specified key exists in the cache"""
     return REDIS_SERVER.exists(redis_key) == 1
 
 
+@tracing.traced()
 def cache_station_list(stations: dict) -> None:
     """Cache the station list"""
-    REDIS_SERVER.set('station_list', json.dumps(stations))
+    REDIS_SERVER.set('station_list', codec.encode_station_list(stations))
 
 
+@tracing.traced()
 def station_list() -> dict:
     """retrieve the station list from the cache"""
     stations = REDIS_SERVER.get('station_list')
-    if isinstance(stations, bytes):
+    if codec.is_encoded(stations):
+        return codec.decode_station_list(stations)
+    if isinstance(stations, bytes):  # cached before we had the codec
         return literal_eval(stations.decode('utf-8'))
     return {}
 
@@ -68,3 +77,206 @@ def home_key(user_id: str) -> str:
     return "JerseyTrains_home_" + user_id.replace(' ', '') + "_uid"
 
 
+def board_key(station_abbreviation: str) -> str:
+    """create key for a station's real-time train schedule"""
+    return "JerseyTrains_board_" + station_abbreviation
+
+
+def stale_board_key(station_abbreviation: str) -> str:
+    """create key for the last good copy of a station's train schedule"""
+    return "JerseyTrains_board_stale_" + station_abbreviation
+
+
+@tracing.traced()
+def cache_train_schedule(station_abbreviation: str, trains: list, seconds: int,
+                         stale_seconds: int = 0) -> None:
+    """cache a station's real-time train schedule, it expires quickly.
+    If stale_seconds, also keep it that long as the last good copy"""
+    encoded = codec.encode_train_schedule(trains)
+    REDIS_SERVER.set(board_key(station_abbreviation), encoded, ex=seconds)
+    if stale_seconds > 0:
+        REDIS_SERVER.set(stale_board_key(station_abbreviation), encoded, ex=stale_seconds)
+
+
+@tracing.traced()
+def train_schedule(station_abbreviation: str) -> list:
+    """retrieve a station's train schedule, None if not cached (or expired)"""
+    cached = REDIS_SERVER.get(board_key(station_abbreviation))
+    if codec.is_encoded(cached):
+        return codec.decode_train_schedule(cached)
+    return None
+
+
+@tracing.traced()
+def stale_train_schedule(station_abbreviation: str) -> list:
+    """the last good copy of a station's train schedule, None if there isn't one"""
+    cached = REDIS_SERVER.get(stale_board_key(station_abbreviation))
+    if codec.is_encoded(cached):
+        return codec.decode_train_schedule(cached)
+    return None
+
+
+@tracing.traced()
+def request_refresh(station_abbreviation: str) -> None:
+    """we served a stale schedule, ask the pre-warmer to refresh it"""
+    REDIS_SERVER.sadd(REFRESH_KEY, station_abbreviation)
+
+
+@tracing.traced()
+def pending_refreshes() -> list:
+    """the stations waiting for a refresh, the list is cleared"""
+    pipeline = REDIS_SERVER.pipeline()
+    pipeline.smembers(REFRESH_KEY)
+    pipeline.delete(REFRESH_KEY)
+    stations, _ = pipeline.execute()
+    return sorted(station.decode('utf-8') for station in stations)
+
+
+def breaker_key(name: str) -> str:
+    """create key for a circuit breaker's state"""
+    return "JerseyTrains_breaker_" + name
+
+
+@tracing.traced()
+def breaker_opened(name: str):
+    """when the breaker's open period ends (epoch seconds), None if it's closed"""
+    opened_until = REDIS_SERVER.hget(breaker_key(name), 'opened_until')
+    return None if opened_until is None else float(opened_until)
+
+
+@tracing.traced()
+def record_breaker_failure(name: str, window_seconds: int) -> int:
+    """count a failure, the count goes away window_seconds after the first one"""
+    key = breaker_key(name) + '_failures'
+    pipeline = REDIS_SERVER.pipeline()
+    pipeline.incr(key)
+    pipeline.ttl(key)
+    failures, ttl = pipeline.execute()
+    if ttl is None or ttl < 0:  # the first failure in the window
+        REDIS_SERVER.expire(key, window_seconds)
+    return failures
+
+
+@tracing.traced()
+def open_breaker(name: str, until: float) -> None:
+    """fail fast until the time given (epoch seconds)"""
+    pipeline = REDIS_SERVER.pipeline()
+    pipeline.hset(breaker_key(name), 'opened_until', until)
+    pipeline.delete(breaker_key(name) + '_failures')
+    pipeline.delete(breaker_key(name) + '_probe')
+    pipeline.execute()
+
+
+@tracing.traced()
+def close_breaker(name: str) -> None:
+    """back to normal"""
+    REDIS_SERVER.delete(breaker_key(name), breaker_key(name) + '_failures',
+                        breaker_key(name) + '_probe')
+
+
+@tracing.traced()
+def claim_breaker_probe(name: str, seconds: int) -> bool:
+    """True for the one caller that gets to probe a half-open breaker"""
+    return bool(REDIS_SERVER.set(breaker_key(name) + '_probe', 1, nx=True, ex=seconds))
+
+
+def stops_key(train_id: str, service_date) -> str:
+    """create key for a train's stop list, train ids are reused every day"""
+    return "JerseyTrains_stops_{0:%Y%m%d}_{1}".format(service_date, train_id)
+
+
+@tracing.traced()
+def cache_train_stops(train_id: str, service_date, stops: list, seconds: int) -> None:
+    """cache a train's stop list ([{station: {'time', 'departed', 'status'}}, ...]),
+    stored as a one train schedule so it's encoded by the codec"""
+    train = {'tid': train_id, 'stops': {}}
+    for stop in stops:
+        for station_name, details in stop.items():
+            train['stops'][station_name] = {'time': details.get('time'),
+                                            'status': details.get('status'),
+                                            'departed': details.get('departed') == 'YES'}
+    REDIS_SERVER.set(stops_key(train_id, service_date),
+                     codec.encode_train_schedule([train]), ex=max(1, int(seconds)))
+
+
+@tracing.traced()
+def train_stops(train_id: str, service_date) -> list:
+    """a train's cached stop list, None if not cached"""
+    cached = REDIS_SERVER.get(stops_key(train_id, service_date))
+    if not codec.is_encoded(cached):
+        return None
+    train = codec.decode_train_schedule(cached)[0]
+    return [{station_name: {'time': details.get('time'),
+                            'departed': 'YES' if details.get('departed') else 'NO',
+                            'status': details.get('status')}}
+            for station_name, details in train['stops'].items()]
+
+
+@tracing.traced()
+def record_station_request(station_abbreviation: str) -> None:
+    """count the requests for a station, the busy ones get pre-warmed"""
+    REDIS_SERVER.zincrby(STATION_TRAFFIC_KEY, 1, station_abbreviation)
+
+
+@tracing.traced()
+def top_stations(count: int) -> list:
+    """the most requested stations, busiest first"""
+    return [station.decode('utf-8') for station in
+            REDIS_SERVER.zrevrange(STATION_TRAFFIC_KEY, 0, count - 1)]
+
+
+@tracing.traced()
+def record_route_request(starting_abbreviation: str, ending_abbreviation: str) -> None:
+    """count the requests for a route, the busy ones get precomputed"""
+    REDIS_SERVER.zincrby(ROUTE_TRAFFIC_KEY, 1,
+                         '{0}_{1}'.format(starting_abbreviation, ending_abbreviation))
+
+
+@tracing.traced()
+def top_routes(count: int) -> list:
+    """the most requested routes as (start, destination) abbreviations, busiest first"""
+    return [tuple(route.decode('utf-8').split('_', 1)) for route in
+            REDIS_SERVER.zrevrange(ROUTE_TRAFFIC_KEY, 0, count - 1)]
+
+
+@tracing.traced()
+def record_home_station(station_name: str) -> None:
+    """count the times a station is set as someone's home"""
+    REDIS_SERVER.zincrby(HOME_STATIONS_KEY, 1, station_name)
+
+
+@tracing.traced()
+def top_home_stations(count: int) -> list:
+    """the most popular home station names, most popular first"""
+    return [station.decode('utf-8') for station in
+            REDIS_SERVER.zrevrange(HOME_STATIONS_KEY, 0, count - 1)]
+
+
+def answers_key(starting_abbreviation: str, ending_abbreviation: str) -> str:
+    """create key for a route's precomputed answers"""
+    return "JerseyTrains_answers_{0}_{1}".format(starting_abbreviation, ending_abbreviation)
+
+
+@tracing.traced()
+def cache_answers(starting_abbreviation: str, ending_abbreviation: str,
+                  answers: dict, until: float, seconds: int) -> None:
+    """store a route's precomputed answers, replacing those before until,
+    so a rerun for the same day replaces that day's answers too
+    :param answers: encoded answer -> score (epoch seconds it's the answer from)
+    :param until: epoch seconds, the end of the day the answers are for
+    """
+    key = answers_key(starting_abbreviation, ending_abbreviation)
+    pipeline = REDIS_SERVER.pipeline()
+    pipeline.zremrangebyscore(key, '-inf', '({0}'.format(until))
+    if answers:
+        pipeline.zadd(key, answers)
+    pipeline.expire(key, seconds)
+    pipeline.execute()
+
+
+@tracing.traced()
+def answer(starting_abbreviation: str, ending_abbreviation: str, departure: float) -> bytes:
+    """the first precomputed answer at or after departure (epoch seconds), None if none"""
+    answers = REDIS_SERVER.zrangebyscore(answers_key(starting_abbreviation, ending_abbreviation),
+                                         departure, '+inf', start=0, num=1)
+    return answers[0] if answers else None
@@ -0,0 +1,236 @@
+"""compact binary encoding for what we keep in redis
+
+Every value starts with a 3 byte header:
+    magic (0xA7), version, flags
+flags says what's encoded (a train schedule or the station list) and
+if the body is zlib compressed. Strings (station names, destinations,
+statuses, train ids) are interned in a table at the start of the body
+and referred to by index, times are epoch seconds."""
+import struct
+import zlib
+from datetime import datetime, timedelta
+import pytz
+
+
+MAGIC = 0xA7
+VERSION = 1
+COMPRESS_THRESHOLD = 1024  # bytes, smaller bodies aren't worth compressing
+
+FLAG_COMPRESSED = 0x01
+KIND_TRAIN_SCHEDULE = 0x10
+KIND_STATION_LIST = 0x20
+KIND_MASK = 0xF0
+
+NO_STRING = 0xFFFF  # string index for None
+NO_INDEX = -1  # ITEM_INDEX of None
+
+# which keys a train (or stop) has, missing keys stay missing
+TRAIN_TID = 0x01
+TRAIN_DESTINATION = 0x02
+TRAIN_DEPARTURE = 0x04
+TRAIN_INDEX = 0x08
+TRAIN_STOPS = 0x10
+STOP_TIME = 0x01
+STOP_STATUS = 0x02
+STOP_DEPARTED = 0x04
+STOP_DEPARTED_YES = 0x08
+
+_HEADER = struct.Struct('!BBB')
+_COUNT = struct.Struct('!H')
+_TRAIN = struct.Struct('!BHHIiH')  # flags, tid, destination, departure, index, stop count
+_STOP = struct.Struct('!BHIH')  # flags, name, time, status
+_PAIR = struct.Struct('!HH')
+
+TIMEZONE = pytz.timezone("America/New_York")
+
+
+class CodecError(ValueError):
+    """the value isn't something we encoded, or is a newer version"""
+
+
+class _StringTable:
+    """intern strings to small ints"""
+
+    def __init__(self):
+        self.strings = []
+        self._index = {}
+
+    def add(self, value: str) -> int:
+        if value is None:
+            return NO_STRING
+        index = self._index.get(value)
+        if index is None:
+            index = len(self.strings)
+            self._index[value] = index
+            self.strings.append(value)
+        return index
+
+    def pack(self) -> bytes:
+        parts = [_COUNT.pack(len(self.strings))]
+        for value in self.strings:
+            encoded = value.encode('utf-8')
+            parts.append(_COUNT.pack(len(encoded)))
+            parts.append(encoded)
+        return b''.join(parts)
+
+
+def _unpack_strings(body: bytes) -> tuple:
+    """the string table & the offset of what follows it"""
+    count, = _COUNT.unpack_from(body, 0)
+    offset = _COUNT.size
+    strings = []
+    for _ in range(count):
+        length, = _COUNT.unpack_from(body, offset)
+        offset += _COUNT.size
+        strings.append(body[offset:offset + length].decode('utf-8'))
+        offset += length
+    return strings, offset
+
+
+def _epoch(value: datetime) -> int:
+    return int(value.timestamp())
+
+
+_UNIX_EPOCH = datetime(1970, 1, 1)
+_HOUR_OFFSETS = {}  # epoch hour -> (tzinfo, utc offset)
+
+
+def _from_epoch(seconds: int) -> datetime:
+    """epoch seconds to Eastern Time. Same as datetime.fromtimestamp(seconds,
+    TIMEZONE) but pytz's fromutc is slow, & daylight savings changes on the
+    hour, so we only ask pytz once per hour of the day"""
+    hour = seconds // 3600
+    offset = _HOUR_OFFSETS.get(hour)
+    if offset is None:
+        if len(_HOUR_OFFSETS) > 10000:
+            _HOUR_OFFSETS.clear()
+        local = datetime.fromtimestamp(hour * 3600, TIMEZONE)
+        offset = _HOUR_OFFSETS[hour] = (local.tzinfo, local.utcoffset())
+    tzinfo, utc_offset = offset
+    return (_UNIX_EPOCH + timedelta(seconds=seconds) + utc_offset).replace(tzinfo=tzinfo)
+
+
+def _wrap(kind: int, body: bytes) -> bytes:
+    """add the header, compressing the body if it's big enough"""
+    flags = kind
+    if len(body) > COMPRESS_THRESHOLD:
+        compressed = zlib.compress(body)
+        if len(compressed) < len(body):
+            body = compressed
+            flags |= FLAG_COMPRESSED
+    return _HEADER.pack(MAGIC, VERSION, flags) + body
+
+
+def _unwrap(kind: int, value: bytes) -> bytes:
+    """check the header & return the (uncompressed) body"""
+    if not is_encoded(value):
+        raise CodecError('not an encoded value')
+    _, version, flags = _HEADER.unpack_from(value, 0)
+    if version > VERSION:
+        raise CodecError('unsupported version {0}'.format(version))
+    if flags & KIND_MASK != kind:
+        raise CodecError('unexpected kind {0:#x}'.format(flags & KIND_MASK))
+    body = value[_HEADER.size:]
+    if flags & FLAG_COMPRESSED:
+        body = zlib.decompress(body)
+    return body
+
+
+def is_encoded(value: bytes) -> bool:
+    """True if the value has our header (older values are json)"""
+    return isinstance(value, bytes) and len(value) >= _HEADER.size and value[0] == MAGIC
+
+
+def encode_train_schedule(trains: list) -> bytes:
+    """encode the trains from NJTransitAPI.train_schedule ('departed' is a bool)"""
+    strings = _StringTable()
+    parts = [_COUNT.pack(len(trains))]
+    for train in trains:
+        flags = 0
+        flags |= TRAIN_TID if 'tid' in train else 0
+        flags |= TRAIN_DESTINATION if 'destination' in train else 0
+        flags |= TRAIN_DEPARTURE if train.get('departure') is not None else 0
+        flags |= TRAIN_INDEX if 'index' in train else 0
+        flags |= TRAIN_STOPS if 'stops' in train else 0
+        stops = train.get('stops', {})
+        index = train.get('index')
+        parts.append(_TRAIN.pack(flags,
+                                 strings.add(train.get('tid')),
+                                 strings.add(train.get('destination')),
+                                 _epoch(train['departure']) if flags & TRAIN_DEPARTURE else 0,
+                                 NO_INDEX if index is None else index,
+                                 len(stops)))
+        for station_name, stop in stops.items():
+            stop_flags = 0
+            stop_flags |= STOP_TIME if stop.get('time') is not None else 0
+            stop_flags |= STOP_STATUS if 'status' in stop else 0
+            if 'departed' in stop:
+                stop_flags |= STOP_DEPARTED
+                stop_flags |= STOP_DEPARTED_YES if stop['departed'] else 0
+            parts.append(_STOP.pack(stop_flags,
+                                    strings.add(station_name),
+                                    _epoch(stop['time']) if stop_flags & STOP_TIME else 0,
+                                    strings.add(stop.get('status'))))
+    return _wrap(KIND_TRAIN_SCHEDULE, strings.pack() + b''.join(parts))
+
+
+def decode_train_schedule(value: bytes) -> list:
+    """reverse of encode_train_schedule, times are Eastern Time"""
+    body = _unwrap(KIND_TRAIN_SCHEDULE, value)
+    strings, offset = _unpack_strings(body)
+
+    def string_at(index: int) -> str:
+        return None if index == NO_STRING else strings[index]
+
+    count, = _COUNT.unpack_from(body, offset)
+    offset += _COUNT.size
+    trains = []
+    for _ in range(count):
+        flags, tid, destination, departure, index, stop_count = _TRAIN.unpack_from(body, offset)
+        offset += _TRAIN.size
+        train = {}
+        if flags & TRAIN_TID:
+            train['tid'] = string_at(tid)
+        if flags & TRAIN_DESTINATION:
+            train['destination'] = string_at(destination)
+        if flags & TRAIN_DEPARTURE:
+            train['departure'] = _from_epoch(departure)
+        if flags & TRAIN_INDEX:
+            train['index'] = None if index == NO_INDEX else index
+        stops = {}
+        for _ in range(stop_count):
+            stop_flags, name, stop_time, status = _STOP.unpack_from(body, offset)
+            offset += _STOP.size
+            stop = {}
+            if stop_flags & STOP_TIME:
+                stop['time'] = _from_epoch(stop_time)
+            if stop_flags & STOP_STATUS:
+                stop['status'] = string_at(status)
+            if stop_flags & STOP_DEPARTED:
+                stop['departed'] = bool(stop_flags & STOP_DEPARTED_YES)
+            stops[string_at(name)] = stop
+        if flags & TRAIN_STOPS:
+            train['stops'] = stops
+        trains.append(train)
+    return trains
+
+
+def encode_station_list(stations: dict) -> bytes:
+    """encode the station list, name <-> abbreviation"""
+    strings = _StringTable()
+    pairs = [_PAIR.pack(strings.add(key), strings.add(value)) for key, value in stations.items()]
+    return _wrap(KIND_STATION_LIST, strings.pack() + _COUNT.pack(len(pairs)) + b''.join(pairs))
+
+
+def decode_station_list(value: bytes) -> dict:
+    """reverse of encode_station_list"""
+    body = _unwrap(KIND_STATION_LIST, value)
+    strings, offset = _unpack_strings(body)
+    count, = _COUNT.unpack_from(body, offset)
+    offset += _COUNT.size
+    stations = {}
+    for _ in range(count):
+        key, value = _PAIR.unpack_from(body, offset)
+        offset += _PAIR.size
+        stations[strings[key]] = strings[value]
+    return stations
@@ -0,0 +1,157 @@
+"""memory diagnostics: what each intent allocates & what the long-lived
+globals (station list, timetable, caches) hold on to
+
+Off unless MEMORY_DIAGNOSTICS is set (environment variable or config).
+When on, tracemalloc runs for the life of the container and on_intent
+reports each intent's growth, peak & top allocation sites, plus the
+deep size of the long-lived globals (measured once per container,
+again only if one is rebuilt). The load tests can use it
+directly: initialize_diagnostics(enabled=True), then read last_report."""
+import sys
+import tracemalloc
+import types
+from models import setuplogging
+from models.settings import setting
+
+DEFAULT_TOP = 10
+TRACEBACK_FRAMES = 1
+
+# name -> (module, attribute path) of the globals that live as long as the container,
+# only modules that have been imported are measured
+LONG_LIVED = {
+    'station_list': ('njtransit.api', 'NJTransitAPI._NJTransitAPI__train_stations'),
+    'timetable': ('gtfs.timetable', 'TIMETABLE'),
+    'transfer_table': ('gtfs.transfers', 'TRANSFER_TABLE'),
+    'station_index': ('controllers.station_names', 'STATION_INDEX'),
+    'station_grid': ('gtfs.station_grid', 'STATION_GRID'),
+    'codec_hour_offsets': ('models.codec', '_HOUR_OFFSETS'),
+    'upstream_metrics': ('models.metrics', 'UPSTREAM'),
+}
+
+_NOT_DATA = (types.ModuleType, types.FunctionType, types.BuiltinFunctionType,
+             types.MethodType, type)
+
+
+def deep_size(value, seen: set = None) -> int:
+    """bytes used by the value & everything it refers to, each object counted once"""
+    if seen is None:
+        seen = set()
+    pending = [value]
+    total = 0
+    while pending:
+        current = pending.pop()
+        if id(current) in seen or isinstance(current, _NOT_DATA):
+            continue
+        seen.add(id(current))
+        total += sys.getsizeof(current)
+        if isinstance(current, dict):
+            pending.extend(current.keys())
+            pending.extend(current.values())
+        elif isinstance(current, (list, tuple, set, frozenset)):
+            pending.extend(current)
+        else:
+            if hasattr(current, '__dict__'):
+                pending.append(vars(current))
+            for slot in getattr(type(current), '__slots__', ()):
+                if hasattr(current, slot):
+                    pending.append(getattr(current, slot))
+    return total
+
+
+def long_lived_sizes(measured: dict = None) -> dict:
+    """deep size of each long-lived global that's been loaded
+    :param measured: name -> (global, size) of the ones already measured,
+    they're only walked again when the global is a different object
+    """
+    if measured is None:
+        measured = {}
+    sizes = {}
+    for name, (module_name, path) in LONG_LIVED.items():
+        value = sys.modules.get(module_name)
+        for attribute in path.split('.'):
+            value = getattr(value, attribute, None)
+        if value is None:
+            continue
+        if name not in measured or measured[name][0] is not value:
+            measured[name] = (value, deep_size(value))
+        sizes[name] = measured[name][1]
+    return sizes
+
+
+class MemoryDiagnostics:
+    """snapshots tracemalloc around each intent handler"""
+
+    def __init__(self, top: int = DEFAULT_TOP):
+        """
+        :param top: how many allocation sites to report
+        """
+        self.top = top
+        self.last_report = None
+        self.measured = {}  # name -> (global, size), walking the timetable is slow
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEBACK_FRAMES)
+
+    def run(self, intent_name: str, handler, *args, **kwargs):
+        """call the intent handler & report on what it allocated"""
+        before = tracemalloc.take_snapshot()
+        if hasattr(tracemalloc, 'reset_peak'):  # python 3.9+
+            tracemalloc.reset_peak()
+        try:
+            return handler(*args, **kwargs)
+        finally:
+            _, peak = tracemalloc.get_traced_memory()
+            after = tracemalloc.take_snapshot()
+            self.last_report = self.report(intent_name, before, after, peak)
+            self.log(self.last_report)
+
+    def report(self, intent_name: str, before: tracemalloc.Snapshot,
+               after: tracemalloc.Snapshot, peak: int) -> dict:
+        """growth, peak (since the start of the intent where python
+        can reset it, otherwise since tracing started), top sites & globals"""
+        filters = [tracemalloc.Filter(False, tracemalloc.__file__)]
+        differences = after.filter_traces(filters).compare_to(before.filter_traces(filters),
+                                                              'lineno')
+        top = []
+        for difference in differences[:self.top]:
+            frame = difference.traceback[0]
+            top.append({'site': '{0}:{1}'.format(frame.filename, frame.lineno),
+                        'size_diff': difference.size_diff,
+                        'count_diff': difference.count_diff})
+        return {'intent': intent_name,
+                'growth': sum(difference.size_diff for difference in differences),
+                'peak': peak,
+                'top': top,
+                'globals': long_lived_sizes(self.measured)}
+
+    @staticmethod
+    def log(report: dict) -> None:
+        lines = ['[MEMORY]: {0} grew {1:.1f}KB, peak {2:.1f}KB'.
+                 format(report['intent'], report['growth'] / 1024, report['peak'] / 1024)]
+        for site in report['top']:
+            lines.append('  {0:+.1f}KB {1}'.format(site['size_diff'] / 1024, site['site']))
+        for name, size in sorted(report['globals'].items()):
+            lines.append('  {0} {1:.1f}KB'.format(name, size / 1024))
+        if not setuplogging.LOGGING_HANDLER:
+            setuplogging.initialize_logging(mocking=True)
+        setuplogging.LOGGING_HANDLER('\n'.join(lines))
+
+
+DIAGNOSTICS = None
+
+
+def initialize_diagnostics(enabled: bool = None) -> MemoryDiagnostics:
+    """turn the diagnostics on (or off)
+    :param enabled: defaults to the MEMORY_DIAGNOSTICS setting
+    """
+    global DIAGNOSTICS  # pylint: disable=W0603
+    if enabled is None:
+        enabled = setting('MEMORY_DIAGNOSTICS', False)
+    if enabled and DIAGNOSTICS is None:
+        DIAGNOSTICS = MemoryDiagnostics(top=setting('MEMORY_TOP', DEFAULT_TOP))
+    elif not enabled and DIAGNOSTICS is not None:
+        DIAGNOSTICS = None
+        tracemalloc.stop()
+    return DIAGNOSTICS
+
+
+initialize_diagnostics()
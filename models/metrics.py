@@ -0,0 +1,243 @@
+"""in-process metrics, added up over an invocation & logged once at the end
+
+Each upstream call (NJTransit endpoint) records how long the network,
+decoding & parsing took, how many bytes came back and how many items
+were parsed. The lambda handler puts the totals in the EMF line below
+(as its "Upstream" property), or logs them as their own line when EMF
+is off.
+
+The same calls, the intent & the cache tiers also feed counters &
+latency histograms that are flushed as a single CloudWatch Embedded
+Metric Format (EMF) log line per invocation. CloudWatch turns the line
+into metrics, so they cost no PutMetricData calls:
+    {"_aws": {"Timestamp": ..., "CloudWatchMetrics": [{"Namespace": "JerseyTrains",
+              "Dimensions": [["Intent"]], "Metrics": [{"Name": "Latency", ...}, ...]}]},
+     "Intent": "NextTrain", "Latency": [212.0], "Cache.redis.Hit": 2, ...,
+     "Upstream": {"getTrainScheduleXML": {"calls": 2, "bytes": 51234, ...}}}"""
+import json
+import math
+import time
+from contextlib import contextmanager
+from models.settings import setting
+
+PHASES = ('network', 'decode', 'parse')
+EMF_MAX_VALUES = 100  # EMF's limit on the values of one metric
+BUCKETS_PER_DOUBLING = 4  # latencies are kept to within about 10%
+
+
+class EndpointStats:
+    """totals for one endpoint"""
+    __slots__ = ('calls', 'errors', 'bytes', 'items', 'seconds')
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.bytes = 0
+        self.items = 0
+        self.seconds = dict.fromkeys(PHASES, 0.0)
+
+    def as_dict(self) -> dict:
+        """milliseconds rather than seconds, easier to read in a log"""
+        stats = {'calls': self.calls, 'errors': self.errors,
+                 'bytes': self.bytes, 'items': self.items}
+        for phase, seconds in self.seconds.items():
+            stats[phase + '_ms'] = round(seconds * 1000, 3)
+        return stats
+
+
+class Call:
+    """one call in progress, lap() marks the end of each phase"""
+    __slots__ = ('bytes', 'items', 'seconds', '_last')
+
+    def __init__(self):
+        self.bytes = 0
+        self.items = 0
+        self.seconds = {}
+        self._last = time.perf_counter()
+
+    def lap(self, phase: str) -> None:
+        """the time since the last lap (or the start) was spent in this phase"""
+        now = time.perf_counter()
+        self.seconds[phase] = self.seconds.get(phase, 0.0) + now - self._last
+        self._last = now
+
+
+class MetricsRegistry:
+    """per endpoint totals since the last emit"""
+
+    def __init__(self):
+        self.endpoints = {}  # endpoint name -> EndpointStats
+
+    @contextmanager
+    def call(self, endpoint: str):
+        """time a call to the endpoint, a call that raises counts as an error"""
+        current = Call()
+        failed = False
+        try:
+            yield current
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            self.record(endpoint, current, failed)
+
+    def record(self, endpoint: str, current: Call, failed: bool = False) -> None:
+        """add a finished call to the totals"""
+        EMF.count('Upstream.{0}.Calls'.format(endpoint))
+        EMF.count('Upstream.{0}.Errors'.format(endpoint), 1 if failed else 0)
+        EMF.observe('Upstream.{0}.Latency'.format(endpoint),
+                    sum(current.seconds.values()) * 1000)
+        stats = self.endpoints.get(endpoint)
+        if stats is None:
+            stats = self.endpoints[endpoint] = EndpointStats()
+        stats.calls += 1
+        stats.errors += 1 if failed else 0
+        stats.bytes += current.bytes
+        stats.items += current.items
+        for phase, seconds in current.seconds.items():
+            stats.seconds[phase] = stats.seconds.get(phase, 0.0) + seconds
+
+    def snapshot(self) -> dict:
+        """endpoint -> totals"""
+        return {endpoint: stats.as_dict() for endpoint, stats in self.endpoints.items()}
+
+    def reset(self) -> None:
+        self.endpoints = {}
+
+    def emit(self, log) -> dict:
+        """log the totals as one json line & start over, nothing is
+        logged if there were no calls
+        :param log: function taking the string to log
+        """
+        snapshot = self.snapshot()
+        if snapshot:
+            log('[UPSTREAM]: ' + json.dumps(snapshot, sort_keys=True))
+        self.reset()
+        return snapshot
+
+
+def bucket(milliseconds: float) -> float:
+    """the histogram bucket a latency falls in, buckets are a quarter
+    of a doubling wide so a day's latencies fit in EMF's 100 values"""
+    if milliseconds <= 0:
+        return 0.0
+    exponent = round(math.log2(milliseconds) * BUCKETS_PER_DOUBLING) / BUCKETS_PER_DOUBLING
+    return round(2 ** exponent, 3)
+
+
+class Histogram:
+    """latencies counted by bucket, however many there are"""
+    __slots__ = ('counts',)
+
+    def __init__(self):
+        self.counts = {}  # bucket -> samples
+
+    def observe(self, milliseconds: float) -> None:
+        value = bucket(milliseconds)
+        self.counts[value] = self.counts.get(value, 0) + 1
+
+    def values(self) -> list:
+        """the samples as an EMF array. Past EMF's limit each bucket keeps
+        its share of the 100 values (at least one), so the percentiles hold"""
+        total = sum(self.counts.values())
+        scale = 1.0
+        if total > EMF_MAX_VALUES:
+            scale = max(0, EMF_MAX_VALUES - len(self.counts)) / total
+        values = []
+        for value, count in sorted(self.counts.items()):
+            values.extend([value] * max(1, int(count * scale)))
+        return values[:EMF_MAX_VALUES]
+
+
+def print_line(line: str) -> None:
+    """Lambda sends stdout to CloudWatch Logs as is, the logging
+    handler's prefix would stop CloudWatch reading the line as EMF"""
+    print(line, flush=True)
+
+
+class InvocationMetrics:
+    """counters & latency histograms for an invocation, dimensioned by
+    the intent (or event) & flushed as one EMF line"""
+
+    def __init__(self, namespace: str = None, write=print_line):
+        """
+        :param namespace: CloudWatch namespace, defaults to the METRICS_NAMESPACE setting
+        :param write: function taking the EMF line
+        """
+        self.namespace = namespace
+        self.write = write
+        self.dimensions = {}  # dimension name -> value, e.g. {'Intent': 'NextTrain'}
+        self.counters = {}  # metric name -> count
+        self.histograms = {}  # metric name -> Histogram
+        self.properties = {}  # name -> value, in the line but not a metric
+
+    def dimension(self, name: str, value: str) -> None:
+        self.dimensions[name] = str(value)
+
+    def set_property(self, name: str, value) -> None:
+        """log a value in the EMF line without making it a metric,
+        CloudWatch Logs Insights can still query it"""
+        self.properties[name] = value
+
+    def count(self, name: str, value: int = 1) -> None:
+        """add to a counter, a count of 0 still reports the metric (e.g. no errors)"""
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name: str, milliseconds: float) -> None:
+        """add a latency to a histogram"""
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+        histogram.observe(milliseconds)
+
+    @contextmanager
+    def timer(self, name: str):
+        """time the block into the named histogram"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, (time.perf_counter() - start) * 1000)
+
+    def document(self, timestamp: float = None) -> dict:
+        """the EMF document for everything since the last flush"""
+        if timestamp is None:
+            timestamp = time.time()
+        namespace = self.namespace or setting('METRICS_NAMESPACE', 'JerseyTrains')
+        definitions = [{'Name': name, 'Unit': 'Count'} for name in sorted(self.counters)]
+        definitions += [{'Name': name, 'Unit': 'Milliseconds'}
+                        for name in sorted(self.histograms)]
+        document = {'_aws': {'Timestamp': int(timestamp * 1000),
+                             'CloudWatchMetrics': [{'Namespace': namespace,
+                                                    'Dimensions': [sorted(self.dimensions)],
+                                                    'Metrics': definitions}]}}
+        document.update(self.properties)
+        document.update(self.dimensions)
+        document.update(self.counters)
+        for name, histogram in self.histograms.items():
+            document[name] = histogram.values()
+        return document
+
+    def reset(self) -> None:
+        self.dimensions = {}
+        self.counters = {}
+        self.histograms = {}
+        self.properties = {}
+
+    def flush(self, enabled: bool = None) -> dict:
+        """write the invocation's metrics as one EMF line & start over,
+        nothing is written if there aren't any
+        :param enabled: defaults to the EMF_METRICS setting, off just starts over
+        """
+        if enabled is None:
+            enabled = setting('EMF_METRICS', False)
+        document = {}
+        if enabled and (self.counters or self.histograms):
+            document = self.document()
+            self.write(json.dumps(document, sort_keys=True, separators=(',', ':')))
+        self.reset()
+        return document
+
+
+UPSTREAM = MetricsRegistry()
+EMF = InvocationMetrics()
@@ -0,0 +1,112 @@
+"""opt-in cProfile of the lambda handler
+
+Off unless PROFILE_SAMPLE_RATE (environment variable, or the config
+setting) is above 0. When on, that fraction of invocations is profiled,
+the stats are added up across PROFILE_INVOCATIONS profiled invocations
+and then either dumped to PROFILE_OUTPUT (a pstats file, e.g. in /tmp)
+or logged as the PROFILE_TOP functions with the most cumulative time."""
+import cProfile
+import functools
+import io
+import pstats
+import random
+from models import setuplogging
+from models.settings import setting
+
+DEFAULT_INVOCATIONS = 10
+DEFAULT_TOP = 20
+
+
+class Profiler:
+    """profiles a sample of invocations & reports on the aggregate"""
+
+    def __init__(self, sample_rate: float, invocations: int = DEFAULT_INVOCATIONS,
+                 output_path: str = None, top: int = DEFAULT_TOP, sampler=random.random):
+        """
+        :param sample_rate: fraction of invocations to profile, 0 to 1
+        :param invocations: how many profiled invocations to add up before reporting
+        :param output_path: dump the stats here, log a summary if None
+        :param top: how many functions in the summary
+        :param sampler: returns a number from 0 to 1, random unless testing
+        """
+        self.sample_rate = sample_rate
+        self.invocations = max(1, invocations)
+        self.output_path = output_path
+        self.top = top
+        self.sampler = sampler
+        self.profiled = 0  # invocations in the current aggregate
+        self.stats = None
+
+    def run(self, func, *args, **kwargs):
+        """call func, profiling it if this invocation is sampled"""
+        if self.sampler() >= self.sample_rate:
+            return func(*args, **kwargs)
+
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profile.disable()
+            self.add(profile)
+
+    def add(self, profile: cProfile.Profile) -> None:
+        """add an invocation's profile, report when we have enough"""
+        if self.stats is None:
+            self.stats = pstats.Stats(profile)
+        else:
+            self.stats.add(profile)
+        self.profiled += 1
+        if self.profiled >= self.invocations:
+            self.report()
+
+    def summary(self) -> str:
+        """the top functions by cumulative time"""
+        if self.stats is None:
+            return ''
+        stream = io.StringIO()
+        self.stats.stream = stream
+        self.stats.sort_stats('cumulative').print_stats(self.top)
+        return stream.getvalue()
+
+    def report(self) -> str:
+        """dump or log the aggregate & start a new one"""
+        if self.stats is None:
+            return None
+        if self.output_path:
+            self.stats.dump_stats(self.output_path)
+            message = "[PROFILE]: {0} invocations written to {1}".\
+                format(self.profiled, self.output_path)
+        else:
+            message = "[PROFILE]: {0} invocations\n{1}".format(self.profiled, self.summary())
+        if not setuplogging.LOGGING_HANDLER:
+            setuplogging.initialize_logging(mocking=True)
+        setuplogging.LOGGING_HANDLER(message)
+        self.stats = None
+        self.profiled = 0
+        return message
+
+
+def initialize_profiler() -> Profiler:
+    """a Profiler if profiling is on, None if not"""
+    sample_rate = float(setting('PROFILE_SAMPLE_RATE', 0.0))
+    if sample_rate <= 0:
+        return None
+    return Profiler(sample_rate,
+                    invocations=int(setting('PROFILE_INVOCATIONS', DEFAULT_INVOCATIONS)),
+                    output_path=setting('PROFILE_OUTPUT', None),
+                    top=int(setting('PROFILE_TOP', DEFAULT_TOP)))
+
+
+PROFILER = initialize_profiler()
+
+
+def profiled(handler):
+    """wrap the lambda handler, when profiling is off this is one
+    global lookup & a comparison per invocation"""
+    @functools.wraps(handler)
+    def wrapper(event, context):
+        if PROFILER is None:
+            return handler(event, context)
+        return PROFILER.run(handler, event, context)
+    return wrapper
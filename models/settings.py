@@ -0,0 +1,14 @@
+"""settings that can be changed on a deployed lambda without a rebuild"""
+import os
+from configuration import config
+
+
+def setting(name: str, default):
+    """environment variable first (easy to flip on a deployed lambda), then config.
+    The environment variable is converted to the type of the default"""
+    value = os.environ.get(name)
+    if value is None:
+        return getattr(config, name, default)
+    if isinstance(default, bool):
+        return value.lower() in ('1', 'true', 'yes', 'on')
+    return type(default)(value) if default is not None else value
@@ -0,0 +1,218 @@
+"""lightweight tracing, spans with start & end times, attributes & parent ids
+
+lambda_handler starts a trace (when TRACING is on) and the layers under
+it open spans in it: TrainSchedule.schedule, schedule_indirect_routes,
+the NJTransit calls & the cloudredis calls. At the end of the request
+the trace is logged as one structured record:
+    [TRACE]: {"trace_id": "...", "spans": [{"name": "lambda_handler", ...}, ...]}
+
+With TRACE_FILE set (e.g. /tmp/traces.json) the spans are also added to
+that file in the Chrome trace event format, open it in
+https://ui.perfetto.dev or chrome://tracing. Each request is a track.
+
+Outside a trace a span costs a lookup & nothing is recorded. The current
+span is a context variable, python 3.6 has no contextvars so there it's
+a thread local (the Lambda runtime runs one request at a time)."""
+import functools
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+try:
+    import contextvars
+except ImportError:  # pragma: no cover, python 3.6
+    contextvars = None
+from models.settings import setting
+
+
+class _ContextSlot:
+    """the current span, a context variable where there are any"""
+
+    def __init__(self):
+        if contextvars is not None:
+            self._var = contextvars.ContextVar('span', default=None)
+        else:
+            self._local = threading.local()
+
+    def get(self):
+        if contextvars is not None:
+            return self._var.get()
+        return getattr(self._local, 'span', None)
+
+    def set(self, span):
+        """:return: what reset() needs to put back the previous span"""
+        if contextvars is not None:
+            return self._var.set(span)
+        previous = self.get()
+        self._local.span = span
+        return previous
+
+    def reset(self, token) -> None:
+        if contextvars is not None:
+            self._var.reset(token)
+        else:
+            self._local.span = token
+
+
+CURRENT = _ContextSlot()
+
+
+class Span:
+    """one timed operation in a trace"""
+    __slots__ = ('trace', 'span_id', 'parent_id', 'name', 'start', 'duration',
+                 'attributes', '_started')
+
+    def __init__(self, trace: 'Trace', name: str, parent_id: str, attributes: dict):
+        self.trace = trace
+        self.span_id = '{0:016x}'.format(random.getrandbits(64))
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes
+        self.start = time.time()
+        self.duration = None  # seconds, once it's finished
+        self._started = time.perf_counter()
+
+    def finish(self) -> None:
+        self.duration = time.perf_counter() - self._started
+
+    def as_dict(self) -> dict:
+        return {'name': self.name, 'span_id': self.span_id, 'parent_id': self.parent_id,
+                'start': round(self.start, 6),
+                'duration_ms': round((self.duration or 0.0) * 1000, 3),
+                'attributes': self.attributes}
+
+
+class Trace:
+    """the spans of one request, in the order they started"""
+    __slots__ = ('trace_id', 'spans')
+
+    def __init__(self):
+        self.trace_id = '{0:032x}'.format(random.getrandbits(128))
+        self.spans = []
+
+    def as_dict(self) -> dict:
+        return {'trace_id': self.trace_id, 'spans': [span.as_dict() for span in self.spans]}
+
+
+class Tracer:
+    """starts traces & the spans in them, keeps the finished traces until emit()"""
+
+    def __init__(self):
+        self.finished = []  # Trace, since the last emit
+
+    @contextmanager
+    def trace(self, name: str, enabled: bool = None, **attributes):
+        """a new trace with this as its root span, or just a span if
+        there's a trace already
+        :param enabled: defaults to the TRACING setting, off is a no-op
+        """
+        if enabled is None:
+            enabled = setting('TRACING', False)
+        if not enabled or CURRENT.get() is not None:
+            with self.span(name, **attributes) as span:
+                yield span
+            return
+        trace = Trace()
+        try:
+            with self._open(trace, None, name, attributes) as span:
+                yield span
+        finally:
+            self.finished.append(trace)
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        """a span in the current trace, None outside a trace"""
+        parent = CURRENT.get()
+        if parent is None:
+            yield None
+            return
+        with self._open(parent.trace, parent.span_id, name, attributes) as span:
+            yield span
+
+    @staticmethod
+    @contextmanager
+    def _open(trace: Trace, parent_id: str, name: str, attributes: dict):
+        span = Span(trace, name, parent_id, attributes)
+        trace.spans.append(span)
+        token = CURRENT.set(span)
+        try:
+            yield span
+        except BaseException as error:
+            span.attributes['error'] = type(error).__name__
+            raise
+        finally:
+            span.finish()
+            CURRENT.reset(token)
+
+    def emit(self, log, path: str = None) -> list:
+        """log each finished trace as one record & start over
+        :param log: function taking the string to log
+        :param path: add the spans to this Chrome trace file, defaults to the TRACE_FILE setting
+        :return: the records
+        """
+        records = [trace.as_dict() for trace in self.finished]
+        self.finished = []
+        for record in records:
+            log('[TRACE]: ' + json.dumps(record, sort_keys=True))
+        if path is None:
+            path = setting('TRACE_FILE', None)
+        if records and path:
+            export_chrome(records, path)
+        return records
+
+
+def annotate(**attributes) -> None:
+    """add attributes to the current span, if there is one"""
+    span = CURRENT.get()
+    if span is not None:
+        span.attributes.update(attributes)
+
+
+def traced(name: str = None):
+    """decorator, the function is a span when it's called in a trace
+    :param name: defaults to module.function, e.g. cloudredis.train_schedule
+    """
+    def decorate(func):
+        span_name = name or '{0}.{1}'.format(func.__module__.rsplit('.', 1)[-1],
+                                             func.__qualname__)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if CURRENT.get() is None:
+                return func(*args, **kwargs)
+            with TRACER.span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def chrome_events(record: dict) -> list:
+    """a trace record as Chrome trace events, complete ('X') events in
+    microseconds, each request on its own track"""
+    track = int(record['trace_id'][:7], 16)
+    return [{'name': span['name'], 'cat': 'jerseytrains', 'ph': 'X',
+             'ts': int(span['start'] * 1000000), 'dur': int(span['duration_ms'] * 1000),
+             'pid': os.getpid(), 'tid': track,
+             'args': dict(span['attributes'], trace_id=record['trace_id'],
+                          span_id=span['span_id'], parent_id=span['parent_id'])}
+            for span in record['spans']]
+
+
+def export_chrome(records: list, path: str) -> None:
+    """add the traces to a Chrome trace file (a JSON array of events),
+    the file is valid JSON after every export"""
+    events = [event for record in records for event in chrome_events(record)]
+    body = ',\n'.join(json.dumps(event, sort_keys=True) for event in events).encode('utf-8')
+    ending = b'\n]\n'
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        with open(path, 'wb') as trace_file:
+            trace_file.write(b'[\n' + body + ending)
+        return
+    with open(path, 'rb+') as trace_file:
+        trace_file.seek(-len(ending), os.SEEK_END)  # over the closing bracket
+        trace_file.write(b',\n' + body + ending)
+
+
+TRACER = Tracer()
@@ -7,12 +7,36 @@ from datetime import datetime, timedelta
 import json
 import requests
 from configuration import config
+from models import metrics, cloudredis, tracing
+from models.settings import setting
+from njtransit import breaker, parsers
+
+
+# one session per container so the upstream connection is kept alive
+# between requests (and between invocations of a warm lambda)
+SESSION = requests.Session()
+
+# don't let a slow NJTransit hang us until Alexa gives up (8 seconds)
+REQUEST_TIMEOUT_SECONDS = float(setting('REQUEST_TIMEOUT_SECONDS', 3.0))
+
+EASTERN = pytz.timezone("America/New_York")
+# NJTransit's service day runs past midnight, a train leaving at 12:20am
+# left its origin the day before (nothing runs across 3am)
+SERVICE_DAY_ROLLOVER = timedelta(hours=3)
+_MONTHS = {'Jan': 1, 'Feb': 2, 'Mar': 3, 'Apr': 4, 'May': 5, 'Jun': 6,
+           'Jul': 7, 'Aug': 8, 'Sep': 9, 'Oct': 10, 'Nov': 11, 'Dec': 12}
+_HOUR_TZINFO = {}  # naive local hour -> its pytz tzinfo
 
 
 class NJTransitAPI:
     """a wrapper for calling NJTransit's web services"""
     _username = None
     _apikey = None
+    # cache each train's stop list in redis for the day it runs
+    stop_list_cache = getattr(config, 'STOP_LIST_CACHE', False)
+    # near departure the status of the stops is refreshed from NJTransit
+    stop_list_realtime = timedelta(minutes=getattr(config, 'STOP_LIST_REALTIME_MINUTES', 15))
+    stop_list_grace = timedelta(minutes=30)  # kept this long after the last stop
 
     @property
     def username(self) -> str:
@@ -39,14 +63,55 @@ class NJTransitAPI:
         self.username = config.USERNAME
         self.apikey = config.APIKEY
 
+    @staticmethod
+    def post(url: str, body: str) -> requests.Response:
+        """POST to NJTransit, with a timeout & through the circuit breaker.
+        Server errors count against the breaker, 404s & the like don't"""
+        return breaker.BREAKER.call(SESSION.request,
+                                    method='POST',
+                                    url=url,
+                                    headers={'content-type': 'application/x-www-form-urlencoded',
+                                             'Accept': 'application/xml'},
+                                    data=body,
+                                    timeout=REQUEST_TIMEOUT_SECONDS,
+                                    is_failure=lambda rsp: rsp.status_code >= 500)
+
     @staticmethod
     def to_ET(datetime_string: str) -> datetime:
-        """convert date/time string to Eastern Time"""
-        timezone = pytz.timezone("America/New_York")
-        d_naive = datetime.strptime(datetime_string, '%d-%b-%Y %I:%M:%S %p')
-        d_aware = timezone.localize(d_naive)
+        """convert date/time string to Eastern Time. NJTransit always sends
+        '08-Dec-2018 01:35:30 PM', which we pick apart by position since
+        strptime is slow, anything else goes to strptime"""
+        try:
+            d_naive = NJTransitAPI.fixed_datetime(datetime_string)
+        except (KeyError, ValueError):
+            d_naive = datetime.strptime(datetime_string, '%d-%b-%Y %I:%M:%S %p')
+        # localize is slow too, but the offset only changes on the hour
+        hour = d_naive.replace(minute=0, second=0, microsecond=0)
+        tzinfo = _HOUR_TZINFO.get(hour)
+        if tzinfo is None:
+            if len(_HOUR_TZINFO) > 10000:
+                _HOUR_TZINFO.clear()
+            tzinfo = _HOUR_TZINFO[hour] = EASTERN.localize(hour).tzinfo
+        d_aware = d_naive.replace(tzinfo=tzinfo)
         return d_aware
 
+    @staticmethod
+    def fixed_datetime(datetime_string: str) -> datetime:
+        """'08-Dec-2018 01:35:30 PM' to a naive datetime
+        :raises ValueError: (or KeyError) if it's not exactly that layout
+        """
+        if len(datetime_string) != 23 or datetime_string[2] != '-' or \
+                datetime_string[6] != '-' or datetime_string[20] != ' ':
+            raise ValueError(datetime_string)
+        hour = int(datetime_string[12:14])
+        meridiem = datetime_string[21:23]
+        if not 1 <= hour <= 12 or meridiem not in ('AM', 'PM'):
+            raise ValueError(datetime_string)
+        hour = hour % 12 + (12 if meridiem == 'PM' else 0)
+        return datetime(int(datetime_string[7:11]), _MONTHS[datetime_string[3:6]],
+                        int(datetime_string[0:2]), hour,
+                        int(datetime_string[15:17]), int(datetime_string[18:20]))
+
     @staticmethod
     def parse_station_schedule(root: ET) -> list:
         """parse the XML element tree into a list of train schedules"""
@@ -121,6 +186,25 @@ class NJTransitAPI:
 
         return train_list
 
+    @staticmethod
+    def parse_station_list(root: ET) -> dict:
+        """parse the XML element tree into the station list,
+        name <-> abbreviation"""
+        station_stops = {}
+        for stations in root:
+            abbreviation = None
+            station_name = None
+            for station in stations:
+                if station.tag == 'STATION_2CHAR':
+                    abbreviation = station.text
+                elif station.tag == 'STATIONNAME':
+                    station_name = station.text
+            if abbreviation and station_name and '\n' not in station_name:
+                station_stops.update({station_name: abbreviation})
+                station_stops.update({abbreviation: station_name})
+        return station_stops
+
+    @tracing.traced('NJTransitAPI.getTrainScheduleXML')
     def train_schedule(self, station_abbreviation: str,
                        test_argument: str = None) -> list:
         """returns all the trains departing this station
@@ -138,15 +222,17 @@ class NJTransitAPI:
         body = "username={0}&password={1}&station={2}&NJT_Only={3}".\
             format(self.username, self.apikey, station_abbreviation, test_argument)
         try:
-            rsp = requests.request(method='POST',
-                                   url=url,
-                                   headers={'content-type': 'application/x-www-form-urlencoded',
-                                            'Accept' : 'application/xml'},
-                                   data=body)
-            if rsp.status_code in (HTTPStatus.OK, HTTPStatus.CREATED):
-                response_string = rsp.content.decode('utf-8')
-                root = ET.fromstring(response_string)
-                return NJTransitAPI.parse_train_schedule(root)
+            with metrics.UPSTREAM.call('getTrainScheduleXML') as call:
+                rsp = NJTransitAPI.post(url, body)
+                call.bytes = len(rsp.content)
+                call.lap('network')
+                if rsp.status_code in (HTTPStatus.OK, HTTPStatus.CREATED):
+                    response_data = parsers.PARSER.decode(rsp.content)
+                    call.lap('decode')
+                    train_list = parsers.PARSER.train_schedule(response_data)
+                    call.items = len(train_list)
+                    call.lap('parse')
+                    return train_list
 
         except requests.RequestException as err:
             raise
@@ -155,6 +241,7 @@ class NJTransitAPI:
 
         return []
 
+    @tracing.traced('NJTransitAPI.getStationScheduleXML')
     def station_schedule(self, station_abbreviation: str) -> list:
         """returns all the trains departing this station for a given day,
         not real-time data, but a list of all trains to/from the specified
@@ -165,16 +252,17 @@ class NJTransitAPI:
         body = "username={0}&password={1}&station={2}&NJT_Only=".\
             format(self.username, self.apikey, station_abbreviation)
         try:
-            response_string = None
-            rsp = requests.request(method='POST',
-                                   url=url,
-                                   headers={'content-type': 'application/x-www-form-urlencoded',
-                                            'Accept' : 'application/xml'},
-                                   data=body)
-            if rsp.status_code in (HTTPStatus.OK, HTTPStatus.CREATED):
-                response_string = rsp.content.decode('utf-8')
-                root = ET.fromstring(response_string)
-                return NJTransitAPI.parse_station_schedule(root)
+            with metrics.UPSTREAM.call('getStationScheduleXML') as call:
+                rsp = NJTransitAPI.post(url, body)
+                call.bytes = len(rsp.content)
+                call.lap('network')
+                if rsp.status_code in (HTTPStatus.OK, HTTPStatus.CREATED):
+                    response_data = parsers.PARSER.decode(rsp.content)
+                    call.lap('decode')
+                    train_list = parsers.PARSER.station_schedule(response_data)
+                    call.items = len(train_list)
+                    call.lap('parse')
+                    return train_list
 
         except requests.RequestException as err:
             raise
@@ -183,6 +271,36 @@ class NJTransitAPI:
 
         return None
 
+    @staticmethod
+    def train_stops_payload(content: bytes):
+        """getTrainStopListJSON's JSON comes wrapped in XML:
+            <?xml ...?><string xmlns="...">{"Train": ...}</string>
+        find it in the raw bytes rather than building an XML tree. Only
+        if it has escaped characters (&amp; etc.) is the XML parsed"""
+        element = content.find(b'<string')
+        start = content.find(b'>', element) + 1 if element >= 0 else 0
+        end = content.rfind(b'</string>')
+        if not start or end < start:
+            raise ET.ParseError('no <string> element in getTrainStopListJSON response')
+        payload = content[start:end]
+        if b'&' in payload:
+            return ET.fromstring(content.decode('utf-8')).text
+        return payload
+
+    @staticmethod
+    def parse_train_stops(payload) -> dict:
+        """the JSON stop list to {train id: [{station: {'time', 'departed', 'status'}}, ...]}
+        :param payload: the JSON, bytes or str
+        """
+        stop_list = json.loads(payload)['Train']
+        to_ET = NJTransitAPI.to_ET
+        new_stop_list = [{stop['NAME']: {'time': to_ET(stop['TIME']),
+                                         'departed': stop['DEPARTED'],
+                                         'status': stop['STOP_STATUS']}}
+                         for stop in stop_list['STOPS']['STOP']]
+        return {stop_list['Train_ID']: new_stop_list}
+
+    @tracing.traced('NJTransitAPI.getTrainStopListJSON')
     def train_stops(self, train_id: str) -> dict:
         """return all the stops for the train"""
         assert self.username and self.apikey
@@ -190,23 +308,18 @@ class NJTransitAPI:
               "/NJTTrainData.asmx/getTrainStopListJSON"
         body = "username={0}&password={1}&trainID={2}".format(self.username, self.apikey, train_id)
         try:
-            rsp = requests.request(method='POST',
-                                   url=url,
-                                   headers={'content-type': 'application/x-www-form-urlencoded',
-                                            'Accept' : 'application/xml'},
-                                   data=body)
-            if rsp.status_code in (HTTPStatus.OK, HTTPStatus.CREATED):
-                root = ET.fromstring(rsp.content.decode('utf-8'))
-                stop_list = json.loads(s=root.text, encoding='utf-8')['Train']
-                train_id = stop_list['Train_ID']
-                new_stop_list = []
-                for stop in stop_list['STOPS']['STOP']:
-                    flat_stop = {stop['NAME']: {'time': NJTransitAPI.to_ET(stop['TIME']),
-                                                'departed': stop['DEPARTED'],
-                                                'status': stop['STOP_STATUS']}}
-                    new_stop_list.append(flat_stop)
-
-                return {train_id: new_stop_list}
+            with metrics.UPSTREAM.call('getTrainStopListJSON') as call:
+                rsp = NJTransitAPI.post(url, body)
+                call.bytes = len(rsp.content)
+                call.lap('network')
+                if rsp.status_code in (HTTPStatus.OK, HTTPStatus.CREATED):
+                    payload = NJTransitAPI.train_stops_payload(rsp.content)
+                    call.lap('decode')
+                    stop_list = NJTransitAPI.parse_train_stops(payload)
+                    call.items = len(next(iter(stop_list.values())))
+                    call.lap('parse')
+
+                    return stop_list
         except requests.RequestException as err:
             raise
         except ET.ParseError:
@@ -214,6 +327,65 @@ class NJTransitAPI:
 
         return {}
 
+    @staticmethod
+    def refresh_stop_status(cached: list, fresh: list) -> list:
+        """the cached stop list with the real-time fields (departed & status)
+        from the fresh one, the scheduled times don't change"""
+        fresh_stops = {}
+        for stop in fresh:
+            fresh_stops.update(stop)
+        refreshed = []
+        for stop in cached:
+            for station_name, details in stop.items():
+                details = dict(details)
+                if station_name in fresh_stops:
+                    details['departed'] = fresh_stops[station_name].get('departed')
+                    details['status'] = fresh_stops[station_name].get('status')
+                refreshed.append({station_name: details})
+        return refreshed
+
+    @staticmethod
+    def service_date(departure: datetime):
+        """the service day the train left its origin on, the same
+        for every station it stops at, even after midnight"""
+        return (departure.astimezone(EASTERN) - SERVICE_DAY_ROLLOVER).date()
+
+    def cached_train_stops(self, train_id: str, departure: datetime,
+                           now: datetime = None) -> list:
+        """a train's stop list, [{station: {'time', 'departed', 'status'}}, ...].
+        The stop list is cached for the train's service day (until a while
+        after its last stop) & shared by every station it stops at. Only
+        when the train is close to departing do we ask NJTransit again,
+        and then only the departed & status fields are updated.
+
+        :param train_id: NJTransit's train id
+        :param departure: when the train departs (from the station schedule)
+        :param now: the current time, for testing
+        """
+        if not self.stop_list_cache or cloudredis.REDIS_SERVER is None:
+            return self.train_stops(train_id).get(train_id)
+
+        if now is None:
+            now = pytz.utc.localize(datetime.utcnow())
+        service_date = NJTransitAPI.service_date(departure)
+        cached = cloudredis.train_stops(train_id, service_date)
+        if cached is not None and abs(departure - now) > self.stop_list_realtime:
+            return cached
+
+        fresh = self.train_stops(train_id).get(train_id)
+        if not fresh:
+            return cached
+        stops = fresh if cached is None else NJTransitAPI.refresh_stop_status(cached, fresh)
+
+        last_stop = max((details['time'] for stop in stops for details in stop.values()
+                         if details.get('time') is not None), default=None)
+        if last_stop is None:  # no times, nothing to say how long to keep it
+            return stops
+        seconds = (last_stop + self.stop_list_grace - now).total_seconds()
+        if seconds > 0:
+            cloudredis.cache_train_stops(train_id, service_date, stops, seconds)
+        return stops
+
     def station_schedule_with_stops(self, station_abbreviation: str, departure_time: datetime) -> list:
         """return the station schedule with the stops for each train"""
         station_schedule = self.station_schedule(station_abbreviation)
@@ -222,17 +394,16 @@ class NJTransitAPI:
         for train in station_schedule:
             # save some time by not fetching trains
             # that have already departed
-            if train['time'] < departure_time or train['departed'] == 'YES':
+            if train['departure'] < departure_time or train.get('departed') == 'YES':
                 continue
 
             # if the train is too far in future, ignore it as well
-            if train['time'] > departure_time + timedelta(hours=3):
+            if train['departure'] > departure_time + timedelta(hours=3):
                 continue
 
-            train_id = train['tid']
-            stop_list = self.train_stops(train_id)
+            stop_list = self.cached_train_stops(train['tid'], train['departure'])
             if stop_list:
-                train['stops'] = stop_list[train_id]
+                train['stops'] = stop_list
 
         return station_schedule
 
@@ -245,6 +416,18 @@ class NJTransitAPI:
             self.__train_stations = self.__fetch_train_stations()
         return self.__train_stations
 
+    @train_stations.setter
+    def train_stations(self, value: dict) -> None:
+        """use a station list we already have"""
+        self.__train_stations = value
+
+    @classmethod
+    def share_train_stations(cls, train_stations: dict) -> None:
+        """every NJTransitAPI object made after this uses this station list,
+        they don't fetch their own"""
+        cls.__train_stations = train_stations
+
+    @tracing.traced('NJTransitAPI.getStationListXML')
     def __fetch_train_stations(self) -> dict:
         """read the list of train stations. Format of XML is:
         <STATIONS>
@@ -267,27 +450,18 @@ class NJTransitAPI:
 
         body = "username={0}&password={1}".format(self.username, self.apikey)
         try:
-            rsp = requests.request(method='POST',
-                                   url=url,
-                                   headers={'content-type': 'application/x-www-form-urlencoded',
-                                            'Accept' : 'application/xml'},
-                                   data=body)
-            if rsp.status_code in (HTTPStatus.OK, HTTPStatus.CREATED):
-                root = ET.fromstring(rsp.content.decode('utf-8'))
-                station_stops = {}
-                for stations in root:
-                    abbreviation = None
-                    station_name = None
-                    for station in stations:
-                        if station.tag == 'STATION_2CHAR':
-                            abbreviation = station.text
-                        elif station.tag == 'STATIONNAME':
-                            station_name = station.text
-                    if abbreviation and station_name and '\n' not in station_name:
-                        station_stops.update({station_name: abbreviation})
-                        station_stops.update({abbreviation: station_name})
-
-                return station_stops
+            with metrics.UPSTREAM.call('getStationListXML') as call:
+                rsp = NJTransitAPI.post(url, body)
+                call.bytes = len(rsp.content)
+                call.lap('network')
+                if rsp.status_code in (HTTPStatus.OK, HTTPStatus.CREATED):
+                    response_data = parsers.PARSER.decode(rsp.content)
+                    call.lap('decode')
+                    station_stops = parsers.PARSER.station_list(response_data)
+                    call.items = len(station_stops) // 2
+                    call.lap('parse')
+
+                    return station_stops
 
         except requests.RequestException as err:
             raise
@@ -0,0 +1,203 @@
+#!/usr/bin/python
+"""a circuit breaker for the NJTransit web service
+
+Closed: calls go through, failures (errors, 5xx or calls slower than
+the latency threshold) are counted over a window. Too many and it
+opens. Open: calls fail fast with CircuitOpenError. Once the open
+period is over one caller (across all containers) gets to probe,
+half-open; if the probe works it closes, otherwise it opens again.
+State is in redis so every container sees the same breaker, or in
+process if there's no redis (or redis is failing).
+
+Nothing refreshes a station in the background while the breaker is
+open, a Lambda is frozen once it returns. Stations served stale are
+only queued, the scheduled pre-warmer drains the queue & its refresh
+is the probe."""
+import time
+import redis
+import requests
+from models import cloudredis
+from models.settings import setting
+
+
+class CircuitOpenError(requests.RequestException):
+    """the breaker is open, we didn't call NJTransit"""
+
+
+class LocalBreakerStore:
+    """breaker state for this process only"""
+
+    def __init__(self):
+        self.failures = []  # times of recent failures
+        self.opened_until = None
+        self.probe_until = 0.0
+
+    def opened(self):
+        return self.opened_until
+
+    def add_failure(self, now: float, window: float) -> int:
+        self.failures = [failed for failed in self.failures if failed > now - window]
+        self.failures.append(now)
+        return len(self.failures)
+
+    def open(self, until: float) -> None:
+        self.opened_until = until
+        self.failures = []
+
+    def close(self) -> None:
+        self.opened_until = None
+        self.failures = []
+        self.probe_until = 0.0
+
+    def claim_probe(self, now: float, seconds: float) -> bool:
+        if now < self.probe_until:
+            return False
+        self.probe_until = now + seconds
+        return True
+
+
+class RedisBreakerStore:
+    """breaker state shared by every container, the local
+    state is used for any call redis fails"""
+
+    def __init__(self, name: str, local: LocalBreakerStore):
+        self.name = name
+        self.local = local
+
+    def opened(self):
+        try:
+            return cloudredis.breaker_opened(self.name)
+        except redis.RedisError:
+            return self.local.opened()
+
+    def add_failure(self, now: float, window: float) -> int:
+        try:
+            return cloudredis.record_breaker_failure(self.name, int(window) or 1)
+        except redis.RedisError:
+            return self.local.add_failure(now, window)
+
+    def open(self, until: float) -> None:
+        self.local.open(until)
+        try:
+            cloudredis.open_breaker(self.name, until)
+        except redis.RedisError:
+            pass
+
+    def close(self) -> None:
+        self.local.close()
+        try:
+            cloudredis.close_breaker(self.name)
+        except redis.RedisError:
+            pass
+
+    def claim_probe(self, now: float, seconds: float) -> bool:
+        try:
+            return cloudredis.claim_breaker_probe(self.name, int(seconds) or 1)
+        except redis.RedisError:
+            return self.local.claim_probe(now, seconds)
+
+
+class CircuitBreaker:
+    """counts failures & decides if we should call NJTransit at all"""
+
+    def __init__(self, name: str, failures: int, window_seconds: float = 60,
+                 open_seconds: float = 30, slow_seconds: float = 3.0, clock=time.time):
+        """
+        :param name: what's protected, the redis key is based on it
+        :param failures: failures in the window that open the breaker, 0 turns it off
+        :param window_seconds: how long a failure counts against the service
+        :param open_seconds: how long to fail fast before probing
+        :param slow_seconds: a call slower than this counts as a failure
+        :param clock: returns the time in seconds, time.time unless testing
+        """
+        self.name = name
+        self.failures = failures
+        self.window_seconds = window_seconds
+        self.open_seconds = open_seconds
+        self.slow_seconds = slow_seconds
+        self.clock = clock
+        self.probing = False  # this process holds the half-open probe
+        self._local = LocalBreakerStore()
+
+    @property
+    def enabled(self) -> bool:
+        return self.failures > 0
+
+    @property
+    def store(self):
+        """redis if it's there, so the state is shared"""
+        if cloudredis.REDIS_SERVER is None:
+            return self._local
+        return RedisBreakerStore(self.name, self._local)
+
+    def state(self) -> str:
+        """'closed', 'open' or 'half-open' (open but due a probe)"""
+        opened_until = self.store.opened() if self.enabled else None
+        if opened_until is None:
+            return 'closed'
+        return 'open' if self.clock() < opened_until else 'half-open'
+
+    def allow(self) -> bool:
+        """True if the call should go ahead"""
+        if not self.enabled:
+            return True
+        store = self.store
+        opened_until = store.opened()
+        if opened_until is None:
+            return True
+        now = self.clock()
+        if now < opened_until:
+            return False
+        self.probing = store.claim_probe(now, self.open_seconds)
+        return self.probing
+
+    def success(self, seconds: float) -> None:
+        """the call worked, but may still have been too slow"""
+        if seconds > self.slow_seconds:
+            self.failure()
+        elif self.probing:
+            self.probing = False
+            self.store.close()
+
+    def failure(self) -> None:
+        store = self.store
+        now = self.clock()
+        if self.probing:
+            self.probing = False
+            store.open(now + self.open_seconds)
+        elif store.add_failure(now, self.window_seconds) >= self.failures:
+            store.open(now + self.open_seconds)
+
+    def call(self, func, *args, is_failure=None, **kwargs):
+        """call func through the breaker
+        :param is_failure: given the result, True if it counts as a failure
+        :raises CircuitOpenError: if the breaker is open
+        """
+        if not self.enabled:
+            return func(*args, **kwargs)
+        if not self.allow():
+            raise CircuitOpenError('{0} circuit is open'.format(self.name))
+
+        started = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        except requests.RequestException:
+            self.failure()
+            raise
+        if is_failure is not None and is_failure(result):
+            self.failure()
+        else:
+            self.success(time.perf_counter() - started)
+        return result
+
+
+def initialize_breaker() -> CircuitBreaker:
+    """the breaker for NJTransit, off unless BREAKER_FAILURES is set"""
+    return CircuitBreaker('njtransit',
+                          failures=int(setting('BREAKER_FAILURES', 0)),
+                          window_seconds=float(setting('BREAKER_WINDOW_SECONDS', 60.0)),
+                          open_seconds=float(setting('BREAKER_OPEN_SECONDS', 30.0)),
+                          slow_seconds=float(setting('BREAKER_SLOW_SECONDS', 3.0)))
+
+
+BREAKER = initialize_breaker()
@@ -0,0 +1,270 @@
+#!/usr/bin/python
+"""XML parser backends for NJTransit's responses
+
+Every backend turns the response body into the same structures as the
+NJTransitAPI.parse_* functions:
+    etree - ElementTree, build the tree then walk it (the original)
+    expat - streaming, the output is filled in from the tag events &
+            no tree (or decoded copy of the body) is built
+    lxml  - lxml's tree, if it's installed
+Selected by the XML_PARSER setting. All of them raise
+ElementTree's ParseError for bad XML, so callers don't care which
+one they have."""
+import abc
+import xml.etree.ElementTree as ET
+from xml.parsers import expat
+from models.settings import setting
+
+try:
+    from lxml import etree as lxml_etree
+except ImportError:  # pragma: no cover
+    lxml_etree = None
+
+DEFAULT_BACKEND = 'etree'
+
+
+def api():
+    """NJTransitAPI, imported when needed since it imports us"""
+    from njtransit.api import NJTransitAPI
+    return NJTransitAPI
+
+
+class ElementTreeBackend:
+    """parse into an ElementTree & walk it"""
+    name = 'etree'
+
+    @staticmethod
+    def decode(content: bytes):
+        return content.decode('utf-8')
+
+    @staticmethod
+    def root(data):
+        return ET.fromstring(data)
+
+    def train_schedule(self, data) -> list:
+        return api().parse_train_schedule(self.root(data))
+
+    def station_schedule(self, data) -> list:
+        return api().parse_station_schedule(self.root(data))
+
+    def station_list(self, data) -> dict:
+        return api().parse_station_list(self.root(data))
+
+
+class LxmlBackend(ElementTreeBackend):
+    """lxml's tree has the same interface, it wants bytes not a str"""
+    name = 'lxml'
+
+    @staticmethod
+    def decode(content: bytes):
+        return content
+
+    @staticmethod
+    def root(data):
+        try:
+            return lxml_etree.fromstring(data)
+        except lxml_etree.XMLSyntaxError as err:
+            raise ET.ParseError(str(err))
+
+
+class _Handler(abc.ABC):
+    """collects the text of each element & tracks where we are"""
+
+    def __init__(self):
+        self.path = []  # tags of the open elements
+        self._text = []
+
+    def start(self, tag: str, attributes) -> None:
+        self.path.append(tag)
+        self._text = []
+        self.started(tag)
+
+    def characters(self, data: str) -> None:
+        self._text.append(data)
+
+    def end(self, tag: str) -> None:
+        # like ElementTree's .text for the elements we read, which have no children
+        text = ''.join(self._text) if self._text else None
+        self._text = []
+        self.path.pop()
+        self.ended(tag, text, self.path[-1] if self.path else None)
+
+    def started(self, tag: str) -> None:
+        pass
+
+    def ended(self, tag: str, text: str, parent: str) -> None:
+        pass
+
+    def parse(self, data: bytes):
+        parser = expat.ParserCreate()
+        parser.buffer_text = True
+        parser.StartElementHandler = self.start
+        parser.EndElementHandler = self.end
+        parser.CharacterDataHandler = self.characters
+        try:
+            parser.Parse(data, True)
+        except expat.ExpatError as err:
+            raise ET.ParseError(str(err))
+        return self.result()
+
+    @abc.abstractmethod
+    def result(self):
+        """what was parsed, in the same shape as the ElementTree parser returns"""
+
+
+class _TrainScheduleHandler(_Handler):
+    """same output as NJTransitAPI.parse_train_schedule: a train is kept once
+    its ITEM has all of TRAIN_ID, DESTINATION, SCHED_DEP_DATE & ITEM_INDEX"""
+
+    def __init__(self):
+        super().__init__()
+        self.to_ET = api().to_ET
+        self.trains = []
+        self.train = None
+        self.stops = None
+        self.stop = None
+        self.station_name = None
+
+    def started(self, tag: str) -> None:
+        if tag == 'ITEM':
+            self.train = {}
+            self.stops = {}
+        elif tag == 'STOP' and self.train is not None:
+            self.stop = {}
+            self.station_name = None
+
+    def ended(self, tag: str, text: str, parent: str) -> None:
+        if parent == 'STOP' and self.stop is not None:
+            if tag == 'NAME':
+                self.station_name = text
+            elif tag == 'TIME':
+                if text is not None:
+                    self.stop['time'] = self.to_ET(text)
+            elif tag == 'STOP_STATUS':
+                self.stop['status'] = text
+            elif tag == 'DEPARTED':
+                self.stop['departed'] = (text == 'YES')
+        elif parent == 'ITEM' and self.train is not None and not self.complete():
+            if tag == 'TRAIN_ID':
+                self.train['tid'] = text
+            elif tag == 'DESTINATION':
+                self.train['destination'] = text
+            elif tag == 'SCHED_DEP_DATE':
+                self.train['departure'] = self.to_ET(text)
+            elif tag == 'ITEM_INDEX':
+                self.train['index'] = int(text)
+        elif tag == 'STOP' and self.stop is not None:
+            self.stops[self.station_name] = self.stop
+            self.stop = None
+        elif tag == 'ITEM' and self.train is not None:
+            if self.complete():
+                self.train['stops'] = self.stops
+                self.trains.append(self.train)
+            self.train = None
+
+    def complete(self) -> bool:
+        return len(self.train) == 4
+
+    def result(self) -> list:
+        return self.trains
+
+
+class _StationScheduleHandler(_Handler):
+    """same output as NJTransitAPI.parse_station_schedule"""
+
+    def __init__(self):
+        super().__init__()
+        self.to_ET = api().to_ET
+        self.trains = []
+        self.train = None
+
+    def started(self, tag: str) -> None:
+        if tag == 'ITEM':
+            self.train = {'tid': None, 'destination': None, 'departure': None, 'index': None}
+
+    def ended(self, tag: str, text: str, parent: str) -> None:
+        if parent == 'ITEM' and self.train is not None:
+            if all(self.train.values()):  # got what we came for
+                return
+            if tag == 'TRAIN_ID':
+                self.train['tid'] = text
+            elif tag == 'DESTINATION':
+                self.train['destination'] = text
+            elif tag == 'SCHED_DEP_DATE':
+                self.train['departure'] = self.to_ET(text)
+            elif tag == 'ITEM_INDEX':
+                self.train['index'] = int(text)
+        elif tag == 'ITEM' and self.train is not None:
+            self.trains.append(self.train)
+            self.train = None
+
+    def result(self) -> list:
+        return self.trains
+
+
+class _StationListHandler(_Handler):
+    """same output as NJTransitAPI.parse_station_list"""
+
+    def __init__(self):
+        super().__init__()
+        self.stations = {}
+        self.abbreviation = None
+        self.station_name = None
+
+    def started(self, tag: str) -> None:
+        if len(self.path) == 2:  # a child of the root
+            self.abbreviation = None
+            self.station_name = None
+
+    def ended(self, tag: str, text: str, parent: str) -> None:
+        parent_depth = len(self.path)
+        if parent_depth == 2:
+            if tag == 'STATION_2CHAR':
+                self.abbreviation = text
+            elif tag == 'STATIONNAME':
+                self.station_name = text
+        elif parent_depth == 1:
+            if self.abbreviation and self.station_name and '\n' not in self.station_name:
+                self.stations[self.station_name] = self.abbreviation
+                self.stations[self.abbreviation] = self.station_name
+
+    def result(self) -> dict:
+        return self.stations
+
+
+class ExpatBackend:
+    """stream the tag events straight into the output"""
+    name = 'expat'
+
+    @staticmethod
+    def decode(content: bytes):
+        return content  # expat reads the encoding from the XML declaration
+
+    @staticmethod
+    def train_schedule(data) -> list:
+        return _TrainScheduleHandler().parse(data)
+
+    @staticmethod
+    def station_schedule(data) -> list:
+        return _StationScheduleHandler().parse(data)
+
+    @staticmethod
+    def station_list(data) -> dict:
+        return _StationListHandler().parse(data)
+
+
+BACKENDS = {'etree': ElementTreeBackend, 'expat': ExpatBackend}
+if lxml_etree is not None:
+    BACKENDS['lxml'] = LxmlBackend
+
+
+def get_backend(name: str = None):
+    """the named backend, the default if it's unknown (or lxml isn't installed)
+    :param name: defaults to the XML_PARSER setting
+    """
+    if name is None:
+        name = setting('XML_PARSER', DEFAULT_BACKEND)
+    return BACKENDS.get(name, BACKENDS[DEFAULT_BACKEND])()
+
+
+PARSER = get_backend()
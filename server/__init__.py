@@ -0,0 +1 @@
+"""a long running HTTP service on top of the train scheduler"""
@@ -0,0 +1,341 @@
+#!/usr/bin/python
+"""a long running HTTP service for our internal tools, the same
+scheduling as the Alexa skill without the Lambda cold path
+
+    GET /next-train?from=CM&to=NY[&time=2018-12-08T09:00:00-05:00]
+        the best route
+    GET /next-trains?from=CM&to=NY[&count=2][&time=...]
+        the best few routes, by when they arrive
+    GET /route?from=Chatham&to=New York[&time=...]
+        every direct & indirect route
+    GET /health
+
+Stations can be abbreviations or names (resolved like Alexa's slots).
+Instead of 'from', '&lat=40.98&lon=-74.13' starts at the nearest station.
+Each worker process runs an asyncio server on the shared listening
+socket, the scheduling (which blocks on NJTransit & redis) runs in a
+thread pool. Train schedules are kept in memory for a few seconds, in
+front of redis, and the NJTransit session & redis pool are per process.
+With more than one worker the parent compiles the GTFS timetable into
+shared memory & the workers attach to it, rather than each parsing it.
+
+run from the project root:  python -m server.service --port 8080 --workers 4
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import re
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http import HTTPStatus
+from urllib.parse import urlsplit, parse_qs
+import pytz
+import requests
+from controllers import train_scheduler
+from gtfs import timetable, shared_timetable
+from models import cloudredis
+from models.settings import setting
+
+DEFAULT_PORT = 8080
+MAX_HEADER_BYTES = 16 * 1024
+MAX_NEXT_TRAINS = 10
+
+
+class MemoryBoardCache:
+    """train schedules shared by every request in the process"""
+
+    def __init__(self):
+        self._boards = {}  # abbreviation -> (expires, trains)
+        self._lock = threading.Lock()
+
+    def get(self, station_abbreviation: str) -> list:
+        """the trains, None if not cached or expired"""
+        with self._lock:
+            cached = self._boards.get(station_abbreviation)
+        if cached is None or cached[0] < time.monotonic():
+            return None
+        return cached[1]
+
+    def put(self, station_abbreviation: str, trains: list, seconds: float) -> None:
+        with self._lock:
+            self._boards[station_abbreviation] = (time.monotonic() + seconds, trains)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._boards = {}
+
+
+BOARDS = MemoryBoardCache()
+
+
+class ServiceSchedule(train_scheduler.TrainSchedule):
+    """a TrainSchedule that checks the process's memory before redis"""
+    memory_cache_seconds = float(setting('SERVICE_CACHE_SECONDS', 15.0))
+    station_list = None  # fetched by the first request, shared by the rest
+
+    def __init__(self):
+        super().__init__()
+        if ServiceSchedule.station_list:
+            self.njt.train_stations = ServiceSchedule.station_list
+        else:
+            ServiceSchedule.station_list = self.njt.train_stations
+
+    def train_schedule(self, station_abbreviation: str,
+                       test_argument: str = None) -> list:
+        trains = BOARDS.get(station_abbreviation)
+        if trains is None:
+            trains = super().train_schedule(station_abbreviation, test_argument)
+            if trains and not self.stale_stations:
+                BOARDS.put(station_abbreviation, trains, self.memory_cache_seconds)
+        return trains
+
+
+class BadRequest(ValueError):
+    """the query can't be answered, tell the caller why"""
+
+
+def to_json(value):
+    """json.dumps default, our times are datetimes"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(repr(value))
+
+
+def parse_time(value: str) -> datetime:
+    """an ISO 8601 time with its UTC offset, or 'Z'. An unescaped '+' in
+    the query string arrives as a space, '09:00:00 01:00' is '+01:00'"""
+    value = re.sub(r'Z$', '+0000', value)
+    value = re.sub(r' (\d\d:?\d\d)$', r'+\1', value)
+    try:
+        return datetime.strptime(value.replace(':', ''), '%Y-%m-%dT%H%M%S%z')
+    except ValueError:
+        raise BadRequest("'time' should look like 2018-12-08T09:00:00-05:00")
+
+
+def nearest_station(tso: ServiceSchedule, params: dict) -> str:
+    """the station nearest the 'lat' & 'lon' parameters"""
+    try:
+        latitude, longitude = float(params['lat']), float(params['lon'])
+    except ValueError:
+        raise BadRequest("'lat' & 'lon' should be decimal degrees")
+    station = tso.nearest_station(latitude, longitude)
+    if station is None:
+        raise BadRequest("there's no station near {0}, {1}".format(latitude, longitude))
+    return station
+
+
+def query_stations(tso: ServiceSchedule, params: dict) -> tuple:
+    """the start & destination abbreviations & the departure time"""
+    if 'from' not in params and 'lat' in params and 'lon' in params:
+        params = dict(params, **{'from': nearest_station(tso, params)})
+    stations = []
+    for name in ('from', 'to'):
+        if name not in params:
+            raise BadRequest("'{0}' is required".format(name))
+        station = tso.resolve_station_name(params[name])
+        if station is None:
+            raise BadRequest("'{0}' is not a recognized station".format(params[name]))
+        stations.append(tso.train_stations(station))  # the abbreviation
+    if stations[0] == stations[1]:
+        raise BadRequest("'from' and 'to' are the same station")
+
+    if 'time' in params:
+        departure_time = parse_time(params['time'])
+    else:
+        departure_time = pytz.utc.localize(datetime.utcnow())
+    return stations[0], stations[1], departure_time
+
+
+def routes(params: dict) -> dict:
+    """every route between the stations"""
+    tso = ServiceSchedule()
+    start, end, departure_time = query_stations(tso, params)
+    found = tso.schedule(start, end, departure_time=departure_time)
+    found.update({'from': tso.train_stations(start), 'to': tso.train_stations(end),
+                  'time': departure_time})
+    return found
+
+
+def next_train(params: dict) -> dict:
+    """the best route between the stations"""
+    tso = ServiceSchedule()
+    start, end, departure_time = query_stations(tso, params)
+    found = tso.schedule(start, end, departure_time=departure_time)
+    start_name = tso.train_stations(start)
+    end_name = tso.train_stations(end)
+    best = tso.best_route(start_name, end_name, found)
+    best.update({'from': start_name, 'to': end_name, 'time': departure_time,
+                 'stale': found.get('stale', False)})
+    return best
+
+
+def next_trains(params: dict) -> dict:
+    """the best few routes between the stations, best first"""
+    try:
+        count = int(params.get('count', 2))
+    except ValueError:
+        raise BadRequest("'count' should be a number")
+    if not 0 < count <= MAX_NEXT_TRAINS:
+        raise BadRequest("'count' should be from 1 to {0}".format(MAX_NEXT_TRAINS))
+    tso = ServiceSchedule()
+    start, end, departure_time = query_stations(tso, params)
+    found = tso.schedule(start, end, departure_time=departure_time)
+    start_name = tso.train_stations(start)
+    end_name = tso.train_stations(end)
+    return {'routes': tso.best_routes(start_name, end_name, found, count),
+            'from': start_name, 'to': end_name, 'time': departure_time,
+            'stale': found.get('stale', False)}
+
+
+ROUTES = {
+    '/next-train': next_train,
+    '/next-trains': next_trains,
+    '/route': routes,
+    '/health': lambda params: {'status': 'ok'},
+}
+
+
+def handle(method: str, target: str) -> tuple:
+    """answer one request
+    :return: (status, json body)
+    """
+    if method != 'GET':
+        return HTTPStatus.METHOD_NOT_ALLOWED, {'error': 'only GET is supported'}
+    url = urlsplit(target)
+    handler = ROUTES.get(url.path)
+    if handler is None:
+        return HTTPStatus.NOT_FOUND, {'error': 'no such endpoint {0}'.format(url.path)}
+    params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+    try:
+        return HTTPStatus.OK, handler(params)
+    except BadRequest as err:
+        return HTTPStatus.BAD_REQUEST, {'error': str(err)}
+    except requests.RequestException as err:
+        return HTTPStatus.SERVICE_UNAVAILABLE, {'error': 'NJTransit: {0}'.format(err)}
+
+
+class HTTPService:
+    """a minimal HTTP/1.1 server (GET, keep-alive) on asyncio streams"""
+
+    def __init__(self, threads: int = 8):
+        self.executor = ThreadPoolExecutor(max_workers=threads)
+
+    async def serve_connection(self, reader: asyncio.StreamReader,
+                               writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                        ConnectionError):
+                    break
+                lines = head.decode('latin-1').split('\r\n')
+                request_line = lines[0].split()
+                headers = {}
+                for line in lines[1:]:
+                    if ':' in line:
+                        name, value = line.split(':', 1)
+                        headers[name.strip().lower()] = value.strip()
+                if len(request_line) != 3:
+                    await self.respond(writer, HTTPStatus.BAD_REQUEST,
+                                       {'error': 'bad request line'}, False)
+                    break
+                method, target, version = request_line
+                keep_alive = headers.get('connection', '').lower() != 'close' and \
+                    version == 'HTTP/1.1'
+                loop = asyncio.get_event_loop()
+                status, body = await loop.run_in_executor(self.executor, handle,
+                                                          method, target)
+                await self.respond(writer, status, body, keep_alive)
+                if not keep_alive:
+                    break
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def respond(writer: asyncio.StreamWriter, status: HTTPStatus, body: dict,
+                      keep_alive: bool) -> None:
+        payload = json.dumps(body, default=to_json).encode('utf-8')
+        writer.write('HTTP/1.1 {0} {1}\r\nContent-Type: application/json\r\n'
+                     'Content-Length: {2}\r\nConnection: {3}\r\n\r\n'.
+                     format(status.value, status.phrase, len(payload),
+                            'keep-alive' if keep_alive else 'close').encode('latin-1'))
+        writer.write(payload)
+        await writer.drain()
+
+    async def start(self, sock: socket.socket):
+        """serve on an already listening socket"""
+        return await asyncio.start_server(self.serve_connection, sock=sock,
+                                          limit=MAX_HEADER_BYTES)
+
+
+def listen(host: str, port: int) -> socket.socket:
+    """the listening socket, made before the workers so they all share it"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(128)
+    sock.setblocking(False)
+    return sock
+
+
+def run_worker(sock: socket.socket, threads: int, timetable_name: str = None) -> None:
+    """one worker process: its own redis pool, NJTransit session & event loop
+    :param timetable_name: the parent's shared timetable image, if there is one
+    """
+    cloudredis.REDIS_SERVER = None  # never share a connection across a fork
+    if timetable_name is not None:
+        shared_timetable.attach_timetable(timetable_name)
+    cloudredis.initialize_cloud_redis()
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    server = loop.run_until_complete(HTTPService(threads).start(sock))
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        loop.run_until_complete(server.wait_closed())
+        loop.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Jersey Trains HTTP service')
+    parser.add_argument('--host', default=setting('SERVICE_HOST', '127.0.0.1'))
+    parser.add_argument('--port', type=int, default=int(setting('SERVICE_PORT', DEFAULT_PORT)))
+    parser.add_argument('--workers', type=int, default=int(setting('SERVICE_WORKERS', 1)),
+                        help='worker processes')
+    parser.add_argument('--threads', type=int, default=8,
+                        help='scheduling threads per worker')
+    arguments = parser.parse_args()
+
+    sock = listen(arguments.host, arguments.port)
+    if arguments.workers <= 1:
+        run_worker(sock, arguments.threads)
+        return
+
+    # parse the timetable once, the workers share the compiled arrays
+    image = shared_timetable.TimetableImage(timetable.initialize_timetable())
+    timetable.TIMETABLE = None  # the parent doesn't need its own copy
+    context = multiprocessing.get_context('fork')
+    workers = [context.Process(target=run_worker, args=(sock, arguments.threads, image.name))
+               for _ in range(arguments.workers)]
+    for worker in workers:
+        worker.start()
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        for worker in workers:
+            worker.terminate()
+    finally:
+        image.unlink()
+
+
+if __name__ == '__main__':
+    main()
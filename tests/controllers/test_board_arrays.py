@@ -0,0 +1,76 @@
+#!/usr/bin/python
+"""the NumPy candidate selection picks the same trains as the loop"""
+from unittest import TestCase, skipIf
+import os
+import xml.etree.ElementTree as ET
+from datetime import timedelta
+from controllers import board_arrays, train_scheduler
+from njtransit.api import NJTransitAPI
+
+
+@skipIf(not board_arrays.available(), 'NumPy is not installed')
+class TestBoardArrays(TestCase):
+    """compare the vectorized selection against TrainSchedule.select_candidates"""
+
+    @staticmethod
+    def read_board(filename: str) -> list:
+        """parse one of our canned real-time train schedules"""
+        cwd = os.getcwd().replace('\\', '/')
+        root = cwd.split('/tests')[0]
+        tree = ET.parse(root + '/tests/data/' + filename)
+        return NJTransitAPI.parse_train_schedule(tree.getroot())
+
+    @staticmethod
+    def departure_times(trains: list) -> list:
+        """from before the first train leaves to after the last"""
+        first = min(train['departure'] for train in trains)
+        last = max(train['departure'] for train in trains)
+        times = []
+        current = first - timedelta(minutes=1)
+        while current <= last + timedelta(minutes=1):
+            times.append(current)
+            current += timedelta(minutes=10)
+        return times
+
+    def test_select_candidates(self):
+        for filename, start, end in (('CM_train_schedule.xml', 'Chatham', 'New York'),
+                                     ('CM_train_schedule.xml', 'Chatham', 'Dover'),
+                                     ('NY_train_schedule.xml', 'New York', 'Chatham'),
+                                     ('NY_train_schedule.xml', 'New York', 'Trenton')):
+            trains = TestBoardArrays.read_board(filename)
+            board = board_arrays.BoardArrays(trains)
+            for departure_time in TestBoardArrays.departure_times(trains):
+                expected = train_scheduler.TrainSchedule.select_candidates(trains, start, end,
+                                                                           departure_time)
+                actual = board_arrays.select_candidates(board, start, end, departure_time)
+                assert actual == expected
+
+    def test_select_transfers(self):
+        trains = TestBoardArrays.read_board('NY_train_schedule.xml')
+        board = board_arrays.BoardArrays(trains)
+        for departure_time in TestBoardArrays.departure_times(trains):
+            expected = [train for train in trains
+                        if 'Chatham' not in train['stops'] and
+                        train['stops']['New York']['time'] > departure_time]
+            assert board_arrays.select_transfers(board, 'Chatham', 'New York',
+                                                 departure_time) == expected
+
+    def test_unknown_station(self):
+        """nobody stops there, nothing is direct & everything is possibly indirect"""
+        trains = TestBoardArrays.read_board('CM_train_schedule.xml')
+        board = board_arrays.BoardArrays(trains)
+        departure_time = min(train['departure'] for train in trains)
+        direct, indirect = board_arrays.select_candidates(board, 'Chatham', 'Nowhere',
+                                                          departure_time)
+        assert not direct
+        assert indirect == [train for train in trains if 'Chatham' in train['stops'] and
+                            train['stops']['Chatham']['time'] >= departure_time]
+
+    def test_arrays_built_once(self):
+        trains = TestBoardArrays.read_board('CM_train_schedule.xml')
+        scheduler = train_scheduler.TrainSchedule(vectorized=True)
+        assert scheduler.vectorized
+        board = scheduler.arrays_for(trains)
+        assert scheduler.arrays_for(trains) is board
+        assert board.times('Chatham') is board.times('Chatham')
+        assert len(board) == len(trains)
@@ -0,0 +1,196 @@
+#!/usr/bin/python
+"""tests for the nightly precomputed answers"""
+import json
+import os
+from datetime import date, datetime, timedelta
+from unittest import mock
+import xml.etree.ElementTree as ET
+import responses
+import lambda_function
+from controllers import precompute, train_scheduler
+from models import cloudredis, metrics
+from njtransit.api import NJTransitAPI
+from tests.setupmocking import TestwithMocking
+
+
+class TestPrecompute(TestwithMocking):
+    """encapsulates our precomputed answer tests"""
+    SERVICE_DATE = date(2019, 1, 15)
+
+    @staticmethod
+    def read_data(filename: str) -> bytes:
+        cwd = os.getcwd().replace('\\', '/')
+        root = cwd.split('/tests')[0]
+        path_n_name = root + '/tests/data/' + filename
+        with open(path_n_name, mode='rb') as file_pointer:
+            return file_pointer.read()
+
+    def setUp(self):
+        super().setUp()
+        stations = NJTransitAPI.parse_station_list(
+            ET.fromstring(TestPrecompute.read_data('train_stations.xml')))
+        NJTransitAPI.share_train_stations(stations)
+
+    def tearDown(self):
+        NJTransitAPI.share_train_stations({})
+        super().tearDown()
+
+    @staticmethod
+    def eastern(hour: int, minute: int) -> datetime:
+        return precompute.TIMEZONE.localize(datetime(2019, 1, 15, hour, minute))
+
+    def test_top_routes(self):
+        for route in [('CM', 'NY'), ('CM', 'NY'), ('SO', 'HB')]:
+            cloudredis.record_route_request(*route)
+        for station in ['Chatham', 'Chatham', 'Summit']:
+            cloudredis.record_home_station(station)
+        stations = NJTransitAPI._NJTransitAPI__train_stations
+        assert precompute.top_routes(stations, 2) == [('CM', 'NY'), ('SO', 'HB')]
+        routes = precompute.top_routes(stations, 5)
+        assert routes[:2] == [('CM', 'NY'), ('SO', 'HB')]
+        assert routes[2:] == [('CM', 'NP'), ('CM', 'HB'), ('ST', 'NY')]
+
+    def test_answers_match_schedule(self):
+        """each answer is the best route the scheduler finds with the whole day's trains"""
+        precomputer = precompute.RoutePrecomputer()
+        answers = precomputer.answers('CM', 'NY', self.SERVICE_DATE)
+        assert len(answers) > 20
+        departures = [departure_time for departure_time, _ in answers]
+        assert departures == sorted(departures)
+
+        tso = train_scheduler.TrainSchedule(offline=False, vectorized=False)
+        for departure_time, best in answers[::10]:
+            tso.boards = {station: precomputer.board(station, self.SERVICE_DATE).trains
+                          for station in ('CM', 'NY')}
+            expected = tso.best_route('Chatham', 'New York',
+                                      tso.schedule('CM', 'NY', departure_time,
+                                                   record_traffic=False))
+            assert best == expected
+
+    def test_lookup(self):
+        precomputer = precompute.RoutePrecomputer()
+        assert precomputer.store('CM', 'NY', self.SERVICE_DATE) > 20
+
+        route = precompute.lookup('CM', 'NY', self.eastern(8, 1))
+        train = route['direct']
+        assert train['stops']['Chatham']['time'] >= self.eastern(8, 1)
+        assert train['stops']['Chatham']['status'] == 'Scheduled'
+
+        # the same answer until that train leaves
+        leaves = train['stops']['Chatham']['time']
+        assert precompute.lookup('CM', 'NY', leaves) == route
+        later = precompute.lookup('CM', 'NY', leaves + timedelta(seconds=1))
+        assert later['direct']['stops']['Chatham']['time'] > leaves
+
+        assert precompute.lookup('NY', 'CM', self.eastern(8, 1)) is None
+
+    def test_replace_answers(self):
+        """the next night's run drops the previous day's answers"""
+        precomputer = precompute.RoutePrecomputer()
+        first = precomputer.store('CM', 'NY', self.SERVICE_DATE)
+        second = precomputer.store('CM', 'NY', self.SERVICE_DATE + timedelta(days=1))
+        key = cloudredis.answers_key('CM', 'NY')
+        assert cloudredis.REDIS_SERVER.zcard(key) == second
+        assert first and cloudredis.REDIS_SERVER.ttl(key) > 0
+
+    def test_rerun(self):
+        """running the same day again replaces its answers, it doesn't add to them"""
+        precomputer = precompute.RoutePrecomputer()
+        stored = precomputer.store('CM', 'NY', self.SERVICE_DATE)
+        encode = precompute.encode_answer
+        with mock.patch.object(precompute, 'encode_answer',
+                               lambda best, names: encode(best, names) + b' '):
+            assert precomputer.store('CM', 'NY', self.SERVICE_DATE) == stored
+        key = cloudredis.answers_key('CM', 'NY')
+        assert cloudredis.REDIS_SERVER.zcard(key) == stored
+
+    def test_overlay(self):
+        """the cached real-time board has the current times"""
+        precomputer = precompute.RoutePrecomputer()
+        precomputer.store('CM', 'NY', self.SERVICE_DATE)
+        train = precompute.lookup('CM', 'NY', self.eastern(8, 1))['direct']
+
+        late = {'tid': train['tid'], 'departure': train['stops']['Chatham']['time'],
+                'stops': {'Chatham': {'time': train['stops']['Chatham']['time'] +
+                                      timedelta(minutes=10),
+                                      'status': 'Late', 'departed': False}}}
+        cloudredis.cache_train_schedule('CM', [late], 60)
+        overlaid = precompute.lookup('CM', 'NY', self.eastern(8, 1))['direct']
+        assert overlaid['stops']['Chatham']['time'] == late['stops']['Chatham']['time']
+        assert overlaid['stops']['Chatham']['status'] == 'Late'
+        assert overlaid['stops']['New York'] == train['stops']['New York']
+
+    def test_indirect(self):
+        precomputer = precompute.RoutePrecomputer()
+        answers = precomputer.answers('CM', 'TR', self.SERVICE_DATE)
+        indirect = [best['indirect'] for _, best in answers if 'indirect' in best]
+        assert indirect
+        for route in indirect:
+            # the transfer is after we leave, & the connection after that
+            leaves = route['start']['stops']['Chatham']['time']
+            reaches = route['start']['stops'][route['station']]['time']
+            assert leaves < reaches < route['transfer']['stops'][route['station']]['time']
+
+        precomputer.store('CM', 'TR', self.SERVICE_DATE)
+        departure_time = answers[0][0]
+        decoded = precompute.lookup('CM', 'TR', departure_time)
+        best = answers[0][1]
+        kind = 'direct' if 'direct' in best else 'indirect'
+        assert list(decoded) == [kind]
+
+    def test_walking_transfer(self):
+        """Fair Lawn to Hawthorne changes lines by walking between the Glen Rock stations"""
+        precomputer = precompute.RoutePrecomputer()
+        answers = precomputer.answers('BF', 'HW', self.SERVICE_DATE)
+        walks = [(departure_time, best['indirect']) for departure_time, best in answers
+                 if 'indirect' in best and best['indirect'].get('walk_to')]
+        assert walks
+        departure_time, route = walks[0]
+        assert (route['station'], route['walk_to']) == ('Glen Rock Boro', 'Glen Rock Main')
+        assert route['start']['stops']['Glen Rock Boro']['time'] + timedelta(minutes=5) <= \
+            route['transfer']['stops']['Glen Rock Main']['time']
+
+        precomputer.store('BF', 'HW', self.SERVICE_DATE)
+        decoded = precompute.lookup('BF', 'HW', departure_time)['indirect']
+        assert decoded['walk_to'] == 'Glen Rock Main'
+        assert 'Glen Rock Main' in decoded['transfer']['stops']
+
+        speech = lambda_function.next_train_response('Broadway-Fl', 'Hawthorne',
+                                                     {'indirect': decoded})
+        assert speech['response']['outputSpeech']['text'].endswith(
+            'changing at Glen Rock Boro & walking to Glen Rock Main')
+
+    @responses.activate
+    def test_next_train(self):
+        """a precomputed route is answered without asking NJTransit for a schedule"""
+        precompute.RoutePrecomputer().store('CM', 'NY', self.SERVICE_DATE)
+        cloudredis.REDIS_SERVER.set(cloudredis.home_key('bogus_user_id'), 'Chatham')
+        event = {"request": {"type": "IntentRequest",
+                             "intent": {"name": "NextTrain", "time": self.eastern(8, 1),
+                                        "slots": {"station": {"value": "New York"}}}},
+                 "session": {"new": False, "user": {"userId": "bogus_user_id"}}}
+        lines = []
+        metrics.EMF.reset()  # the lookups of earlier tests
+        with mock.patch.dict(os.environ, {'PRECOMPUTE_ROUTES': '10', 'EMF_METRICS': 'true'}), \
+                mock.patch.object(metrics.EMF, 'write', lines.append):
+            response = lambda_function.lambda_handler(event=event, context=None)
+        assert response['response']['outputSpeech']['ssml'].startswith(
+            '<speak>The next train from Chatham to New York will leave at 8:')
+        assert json.loads(lines[0])['Cache.precomputed.Hit'] == 1
+        assert cloudredis.top_routes(1) == [('CM', 'NY')]
+
+    def test_nightly_event(self):
+        cloudredis.record_route_request('CM', 'NY')
+        event = {'source': 'aws.events', 'detail-type': 'Scheduled Event',
+                 'detail': {'job': 'precompute'}}
+        with mock.patch.dict(os.environ, {'PRECOMPUTE_ROUTES': '1'}):
+            with mock.patch.object(precompute, 'datetime') as clock:
+                clock.now.return_value = self.eastern(0, 0)
+                response = lambda_function.lambda_handler(event=event, context=None)
+        assert response['precomputed']['CM_NY'] > 20
+
+    def test_no_service(self):
+        """nothing is precomputed for a day the timetable doesn't cover"""
+        cloudredis.record_route_request('CM', 'NY')
+        assert precompute.precompute(count=1, service_date=date(2030, 1, 15)) == {}
+        assert not cloudredis.REDIS_SERVER.exists(cloudredis.answers_key('CM', 'NY'))
@@ -0,0 +1,109 @@
+#!/usr/bin/python
+"""tests for the Lambda init phase preloader"""
+import gc
+import json
+import os
+from http import HTTPStatus
+import requests
+import responses
+import lambda_function
+from controllers import preloader, station_names
+from gtfs import timetable
+from models import setuplogging
+from njtransit import api
+from configuration import config
+from tests.setupmocking import TestwithMocking
+
+
+class TestPreloader(TestwithMocking):
+    """encapsulates our preloader tests"""
+
+    @staticmethod
+    def read_data(filename: str) -> bytes:
+        cwd = os.getcwd().replace('\\', '/')
+        root = cwd.split('/tests')[0]
+        path_n_name = root + '/tests/data/' + filename
+        with open(path_n_name, mode='rb') as file_pointer:
+            return file_pointer.read()
+
+    def setUp(self):
+        super().setUp()
+        self.logged = []
+        self.handler = setuplogging.LOGGING_HANDLER
+        setuplogging.LOGGING_HANDLER = self.logged.append
+
+    def tearDown(self):
+        setuplogging.LOGGING_HANDLER = self.handler
+        api.NJTransitAPI.share_train_stations({})
+        preloader.initialize_preloader(enabled=False)
+        if hasattr(gc, 'unfreeze'):
+            gc.unfreeze()
+        super().tearDown()
+
+    @staticmethod
+    def mock_station_list():
+        url = config.HOSTNAME + "/NJTTrainData.asmx/getStationListXML"
+        responses.add(responses.POST, url, body=TestPreloader.read_data('train_stations.xml'),
+                      status=HTTPStatus.CREATED)
+
+    def test_off_by_default(self):
+        loader = preloader.initialize_preloader()
+        assert not loader.preloaded
+        assert loader.steps == {}
+
+    @responses.activate
+    def test_run(self):
+        TestPreloader.mock_station_list()
+        loader = preloader.initialize_preloader(enabled=True)
+        assert loader.preloaded
+        assert not loader.failed
+        assert list(loader.steps) == ['redis', 'station_list', 'timetable',
+                                      'station_index', 'transfer_table', 'station_grid',
+                                      'freeze']
+        assert timetable.TIMETABLE is not None
+        assert station_names.STATION_INDEX is not None
+        if hasattr(gc, 'freeze'):
+            assert loader.frozen > 0
+
+        # later NJTransitAPI objects use the station list we fetched
+        assert api.NJTransitAPI().train_stations['CM'] == 'Chatham'
+        assert len(responses.calls) == 1
+
+    @responses.activate
+    def test_njtransit_down(self):
+        """the import mustn't fail, the first request will try again"""
+        responses.add(responses.POST, config.HOSTNAME + "/NJTTrainData.asmx/getStationListXML",
+                      body=requests.ConnectionError('NJTransit is down'))
+        loader = preloader.initialize_preloader(enabled=True)
+        assert loader.preloaded
+        assert 'station_list' in loader.failed
+        assert 'station_index' not in loader.steps
+
+    def test_report_once(self):
+        ticks = iter([0.0, 0.5, 1.0, 1.25])
+        loader = preloader.Preloader(clock=lambda: next(ticks))
+        loader.step('first', lambda: None)
+        loader.step('second', lambda: None)
+        loader.log(self.logged.append)
+        assert not self.logged  # nothing until the first request has finished
+
+        loader.request_finished(0.125)
+        loader.request_finished(5.0)
+        loader.log(self.logged.append)
+        loader.log(self.logged.append)
+        assert len(self.logged) == 1
+        report = json.loads(self.logged[0][len('[INIT]: '):])
+        assert report['init'] == {'first': 0.5, 'second': 0.25}
+        assert report['init_total'] == 0.75
+        assert report['first_request'] == 0.125
+
+    def test_lambda_handler(self):
+        """the first invocation logs the init & first request timings"""
+        preloader.initialize_preloader(enabled=False)
+        event = {'session': {'new': False},
+                 'request': {'type': 'SessionEndedRequest'}}
+        lambda_function.lambda_handler(event, None)
+        lambda_function.lambda_handler(event, None)
+        init = [message for message in self.logged if message.startswith('[INIT]: ')]
+        assert len(init) == 1
+        assert json.loads(init[0][len('[INIT]: '):])['first_request'] is not None
@@ -0,0 +1,102 @@
+#!/usr/bin/python
+"""tests for the scheduled pre-warmer"""
+import os
+from http import HTTPStatus
+from unittest import mock
+import requests
+import responses
+import lambda_function
+from controllers import prewarmer, train_scheduler
+from models import cloudredis
+from njtransit.breaker import CircuitOpenError
+from configuration import config
+from tests.setupmocking import TestwithMocking
+
+
+class TestPrewarmer(TestwithMocking):
+    """encapsulates our pre-warmer tests"""
+
+    @staticmethod
+    def read_data(filename: str) -> bytes:
+        cwd = os.getcwd().replace('\\', '/')
+        root = cwd.split('/tests')[0]
+        path = root + '/tests/data/'
+        path_n_name = path + filename
+        file_pointer = open(path_n_name, mode='rb')
+        data = file_pointer.read()
+        file_pointer.close()
+        return data
+
+    def setUp(self):
+        super().setUp()
+        train_scheduler.TrainSchedule.board_cache_seconds = 90
+
+    def tearDown(self):
+        train_scheduler.TrainSchedule.board_cache_seconds = 0
+        super().tearDown()
+
+    @staticmethod
+    def mock_njtransit():
+        url = config.HOSTNAME + "/NJTTrainData.asmx/getStationListXML"
+        responses.add(responses.POST, url, body=TestPrewarmer.read_data('train_stations.xml'),
+                      status=HTTPStatus.CREATED)
+        url = config.HOSTNAME + "/NJTTrainData.asmx/getTrainScheduleXML"
+        responses.add(responses.POST, url, body=TestPrewarmer.read_data('NY_train_schedule.xml'),
+                      status=HTTPStatus.CREATED)
+
+    def test_hot_stations_default(self):
+        """no traffic yet, so use the usual busy stations"""
+        assert prewarmer.hot_stations(2) == prewarmer.DEFAULT_HOT_STATIONS[:2]
+
+    def test_hot_stations_traffic(self):
+        for station in ['CM', 'CM', 'SO']:
+            cloudredis.record_station_request(station)
+        assert prewarmer.hot_stations(3) == ['CM', 'SO', 'NY']
+
+    @responses.activate
+    def test_prewarm(self):
+        TestPrewarmer.mock_njtransit()
+        cloudredis.record_station_request('NY')
+        assert prewarmer.prewarm(count=1) == ['NY']
+        assert cloudredis.train_schedule('NY')
+
+        # the next request is served from the cache
+        calls = len(responses.calls)
+        tso = train_scheduler.TrainSchedule()
+        assert tso.train_schedule('NY')
+        assert len(responses.calls) == calls
+
+    @responses.activate
+    def test_prewarm_errors(self):
+        """one station failing doesn't stop the rest, an open breaker does"""
+        TestPrewarmer.mock_njtransit()
+        refresh = train_scheduler.TrainSchedule.refresh_train_schedule
+
+        def timeout(tso, station_abbreviation, test_argument=None):
+            if station_abbreviation == 'HB':
+                raise requests.Timeout('HB timed out')
+            return refresh(tso, station_abbreviation, test_argument)
+
+        cloudredis.request_refresh('HB')
+        with mock.patch.object(train_scheduler.TrainSchedule, 'refresh_train_schedule', timeout):
+            assert prewarmer.prewarm(count=3) == ['NY', 'NP']
+        assert cloudredis.pending_refreshes() == ['HB']
+
+        def circuit_open(tso, station_abbreviation, test_argument=None):
+            raise CircuitOpenError('NJTransit')
+
+        cloudredis.request_refresh('HB')
+        with mock.patch.object(train_scheduler.TrainSchedule, 'refresh_train_schedule',
+                               circuit_open):
+            assert prewarmer.prewarm(count=3) == []
+        assert cloudredis.pending_refreshes() == ['HB']
+
+    @responses.activate
+    def test_scheduled_event(self):
+        """CloudWatch events go to the pre-warmer, not to Alexa handling"""
+        TestPrewarmer.mock_njtransit()
+        event = {'source': 'aws.events', 'detail-type': 'Scheduled Event',
+                 'resources': ['arn:aws:events:us-east-1:123456789012:rule/prewarm']}
+        result = lambda_function.lambda_handler(event=event, context=None)
+        assert result['prewarmed']
+        assert cloudredis.train_schedule(result['prewarmed'][0])
@@ -0,0 +1,179 @@
+#!/usr/bin/python
+"""tests for the arrive-by reverse connection scan"""
+import os
+import unittest
+import xml.etree.ElementTree as ET
+from datetime import date, datetime, timedelta
+import pytz
+from controllers import precompute, reverse_scan, train_scheduler
+from njtransit.api import NJTransitAPI
+from tests.setupmocking import TestwithMocking
+
+TIMEZONE = pytz.timezone('America/New_York')
+FIVE_MINUTES = timedelta(minutes=5)
+
+
+def at(hour: int, minute: int) -> datetime:
+    return TIMEZONE.localize(datetime(2019, 1, 15, hour, minute))
+
+
+def train(tid: str, stops: list) -> dict:
+    """stops: [(station, hour, minute), ...]"""
+    times = {name: {'time': at(hour, minute), 'status': 'OK', 'departed': False}
+             for name, hour, minute in stops}
+    return {'tid': tid, 'destination': stops[-1][0], 'departure': times[stops[0][0]]['time'],
+            'index': 0, 'stops': times}
+
+
+class TestReverseScan(unittest.TestCase):
+    """encapsulates our reverse scan tests"""
+
+    @staticmethod
+    def latest(trains: list, arrival_time: datetime, departure_time: datetime = None,
+               transfer: timedelta = FIVE_MINUTES) -> dict:
+        return reverse_scan.latest_route(trains, 'A', 'D', arrival_time,
+                                         departure_time or at(0, 0), lambda name: transfer)
+
+    def test_direct(self):
+        early = train('1', [('A', 7, 0), ('B', 7, 20), ('D', 7, 50)])
+        late = train('2', [('A', 8, 0), ('B', 8, 20), ('D', 8, 50)])
+        assert self.latest([early, late], at(9, 0)) == {'direct': late}
+        assert self.latest([early, late], at(8, 30)) == {'direct': early}
+        assert self.latest([early, late], at(7, 50)) == {'direct': early}
+        assert self.latest([early, late], at(7, 49)) == {}
+
+    def test_wrong_direction(self):
+        inbound = train('1', [('D', 7, 0), ('A', 7, 50)])
+        assert self.latest([inbound], at(9, 0)) == {}
+
+    def test_indirect(self):
+        """leave later on the local & change to the express"""
+        direct = train('1', [('A', 7, 0), ('D', 8, 30)])
+        local = train('2', [('A', 7, 30), ('C', 7, 50)])
+        express = train('3', [('C', 8, 0), ('D', 8, 25)])
+        route = self.latest([direct, local, express], at(8, 30))
+        assert route == {'indirect': {'start': local, 'transfer': express, 'station': 'C'}}
+
+        # not enough time to change trains
+        route = self.latest([direct, local, express], at(8, 30), transfer=timedelta(minutes=15))
+        assert route == {'direct': direct}
+
+    def test_walking_transfer(self):
+        """off at C, walk to W & on to the destination"""
+        local = train('1', [('A', 7, 30), ('C', 7, 50)])
+        other_line = train('2', [('W', 8, 5), ('D', 8, 25)])
+        footpaths = {'C': {'W': 10 * 60}}
+        route = reverse_scan.latest_route([local, other_line], 'A', 'D', at(8, 30), at(0, 0),
+                                          lambda name: FIVE_MINUTES, footpaths)
+        assert route == {'indirect': {'start': local, 'transfer': other_line,
+                                      'station': 'C', 'walk_to': 'W'}}
+
+        # too far to walk in time
+        footpaths = {'C': {'W': 20 * 60}}
+        assert reverse_scan.latest_route([local, other_line], 'A', 'D', at(8, 30), at(0, 0),
+                                         lambda name: FIVE_MINUTES, footpaths) == {}
+
+    def test_tie(self):
+        """a direct train leaving when the transfer does is easier"""
+        direct = train('1', [('A', 7, 30), ('D', 8, 30)])
+        local = train('2', [('A', 7, 30), ('C', 7, 50)])
+        express = train('3', [('C', 8, 0), ('D', 8, 25)])
+        assert self.latest([local, express, direct], at(8, 30)) == {'direct': direct}
+
+    def test_departure_time(self):
+        """trains that have already left aren't the answer"""
+        direct = train('1', [('A', 7, 0), ('D', 8, 30)])
+        assert self.latest([direct], at(9, 0), departure_time=at(7, 1)) == {}
+
+    def test_duplicate_trains(self):
+        """a train is on both the start's & destination's boards"""
+        direct = train('1', [('A', 7, 0), ('D', 8, 30)])
+        assert reverse_scan.unique_trains([direct, dict(direct)]) == [direct]
+        assert self.latest([direct, dict(direct)], at(9, 0)) == {'direct': direct}
+
+
+class TestArriveBy(TestwithMocking):
+    """the scan against the scheduler on a day's timetable"""
+    SERVICE_DATE = date(2019, 1, 15)
+
+    @staticmethod
+    def read_data(filename: str) -> bytes:
+        cwd = os.getcwd().replace('\\', '/')
+        root = cwd.split('/tests')[0]
+        path_n_name = root + '/tests/data/' + filename
+        with open(path_n_name, mode='rb') as file_pointer:
+            return file_pointer.read()
+
+    def setUp(self):
+        super().setUp()
+        stations = NJTransitAPI.parse_station_list(
+            ET.fromstring(TestArriveBy.read_data('train_stations.xml')))
+        NJTransitAPI.share_train_stations(stations)
+
+    def tearDown(self):
+        NJTransitAPI.share_train_stations({})
+        super().tearDown()
+
+    def test_latest_departure(self):
+        """nothing the scheduler finds arriving in time leaves later"""
+        precomputer = precompute.RoutePrecomputer()
+        tso = precomputer.tso
+        boards = {station: precomputer.board(station, self.SERVICE_DATE).trains
+                  for station in ('CM', 'NY')}
+        tso.train_schedule = lambda station, test_argument=None: list(boards[station])
+
+        departure_time = at(6, 0)
+        arrival_time = at(9, 0)
+        route = tso.arrive_by('CM', 'NY', arrival_time, departure_time)
+        leaves = route['direct']['stops']['Chatham']['time']
+        assert departure_time <= leaves
+        assert route['direct']['stops']['New York']['time'] <= arrival_time
+
+        tso.boards = boards
+        routes = tso.schedule('CM', 'NY', departure_time, record_traffic=False)
+        tso.boards = None
+        in_time = [found['stops']['Chatham']['time'] for found in routes['direct']
+                   if found['stops']['New York']['time'] <= arrival_time]
+        in_time += [found['start']['stops']['Chatham']['time'] for found in routes['indirect']
+                    if found['transfer']['stops']['New York']['time'] <= arrival_time]
+        assert in_time and max(in_time) <= leaves
+
+    def test_beyond_the_boards(self):
+        """the real-time boards end hours before the arrival time, the
+        timetable fills in the trains after them"""
+        precomputer = precompute.RoutePrecomputer()
+        tso = precomputer.tso
+        departure_time = at(6, 0)
+        arrival_time = at(17, 0)
+        full_day = {station: precomputer.board(station, self.SERVICE_DATE).trains
+                    for station in ('CM', 'NY')}
+        tso.train_schedule = lambda station, test_argument=None: list(full_day[station])
+        route = tso.arrive_by('CM', 'NY', arrival_time, departure_time)
+        assert route['direct']['stops']['New York']['time'] <= arrival_time
+
+        live = {station: [train for train in trains
+                          if departure_time <= train['departure'] <= at(7, 30)]
+                for station, trains in full_day.items()}
+        tso.train_schedule = lambda station, test_argument=None: list(live[station])
+        filled_in = tso.arrive_by('CM', 'NY', arrival_time, departure_time)
+        assert filled_in['direct']['tid'] == route['direct']['tid']
+        assert filled_in['direct']['stops'] == route['direct']['stops']
+        assert route['direct']['departure'] > at(7, 30)  # it's not on the real-time boards
+        # a board reaching the arrival time is all we need
+        assert tso.arrive_by_board('CM', at(7, 0), departure_time) == live['CM']
+
+        # the timetable doesn't cover the day, we can't tell
+        assert tso.arrive_by('CM', 'NY', arrival_time.replace(year=2030),
+                             departure_time.replace(year=2030)) is None
+
+    def test_timetable_provider(self):
+        """built once per scheduler, or the scheduler's own when it's offline"""
+        tso = train_scheduler.TrainSchedule(offline=False, vectorized=False)
+        assert tso.timetable_provider is tso.timetable_provider
+        assert tso.timetable_provider.realtime is tso.njt
+        offline = train_scheduler.TrainSchedule(offline=True, vectorized=False)
+        assert offline.timetable_provider is offline.njt
+
+    def test_transfer_time(self):
+        tso = train_scheduler.TrainSchedule(offline=False, vectorized=False)
+        assert tso.transfer_time('Nowhere') == timedelta(minutes=5)
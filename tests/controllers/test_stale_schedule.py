@@ -0,0 +1,130 @@
+#!/usr/bin/python
+"""serving the last good train schedule when NJTransit is down"""
+import os
+from datetime import datetime
+from http import HTTPStatus
+from urllib import parse
+import pytz
+import requests
+import responses
+from controllers import prewarmer, train_scheduler
+from models import cloudredis
+from njtransit import breaker
+from configuration import config
+from tests.setupmocking import TestwithMocking
+
+
+class TestStaleSchedule(TestwithMocking):
+    """encapsulates our stale-while-revalidate tests"""
+
+    @staticmethod
+    def read_data(filename: str) -> bytes:
+        cwd = os.getcwd().replace('\\', '/')
+        root = cwd.split('/tests')[0]
+        file_pointer = open(root + '/tests/data/' + filename, mode='rb')
+        data = file_pointer.read()
+        file_pointer.close()
+        return data
+
+    def setUp(self):
+        super().setUp()
+        train_scheduler.TrainSchedule.board_cache_seconds = 90
+        train_scheduler.TrainSchedule.stale_board_seconds = 3600
+        self.breaker = breaker.BREAKER
+
+    def tearDown(self):
+        train_scheduler.TrainSchedule.board_cache_seconds = 0
+        train_scheduler.TrainSchedule.stale_board_seconds = 0
+        breaker.BREAKER = self.breaker
+        super().tearDown()
+
+    @staticmethod
+    def mock_stations():
+        url = config.HOSTNAME + "/NJTTrainData.asmx/getStationListXML"
+        responses.add(responses.POST, url,
+                      body=TestStaleSchedule.read_data('train_stations.xml'),
+                      status=HTTPStatus.CREATED)
+
+    @staticmethod
+    def mock_board(body):
+        url = config.HOSTNAME + "/NJTTrainData.asmx/getTrainScheduleXML"
+        responses.add(responses.POST, url, body=body, status=HTTPStatus.CREATED)
+
+    @responses.activate
+    def test_stale_on_error(self):
+        TestStaleSchedule.mock_board(TestStaleSchedule.read_data('NY_train_schedule.xml'))
+        tso = train_scheduler.TrainSchedule()
+        trains = tso.refresh_train_schedule('NY')
+        assert cloudredis.stale_train_schedule('NY') == trains
+
+        # the fresh copy expires & NJTransit is down
+        cloudredis.REDIS_SERVER.delete(cloudredis.board_key('NY'))
+        responses.reset()
+        TestStaleSchedule.mock_board(requests.ConnectionError('down'))
+        tso = train_scheduler.TrainSchedule()
+        assert tso.train_schedule('NY') == trains
+        assert tso.stale_stations == {'NY'}
+        assert cloudredis.pending_refreshes() == ['NY']
+
+    @staticmethod
+    def ny_down(request):
+        """NY is down, every other station has Chatham's trains"""
+        if dict(parse.parse_qsl(request.body))['station'] == 'NY':
+            raise requests.ConnectionError('down')
+        data = TestStaleSchedule.read_data('CM_train_schedule.xml')
+        return HTTPStatus.CREATED, {'content-type': 'text/xml'}, data
+
+    @responses.activate
+    def test_batch_stale_per_query(self):
+        """only the queries that used the old schedule are stale"""
+        TestStaleSchedule.mock_stations()
+        TestStaleSchedule.mock_board(TestStaleSchedule.read_data('NY_train_schedule.xml'))
+        train_scheduler.TrainSchedule().refresh_train_schedule('NY')
+        cloudredis.REDIS_SERVER.delete(cloudredis.board_key('NY'))
+        responses.reset()
+        TestStaleSchedule.mock_stations()
+        responses.add_callback(responses.POST,
+                               config.HOSTNAME + "/NJTTrainData.asmx/getTrainScheduleXML",
+                               callback=TestStaleSchedule.ny_down, content_type='text/xml')
+
+        morning = pytz.timezone("America/New_York").localize(datetime(2018, 12, 8, 9))
+        queries = [('CM', 'NY', morning), ('CM', 'SO', morning)]
+        tso = train_scheduler.TrainSchedule()
+        batch = tso.schedule_batch(queries)
+        assert [routes['stale'] for routes in batch] == [True, False]
+        assert tso.schedule_batch(queries, processes=2) == batch
+
+    @responses.activate
+    def test_no_stale_copy(self):
+        TestStaleSchedule.mock_board(requests.ConnectionError('down'))
+        tso = train_scheduler.TrainSchedule()
+        self.assertRaises(requests.ConnectionError, tso.train_schedule, 'NY')
+
+    @responses.activate
+    def test_open_breaker_skips_njtransit(self):
+        cloudredis.cache_train_schedule('NY', [{'tid': '1234', 'stops': {}}], 1, 3600)
+        cloudredis.REDIS_SERVER.delete(cloudredis.board_key('NY'))
+        breaker.BREAKER = breaker.CircuitBreaker('test', failures=1)
+        breaker.BREAKER.failure()
+        assert breaker.BREAKER.state() == 'open'
+
+        tso = train_scheduler.TrainSchedule()
+        assert tso.train_schedule('NY') == [{'tid': '1234', 'stops': {}}]
+        assert not responses.calls
+        cloudredis.close_breaker('test')
+
+    @responses.activate
+    def test_prewarm_refreshes_stale_first(self):
+        TestStaleSchedule.mock_stations()
+        TestStaleSchedule.mock_board(TestStaleSchedule.read_data('NY_train_schedule.xml'))
+        cloudredis.request_refresh('CM')
+        assert prewarmer.prewarm(count=1) == ['CM', 'NY']
+        assert cloudredis.pending_refreshes() == []
+
+    @responses.activate
+    def test_prewarm_still_down(self):
+        TestStaleSchedule.mock_stations()
+        TestStaleSchedule.mock_board(requests.ConnectionError('down'))
+        cloudredis.request_refresh('CM')
+        assert prewarmer.prewarm(count=1) == []
+        assert cloudredis.pending_refreshes() == ['CM']
@@ -0,0 +1,85 @@
+#!/usr/bin/python
+"""tests for resolving spoken station names"""
+from unittest import TestCase
+import os
+import xml.etree.ElementTree as ET
+from controllers import station_names
+
+
+class TestStationNameIndex(TestCase):
+    """encapsulates our station name tests"""
+
+    @staticmethod
+    def read_stations() -> dict:
+        """the station list from our canned XML test data"""
+        cwd = os.getcwd().replace('\\', '/')
+        root = cwd.split('/tests')[0]
+        station_list = {}
+        for station in ET.parse(root + '/tests/data/train_stations.xml').getroot():
+            abbreviation = station.find('STATION_2CHAR').text
+            station_name = station.find('STATIONNAME').text
+            if '\n' not in station_name:
+                station_list.update({station_name: abbreviation, abbreviation: station_name})
+        return station_list
+
+    @classmethod
+    def setUpClass(cls):
+        cls.stations = TestStationNameIndex.read_stations()
+
+    def setUp(self):
+        self.index = station_names.initialize_station_index(self.stations)
+
+    def test_exact(self):
+        assert self.index.resolve('Chatham') == 'Chatham'
+        assert self.index.resolve('CM') == 'Chatham'
+
+    def test_case_and_spacing(self):
+        assert self.index.resolve('chatham') == 'Chatham'
+        assert self.index.resolve('  princeton   jct ') == 'Princeton Jct.'
+
+    def test_gtfs_alias(self):
+        """slot values use the long names from the GTFS stops"""
+        assert self.index.resolve('newark penn station') == 'Newark Penn'
+        assert self.index.resolve('New York Penn Station') == 'New York'
+        assert self.index.resolve('upper montclair') == 'Upp. Montclair'
+
+    def test_fuzzy(self):
+        assert self.index.resolve('chatam') == 'Chatham'
+        assert self.index.resolve('morristown station') == 'Morristown'
+
+    def test_abbreviations(self):
+        """Jct/Junction, Hts/Heights, St/Street... are the same word"""
+        assert self.index.resolve('Princeton Junction') == 'Princeton Jct.'
+        assert self.index.resolve('berkeley heights') == 'Berkeley Hts'
+        assert self.index.resolve('anderson street') == 'Anderson St.'
+        assert self.index.resolve('essex st') == 'Essex Street'
+        assert self.index.resolve('mount arlington') == 'Mt. Arlington'
+        assert self.index.resolve('convent station') == 'Convent Stn'
+
+    def test_spoken_names(self):
+        assert self.index.resolve('montclair state') == 'MSU'
+        assert self.index.resolve('Montclair State University') == 'MSU'
+
+    def test_ambiguous(self):
+        """no guessing when another station is nearly as close"""
+        assert self.index.resolve('airport') is None
+        assert self.index.resolve('north') is None
+        assert self.index.resolve('penn station') is None
+        assert self.index.resolve('newark') is None
+        assert self.index.resolve('glen rock') is None
+
+    def test_numbers_must_match(self):
+        assert self.index.resolve('ramsey route 17') == 'Ramsey Rt 17'
+        assert self.index.resolve('ramsey route 23') is None
+
+    def test_unknown(self):
+        assert self.index.resolve('bogus') is None
+        assert self.index.resolve('') is None
+
+    def test_shared(self):
+        """built once, unless there's a new station list"""
+        assert self.index is station_names.initialize_station_index(self.stations)
+        other = station_names.initialize_station_index({'Line 1 Station 1': '11',
+                                                        '11': 'Line 1 Station 1'})
+        assert other is not self.index
+        assert other.resolve('line 1 station 1') == 'Line 1 Station 1'
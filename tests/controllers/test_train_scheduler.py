@@ -2,11 +2,16 @@
 from unittest import TestCase
 import os
 import pytz
-from datetime import datetime
+from datetime import datetime, timedelta
 from http import HTTPStatus
 from urllib import parse
+import xml.etree.ElementTree as ET
+import fakeredis
 import responses
 from controllers import train_scheduler
+from models import cloudredis
+from njtransit import api
+from njtransit.api import NJTransitAPI
 from configuration import config
 
 
@@ -41,6 +46,30 @@ class TestTrainScheduler(TestCase):
         scheduler = train_scheduler.TrainSchedule()
         assert scheduler.validate_station_name('Chatham')
 
+    @responses.activate
+    def test_nearest_station_far_away(self):
+        """nowhere near a station"""
+        url = config.HOSTNAME + "/NJTTrainData.asmx/getStationListXML"
+        test_bytes = TestTrainScheduler.read_data('train_stations.xml')
+        responses.add(responses.POST, url, body=test_bytes, status=HTTPStatus.CREATED)
+
+        scheduler = train_scheduler.TrainSchedule()
+        assert scheduler.nearest_station(0.0, 0.0) is None
+
+    def test_transfer_stations(self):
+        """the transfer table only narrows the search on days the timetable covers"""
+        NJTransitAPI.share_train_stations(NJTransitAPI.parse_station_list(
+            ET.fromstring(TestTrainScheduler.read_data('train_stations.xml'))))
+        try:
+            scheduler = train_scheduler.TrainSchedule(offline=False)
+            covered = pytz.timezone("America/New_York").localize(datetime(2019, 1, 15, 9))
+            assert 'Secaucus ' in scheduler.transfer_stations('Chatham', 'Trenton', covered)
+            assert scheduler.transfer_stations('Chatham', 'Trenton',
+                                               covered.replace(year=2030)) is None
+            assert scheduler.transfer_stations('Line 1 Station 1', 'Trenton', covered) is None
+        finally:
+            NJTransitAPI.share_train_stations({})
+
     def test_initialization(self):
         """make sure NJT api object is initialized"""
         scheduler = train_scheduler.TrainSchedule()
@@ -74,6 +103,67 @@ class TestTrainScheduler(TestCase):
 
         assert train_routes
 
+    @staticmethod
+    def mock_batch():
+        url = config.HOSTNAME + "/NJTTrainData.asmx/getStationListXML"
+        test_bytes = TestTrainScheduler.read_data('train_stations.xml')
+        responses.add(responses.POST, url, body=test_bytes, status=HTTPStatus.CREATED)
+
+        url = config.HOSTNAME + "/NJTTrainData.asmx/getTrainScheduleXML"
+        responses.add_callback(
+            responses.POST, url,
+            callback=TestTrainScheduler.request_callback,
+            content_type='text/xml',)
+
+    @staticmethod
+    def board_calls() -> int:
+        return len([call for call in responses.calls
+                    if call.request.url.endswith('getTrainScheduleXML')])
+
+    @responses.activate
+    def test_schedule_batch(self):
+        """each station's schedule is fetched once for the whole batch"""
+        TestTrainScheduler.mock_batch()
+        eastern = pytz.timezone("America/New_York")
+        morning = eastern.localize(to_datetime('08-Dec-2018 09:00:00 AM'))
+        queries = [('CM', 'NY', morning), ('NY', 'CM', morning),
+                   ('CM', 'NY', morning + timedelta(hours=3))]
+
+        scheduler = train_scheduler.TrainSchedule()
+        batch = scheduler.schedule_batch(queries)
+        assert TestTrainScheduler.board_calls() == 2
+        assert scheduler.boards is None
+        assert batch[0]['direct']
+
+        for query, routes in zip(queries, batch):
+            assert scheduler.schedule(*query) == routes
+
+    @responses.activate
+    def test_schedule_batch_pool(self):
+        TestTrainScheduler.mock_batch()
+        eastern = pytz.timezone("America/New_York")
+        morning = eastern.localize(to_datetime('08-Dec-2018 09:00:00 AM'))
+        queries = [('CM', 'NY', morning), ('NY', 'CM', morning)]
+
+        scheduler = train_scheduler.TrainSchedule()
+        assert scheduler.schedule_batch(queries, processes=2) == \
+            scheduler.schedule_batch(queries)
+        assert TestTrainScheduler.board_calls() == 4  # 2 per batch
+
+    def test_batch_worker_connections(self):
+        """a forked pool process doesn't use the parent's redis or NJTransit connections"""
+        server, session = cloudredis.REDIS_SERVER, api.SESSION
+        batch = train_scheduler.BATCH_SCHEDULE
+        cloudredis.REDIS_SERVER = fakeredis.FakeStrictRedis()
+        try:
+            train_scheduler._initialize_batch_worker({}, {}, set(), False)
+            assert cloudredis.REDIS_SERVER is None
+            assert api.SESSION is not session
+        finally:
+            cloudredis.REDIS_SERVER, api.SESSION = server, session
+            train_scheduler.BATCH_SCHEDULE = batch
+            NJTransitAPI.share_train_stations({})
+
     def test_best_schedule_none(self):
         """no routes to test"""
         routes = {}
@@ -118,6 +208,54 @@ class TestTrainScheduler(TestCase):
         best_route = train_scheduler.TrainSchedule.best_route('Line 1 Station 1', 'Line 1 Station 9', routes)
         assert best_route['direct'] == routes['direct'][1]
 
+    @staticmethod
+    def direct_train(tid: str, leaves: str, arrives: str) -> dict:
+        return {'tid': tid, 'stops': {
+            'Line 1 Station 1': {'time': to_datetime('11-Dec-2018 ' + leaves)},
+            'Line 1 Station 9': {'time': to_datetime('11-Dec-2018 ' + arrives)}}}
+
+    @staticmethod
+    def indirect_route(start_train: dict, arrives: str) -> dict:
+        return {'start': start_train,
+                'transfer': {'tid': 'T' + start_train['tid'], 'stops': {
+                    'Line 1 Station 5': {'time': to_datetime('11-Dec-2018 01:00:00 AM')},
+                    'Line 1 Station 9': {'time': to_datetime('11-Dec-2018 ' + arrives)}}},
+                'station': 'Line 1 Station 5'}
+
+    def test_best_routes(self):
+        """direct & indirect merged by arrival, a tie goes to the later departure"""
+        first = TestTrainScheduler.direct_train('1', '01:30:00 AM', '02:00:00 AM')
+        later = TestTrainScheduler.direct_train('2', '01:45:00 AM', '02:00:00 AM')
+        slow = TestTrainScheduler.direct_train('3', '01:50:00 AM', '03:00:00 AM')
+        start_train = TestTrainScheduler.direct_train('4', '01:55:00 AM', '03:30:00 AM')
+        transfer = TestTrainScheduler.indirect_route(start_train, '02:30:00 AM')
+        routes = {'direct': [first, later, slow], 'indirect': [transfer], 'stale': False}
+
+        best = train_scheduler.TrainSchedule.best_routes('Line 1 Station 1', 'Line 1 Station 9',
+                                                        routes, 3)
+        assert best == [{'direct': later}, {'direct': first}, {'indirect': transfer}]
+        assert train_scheduler.TrainSchedule.best_routes('Line 1 Station 1', 'Line 1 Station 9',
+                                                         routes, 10)[3:] == [{'direct': slow}]
+        assert train_scheduler.TrainSchedule.best_route('Line 1 Station 1', 'Line 1 Station 9',
+                                                        routes) == best[0]
+
+    def test_best_routes_same_start_train(self):
+        """a train is offered once, with its best route. A tie between a
+        direct train & a transfer goes to the direct train"""
+        start_train = TestTrainScheduler.direct_train('1', '01:30:00 AM', '03:00:00 AM')
+        transfer = TestTrainScheduler.indirect_route(start_train, '02:30:00 AM')
+        other = TestTrainScheduler.direct_train('2', '01:40:00 AM', '02:30:00 AM')
+        routes = {'direct': [start_train, other], 'indirect': [transfer]}
+        best = train_scheduler.TrainSchedule.best_routes('Line 1 Station 1', 'Line 1 Station 9',
+                                                        routes, 3)
+        assert best == [{'direct': other}, {'indirect': transfer}]
+
+        tie = TestTrainScheduler.direct_train('3', '01:30:00 AM', '02:30:00 AM')
+        routes = {'direct': [tie], 'indirect': [transfer]}
+        best = train_scheduler.TrainSchedule.best_routes('Line 1 Station 1', 'Line 1 Station 9',
+                                                        routes, 2)
+        assert best == [{'direct': tie}, {'indirect': transfer}]
+
     def test_best_route_none(self):
         best_route = train_scheduler.TrainSchedule.best_route('Line 1 Station 1', 'Line 1 Station 9', routes={})
         assert not best_route
@@ -0,0 +1,97 @@
+#!/usr/bin/python
+"""tests for the offline (GTFS) schedule provider"""
+from unittest import TestCase
+import os
+from datetime import datetime, timedelta
+from http import HTTPStatus
+import pytz
+import responses
+from gtfs.provider import OfflineScheduleProvider
+from njtransit.api import NJTransitAPI
+from controllers import train_scheduler
+from configuration import config
+
+
+def eastern(year: int, month: int, day: int, hour: int, minute: int = 0) -> datetime:
+    return pytz.timezone('America/New_York').localize(datetime(year, month, day, hour, minute))
+
+
+class TestOfflineScheduleProvider(TestCase):
+    """encapsulates our offline schedule tests"""
+
+    @staticmethod
+    def read_data(filename: str) -> bytes:
+        """read our canned XML test data"""
+        cwd = os.getcwd().replace('\\', '/')
+        root = cwd.split('/tests')[0]
+        path = root + '/tests/data/'
+        path_n_name = path + filename
+        file_pointer = open(path_n_name, mode='rb')
+        data = file_pointer.read()
+        file_pointer.close()
+        return data
+
+    @staticmethod
+    def mock_station_list():
+        url = config.HOSTNAME + "/NJTTrainData.asmx/getStationListXML"
+        test_bytes = TestOfflineScheduleProvider.read_data('train_stations.xml')
+        responses.add(responses.POST, url, body=test_bytes, status=HTTPStatus.CREATED)
+
+    @staticmethod
+    def mock_train_schedule():
+        url = config.HOSTNAME + "/NJTTrainData.asmx/getTrainScheduleXML"
+        test_bytes = TestOfflineScheduleProvider.read_data('CM_train_schedule.xml')
+        responses.add(responses.POST, url, body=test_bytes, status=HTTPStatus.CREATED)
+
+    @responses.activate
+    def test_no_realtime_needed(self):
+        """trains are all past the real-time window, no upstream call"""
+        TestOfflineScheduleProvider.mock_station_list()
+        now = eastern(2019, 1, 15, 7)
+        offline = OfflineScheduleProvider(NJTransitAPI(), realtime_window=timedelta(minutes=1),
+                                          clock=lambda: now)
+        trains = offline.train_schedule('CM')
+        assert trains
+        assert all(train['departure'] >= now for train in trains)
+        assert [train['index'] for train in trains] == list(range(len(trains)))
+        assert all('Chatham' in train['stops'] for train in trains)
+        assert len(responses.calls) == 1  # just the station list
+
+    @responses.activate
+    def test_realtime_window(self):
+        """trains about to leave come from the real-time API"""
+        TestOfflineScheduleProvider.mock_station_list()
+        TestOfflineScheduleProvider.mock_train_schedule()
+        now = eastern(2019, 1, 15, 7)
+        offline = OfflineScheduleProvider(NJTransitAPI(), realtime_window=timedelta(hours=1),
+                                          clock=lambda: now)
+        trains = offline.train_schedule('CM')
+        assert len(responses.calls) == 2
+        assert any(train['stops'].get('Chatham', {}).get('status') == 'Scheduled'
+                   for train in trains)
+        assert trains[0]['departure'].year == 2018  # canned real-time data
+
+    @responses.activate
+    def test_date_not_covered(self):
+        """out of the timetable's range, everything is real-time"""
+        TestOfflineScheduleProvider.mock_station_list()
+        TestOfflineScheduleProvider.mock_train_schedule()
+        now = eastern(2018, 12, 8, 13)
+        offline = OfflineScheduleProvider(NJTransitAPI(), clock=lambda: now)
+        trains = offline.train_schedule('CM')
+        assert trains
+        assert all(train['departure'].year == 2018 for train in trains)
+
+    @responses.activate
+    def test_schedule_offline(self):
+        """the controller routes with the timetable"""
+        TestOfflineScheduleProvider.mock_station_list()
+        now = eastern(2019, 1, 15, 7)
+        scheduler = train_scheduler.TrainSchedule(offline=True)
+        scheduler.njt.realtime_window = timedelta(0)
+        scheduler.njt._clock = lambda: now  # pylint: disable=W0212
+        train_routes = scheduler.schedule('CM', 'NY', departure_time=now)
+        assert train_routes['direct']
+        assert train_routes['indirect']
+        best = train_scheduler.TrainSchedule.best_route('Chatham', 'New York', train_routes)
+        assert best
@@ -0,0 +1,50 @@
+#!/usr/bin/python
+"""tests for the service calendar index"""
+from unittest import TestCase
+from datetime import date
+from gtfs import timetable
+from gtfs.models.calendar_date import CalendarDate
+from gtfs.service_calendar import ServiceCalendar
+
+
+class TestServiceCalendar(TestCase):
+    """encapsulates our service calendar tests"""
+
+    @staticmethod
+    def calendar_date(service_id: str, yyyymmdd: str, exception_type: int) -> CalendarDate:
+        return CalendarDate({'service_id': service_id, 'date': yyyymmdd,
+                             'exception_type': str(exception_type)})
+
+    def test_services(self):
+        calendar = ServiceCalendar([self.calendar_date('1', '20190121', 1),
+                                    self.calendar_date('2', '20190121', 1),
+                                    self.calendar_date('2', '20190122', 1)],
+                                   ['1', '2', '2', '1'])
+        assert calendar.service_ids(date(2019, 1, 21)) == {'1', '2'}
+        assert calendar.service_ids(date(2019, 1, 22)) == {'2'}
+        assert calendar.trips(date(2019, 1, 21)) == 0b1111
+        assert calendar.trips(date(2019, 1, 22)) == 0b0110
+        assert calendar.runs(1, date(2019, 1, 22))
+        assert not calendar.runs(0, date(2019, 1, 22))
+        assert not calendar.has_service(date(2019, 1, 23))
+        assert calendar.trips(date(2019, 1, 23)) == 0
+
+    def test_service_removed(self):
+        calendar = ServiceCalendar([self.calendar_date('1', '20190121', 1),
+                                    self.calendar_date('2', '20190121', 1),
+                                    self.calendar_date('2', '20190121', 2)],
+                                   ['1', '2'])
+        assert calendar.service_ids(date(2019, 1, 21)) == {'1'}
+        assert calendar.trips(date(2019, 1, 21)) == 0b01
+
+    def test_matches_scan(self):
+        """the index agrees with scanning calendar_dates.txt"""
+        schedule = timetable.initialize_timetable()
+        calendar_dates = CalendarDate.read(timetable.GTFS_DATA)
+        service_date = date(2019, 1, 15)
+        scanned = {calendar_date.service_id for calendar_date in calendar_dates
+                   if calendar_date.date == service_date}
+        assert schedule.active_services(service_date) == scanned
+        for trip_id, trip in schedule.trips.items():
+            assert schedule.calendar.runs(schedule.trip_index[trip_id], service_date) == \
+                (trip.service_id in scanned)
@@ -0,0 +1,89 @@
+#!/usr/bin/python
+"""tests for the timetable shared between processes"""
+import multiprocessing
+from unittest import TestCase, mock
+from datetime import date
+from gtfs import timetable, shared_timetable
+from gtfs.transfers import TransferTable
+
+
+def _worker_departures(name: str, stop_id: str, service_date: date) -> list:
+    """what a forked worker sees"""
+    return shared_timetable.attach_timetable(name).departures(stop_id, service_date)
+
+
+class TestSharedTimetable(TestCase):
+    """encapsulates our shared timetable tests"""
+    SERVICE_DATE = date(2019, 1, 15)
+
+    @classmethod
+    def setUpClass(cls):
+        cls.schedule = timetable.initialize_timetable()
+
+    def busiest_stop(self) -> str:
+        return max(self.schedule.stop_index.stop_ids,
+                   key=lambda stop_id: len(self.schedule.departures(stop_id, self.SERVICE_DATE)))
+
+    def assert_same(self, shared: timetable.Timetable):
+        schedule = self.schedule
+        assert shared.trip_ids == schedule.trip_ids
+        assert shared.stops.keys() == schedule.stops.keys()
+        assert shared.stop_index.stop_ids == schedule.stop_index.stop_ids
+        assert shared.trip_stops.keys() == schedule.trip_stops.keys()
+        for trip_id in schedule.trip_stops:
+            assert shared.trip_stops[trip_id] == schedule.trip_stops[trip_id]
+        for stop_id in schedule.stop_index.stop_ids:
+            assert shared.departures(stop_id, self.SERVICE_DATE, 6 * 3600, 10 * 3600) == \
+                schedule.departures(stop_id, self.SERVICE_DATE, 6 * 3600, 10 * 3600)
+        assert shared.calendar.trips(self.SERVICE_DATE) == \
+            schedule.calendar.trips(self.SERVICE_DATE)
+        assert shared.active_services(self.SERVICE_DATE) == \
+            schedule.active_services(self.SERVICE_DATE)
+
+    def test_attach(self):
+        """the attached timetable answers like the one read from the GTFS files"""
+        with shared_timetable.TimetableImage(self.schedule) as image:
+            shared = shared_timetable.attach(image.name)
+            self.assert_same(shared)
+            assert shared.departures(self.busiest_stop(), self.SERVICE_DATE)
+
+    def test_read_only(self):
+        with shared_timetable.TimetableImage(self.schedule) as image:
+            shared = shared_timetable.attach(image.name)
+            departures = shared.stop_index.stop_departures(self.busiest_stop())
+            with self.assertRaises(TypeError):
+                departures.times[0] = 0
+
+    def test_mmap_file(self):
+        """before python 3.8 the image is a file we mmap"""
+        with mock.patch.object(shared_timetable, 'shared_memory', None):
+            with shared_timetable.TimetableImage(self.schedule) as image:
+                self.assert_same(shared_timetable.attach(image.name))
+
+    def test_station_names(self):
+        """names resolved by the parent are in the image"""
+        schedule = timetable.Timetable.__new__(timetable.Timetable)
+        schedule.__dict__.update(self.schedule.__dict__)
+        stop_id = schedule.stop_index.stop_ids[0]
+        schedule.station_names = {stop_id: 'Chatham'}
+        with shared_timetable.TimetableImage(schedule) as image:
+            shared = shared_timetable.attach(image.name)
+            assert shared.station_names == {stop_id: 'Chatham'}
+            assert shared.station_stops == {'Chatham': [stop_id]}
+            assert TransferTable(shared).station_patterns['Chatham']
+
+    def test_not_an_image(self):
+        with self.assertRaises(shared_timetable.ImageError):
+            shared_timetable.SharedTimetable(memoryview(b'\0' * 64))
+
+    def test_worker_process(self):
+        """a forked worker attaches without reading the GTFS files"""
+        stop_id = self.busiest_stop()
+        context = multiprocessing.get_context('fork')
+        with shared_timetable.TimetableImage(self.schedule) as image:
+            with mock.patch.object(timetable.Timetable, '__init__',
+                                   side_effect=AssertionError('parsed the GTFS files')):
+                with context.Pool(1) as pool:
+                    departures = pool.apply(_worker_departures,
+                                            (image.name, stop_id, self.SERVICE_DATE))
+        assert departures == self.schedule.departures(stop_id, self.SERVICE_DATE)
@@ -0,0 +1,85 @@
+#!/usr/bin/python
+"""tests for the station grid, nearest station & walking transfers"""
+from unittest import TestCase
+import os
+import random
+import xml.etree.ElementTree as ET
+from gtfs import station_grid, timetable
+
+
+class TestStationGrid(TestCase):
+    """encapsulates our station grid tests"""
+    CHATHAM = (40.740200, -74.384800)
+
+    @staticmethod
+    def read_stations() -> dict:
+        """the station list from our canned XML test data"""
+        cwd = os.getcwd().replace('\\', '/')
+        root = cwd.split('/tests')[0]
+        station_list = {}
+        for station in ET.parse(root + '/tests/data/train_stations.xml').getroot():
+            abbreviation = station.find('STATION_2CHAR').text
+            station_name = station.find('STATIONNAME').text
+            if '\n' not in station_name:
+                station_list.update({station_name: abbreviation, abbreviation: station_name})
+        return station_list
+
+    def setUp(self):
+        schedule = timetable.initialize_timetable()
+        schedule.resolve_stations(TestStationGrid.read_stations())
+        self.grid = station_grid.StationGrid.from_timetable(schedule)
+
+    def brute_force(self, latitude: float, longitude: float) -> list:
+        return sorted((station_grid.distance(latitude, longitude, *location), name)
+                      for name, location in self.grid.locations.items())
+
+    def test_distance(self):
+        """Chatham to Summit is about 3.5km"""
+        summit = self.grid.locations['Summit']
+        assert 3000 < station_grid.distance(*self.CHATHAM, *summit) < 4000
+        assert station_grid.distance(*summit, *summit) == 0
+
+    def test_nearest(self):
+        meters, name = self.grid.nearest(*self.CHATHAM)[0]
+        assert name == 'Chatham'
+        assert meters < 200
+
+    def test_nearest_matches_brute_force(self):
+        """points across the state, & some a long way from any station"""
+        generator = random.Random(47)
+        for _ in range(200):
+            latitude = generator.uniform(38.5, 41.5)
+            longitude = generator.uniform(-75.5, -73.5)
+            assert self.grid.nearest(latitude, longitude, 3) == \
+                self.brute_force(latitude, longitude)[:3]
+        assert self.grid.nearest(34.05, -118.25) == self.brute_force(34.05, -118.25)[:1]
+
+    def test_nearest_station_reach(self):
+        """the middle of the Atlantic isn't near a station"""
+        reach = station_grid.NEAREST_STATION_METERS
+        assert self.grid.nearest(0.0, 0.0)  # Long Branch, thousands of km away
+        assert self.grid.nearest(0.0, 0.0, max_meters=reach) == []
+        assert self.grid.nearest(*self.CHATHAM, max_meters=reach)[0][1] == 'Chatham'
+
+    def test_within(self):
+        nearby = self.grid.within(*self.CHATHAM, 6000)
+        assert [name for _, name in nearby][:4] == ['Chatham', 'New Providence',
+                                                    'Madison', 'Summit']
+        assert all(meters <= 6000 for meters, _ in nearby)
+        assert self.grid.nearest(*self.CHATHAM, max_meters=1) == []
+
+    def test_footpaths(self):
+        """the Bergen County & Main lines meet a short walk apart in Glen Rock"""
+        footpaths = self.grid.footpaths()
+        assert 'Glen Rock Main' in footpaths['Glen Rock Boro']
+        assert footpaths['Glen Rock Boro']['Glen Rock Main'] == \
+            footpaths['Glen Rock Main']['Glen Rock Boro']
+        assert footpaths['Glen Rock Boro']['Glen Rock Main'] >= \
+            station_grid.MINIMUM_WALK_SECONDS
+        assert 'Chatham' not in footpaths
+        assert footpaths is self.grid.footpaths()
+
+    def test_empty(self):
+        grid = station_grid.StationGrid({})
+        assert grid.nearest(*self.CHATHAM) == []
+        assert grid.footpaths() == {}
@@ -0,0 +1,50 @@
+#!/usr/bin/python
+"""tests for the stop -> departures index"""
+from unittest import TestCase
+from datetime import date
+from gtfs import timetable
+from gtfs.stop_index import StopIndex
+
+
+class TestStopIndex(TestCase):
+    """encapsulates our stop index tests"""
+
+    @staticmethod
+    def create_tst_index() -> StopIndex:
+        trip_stops = [[('A', 100, 110), ('B', 200, 210), ('C', 300, 300)],
+                      [('A', 50, 60), ('C', 250, 250)],
+                      [('B', 150, 160), ('A', 400, 410)]]
+        return StopIndex(trip_stops)
+
+    def test_sorted_departures(self):
+        index = TestStopIndex.create_tst_index()
+        assert index.departures('A') == [(60, 1, 0), (110, 0, 0), (410, 2, 1)]
+        assert index.departures('bogus') == []
+        assert 'C' in index
+
+    def test_between(self):
+        index = TestStopIndex.create_tst_index()
+        assert index.departures('A', start=60, end=110) == [(60, 1, 0), (110, 0, 0)]
+        assert index.departures('A', start=61) == [(110, 0, 0), (410, 2, 1)]
+        assert index.departures('A', start=500) == []
+
+    def test_running(self):
+        """only trips in the running bitmap are returned"""
+        index = TestStopIndex.create_tst_index()
+        assert index.departures('A', running=0b101) == [(110, 0, 0), (410, 2, 1)]
+        assert index.next_departure('A', 0, running=0b100) == (410, 2, 1)
+        assert index.next_departure('A', 411) is None
+        assert index.next_departure('bogus', 0) is None
+
+    def test_matches_scan(self):
+        """the index agrees with scanning every stop time"""
+        schedule = timetable.initialize_timetable()
+        service_date = date(2019, 1, 15)
+        stop_id = schedule.stop_index.stop_ids[0]
+        running = schedule.active_services(service_date)
+        scanned = sorted((departure, trip_id)
+                         for trip_id, stops in schedule.trip_stops.items()
+                         if schedule.trips[trip_id].service_id in running
+                         for this_stop, _, departure in stops
+                         if this_stop == stop_id and 7 * 3600 <= departure <= 10 * 3600)
+        assert scanned == schedule.departures(stop_id, service_date, 7 * 3600, 10 * 3600)
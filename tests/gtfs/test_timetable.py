@@ -0,0 +1,51 @@
+#!/usr/bin/python
+"""tests for reading the GTFS timetable"""
+from unittest import TestCase
+from datetime import date, timedelta
+from gtfs import timetable
+from gtfs.models.gtfsobject import gtfs_seconds
+
+
+class TestTimetable(TestCase):
+    """encapsulates our GTFS timetable tests"""
+
+    def test_gtfs_seconds(self):
+        assert gtfs_seconds('05:21:00') == 5 * 3600 + 21 * 60
+        assert gtfs_seconds('24:01:30') == 24 * 3600 + 60 + 30
+
+    def test_initialize_once(self):
+        schedule = timetable.initialize_timetable()
+        assert schedule is timetable.initialize_timetable()
+        assert schedule.trips
+        assert schedule.trip_stops
+
+    def test_rail_only(self):
+        """light rail isn't in the real-time API, we don't keep it"""
+        schedule = timetable.initialize_timetable()
+        assert all(trip.route_id not in ('3', '11', '15') for trip in schedule.trips.values())
+
+    def test_normalize_name(self):
+        assert timetable.normalize_name('Princeton Jct.') == 'princeton jct'
+        assert timetable.normalize_name('PRINCETON  JCT') == 'princeton jct'
+
+    def test_active_services(self):
+        schedule = timetable.initialize_timetable()
+        assert schedule.active_services(date(2019, 1, 21))
+        assert not schedule.has_service(date(2018, 1, 21))
+
+    def test_service_day_start_dst(self):
+        """on the day clocks spring forward the service
+        day starts an hour before midnight"""
+        schedule = timetable.initialize_timetable()
+        day_start = schedule.service_day_start(date(2019, 3, 10))
+        assert day_start.hour == 23
+        day_start = schedule.service_day_start(date(2019, 3, 11))
+        assert day_start.hour == 0
+
+    def test_departures_sorted(self):
+        schedule = timetable.initialize_timetable()
+        stop_id = schedule.stop_index.stop_ids[0]
+        departures = schedule.departures(stop_id, date(2019, 1, 15))
+        assert departures
+        assert departures == sorted(departures)
+        assert not schedule.departures(stop_id, date(2019, 1, 15) - timedelta(days=365))
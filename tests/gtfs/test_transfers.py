@@ -0,0 +1,72 @@
+#!/usr/bin/python
+"""tests for the precomputed transfer table"""
+from unittest import TestCase
+import os
+import tempfile
+import xml.etree.ElementTree as ET
+from gtfs import timetable, transfers
+
+
+class TestTransferTable(TestCase):
+    """encapsulates our transfer table tests"""
+
+    @staticmethod
+    def read_stations() -> dict:
+        """the station list from our canned XML test data"""
+        cwd = os.getcwd().replace('\\', '/')
+        root = cwd.split('/tests')[0]
+        station_list = {}
+        for station in ET.parse(root + '/tests/data/train_stations.xml').getroot():
+            abbreviation = station.find('STATION_2CHAR').text
+            station_name = station.find('STATIONNAME').text
+            if '\n' not in station_name:
+                station_list.update({station_name: abbreviation, abbreviation: station_name})
+        return station_list
+
+    def setUp(self):
+        self.table = transfers.initialize_transfer_table(TestTransferTable.read_stations())
+
+    def test_initialize_once(self):
+        assert self.table is transfers.initialize_transfer_table({})
+        assert 'Chatham' in self.table
+        assert 'Line 1 Station 1' not in self.table
+
+    def test_shared_stations(self):
+        """every shared station is on both patterns"""
+        for (first, second), stations in list(self.table.shared.items())[:100]:
+            for name in stations:
+                assert name in self.table.patterns[first][1]
+                assert name in self.table.patterns[second][1]
+
+    def test_transfer_stations(self):
+        """Morris & Essex to the Northeast Corridor"""
+        stations = self.table.transfer_stations('Chatham', 'Trenton')
+        assert 'Secaucus ' in stations
+        assert 'Chatham' not in stations
+        assert 'Trenton' not in stations
+        assert stations['Secaucus '] == transfers.DEFAULT_TRANSFER_SECONDS
+        assert stations is self.table.transfer_stations('Chatham', 'Trenton')
+
+    def test_unknown_station(self):
+        assert self.table.transfer_stations('Line 1 Station 1', 'Trenton') == {}
+
+    def test_station_override(self):
+        table = transfers.TransferTable(timetable.initialize_timetable(),
+                                        station_transfer_seconds={'Secaucus ': 600})
+        assert table.transfer_stations('Chatham', 'Trenton')['Secaucus '] == 600
+
+    def test_transfers_txt(self):
+        """minimum times within a station, other rules are ignored"""
+        schedule = timetable.initialize_timetable()
+        newark = schedule.station_stops['Newark Penn'][0]
+        chatham = schedule.station_stops['Chatham'][0]
+        summit = schedule.station_stops['Summit'][0]
+        with tempfile.TemporaryDirectory() as data_dir:
+            assert transfers.station_transfer_seconds(schedule, data_dir) == {}
+            with open(os.path.join(data_dir, 'transfers.txt'), 'w') as transfers_txt:
+                transfers_txt.write('from_stop_id,to_stop_id,transfer_type,min_transfer_time\n'
+                                    '{0},{0},2,420\n{0},{0},2,240\n'
+                                    '{1},{1},0,\n{1},{2},2,900\n'.format(newark, chatham,
+                                                                          summit))
+            assert transfers.station_transfer_seconds(schedule, data_dir) == \
+                {'Newark Penn': 420}
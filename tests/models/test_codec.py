@@ -0,0 +1,57 @@
+#!/usr/bin/python
+"""tests for the compact redis encoding"""
+from unittest import TestCase
+import os
+import json
+import xml.etree.ElementTree as ET
+from models import codec
+from njtransit.api import NJTransitAPI
+
+
+class TestCodec(TestCase):
+    """encapsulates our codec tests"""
+
+    @staticmethod
+    def read_board(filename: str) -> list:
+        """parse one of our canned real-time train schedules"""
+        cwd = os.getcwd().replace('\\', '/')
+        root = cwd.split('/tests')[0]
+        tree = ET.parse(root + '/tests/data/' + filename)
+        return NJTransitAPI.parse_train_schedule(tree.getroot())
+
+    def test_train_schedule_round_trip(self):
+        trains = TestCodec.read_board('NY_train_schedule.xml')
+        encoded = codec.encode_train_schedule(trains)
+        assert codec.is_encoded(encoded)
+        assert codec.decode_train_schedule(encoded) == trains
+
+    def test_smaller_than_json(self):
+        trains = TestCodec.read_board('NY_train_schedule.xml')
+        as_json = json.dumps(trains, default=lambda value: value.timestamp())
+        assert len(codec.encode_train_schedule(trains)) < len(as_json) / 4
+
+    def test_compressed(self):
+        """big boards are compressed, small ones aren't"""
+        trains = TestCodec.read_board('NY_train_schedule.xml')
+        assert codec.encode_train_schedule(trains)[2] & codec.FLAG_COMPRESSED
+        assert not codec.encode_train_schedule(trains[:1])[2] & codec.FLAG_COMPRESSED
+
+    def test_missing_values(self):
+        """missing keys stay missing, None stays None"""
+        trains = [{'tid': None, 'index': None, 'stops': {'New York': {'status': None}}},
+                  {'destination': 'Trenton'}]
+        assert codec.decode_train_schedule(codec.encode_train_schedule(trains)) == trains
+
+    def test_station_list_round_trip(self):
+        stations = {'CM': 'Chatham', 'Chatham': 'CM', 'SE': 'Secaucus ', 'Secaucus ': 'SE'}
+        assert codec.decode_station_list(codec.encode_station_list(stations)) == stations
+
+    def test_wrong_kind(self):
+        encoded = codec.encode_station_list({'CM': 'Chatham'})
+        self.assertRaises(codec.CodecError, codec.decode_train_schedule, encoded)
+        self.assertRaises(codec.CodecError, codec.decode_station_list, b'{"CM": "Chatham"}')
+
+    def test_newer_version(self):
+        encoded = bytearray(codec.encode_station_list({'CM': 'Chatham'}))
+        encoded[1] = codec.VERSION + 1
+        self.assertRaises(codec.CodecError, codec.decode_station_list, bytes(encoded))
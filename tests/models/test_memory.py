@@ -0,0 +1,84 @@
+#!/usr/bin/python
+"""tests for the tracemalloc memory diagnostics"""
+import sys
+import tracemalloc
+import lambda_function
+from gtfs import station_grid
+from models import memory, codec, setuplogging
+from tests.setupmocking import TestwithMocking
+from tests.controllers import test_station_names
+
+
+class TestMemory(TestwithMocking):
+    """encapsulates our memory diagnostics tests"""
+
+    def setUp(self):
+        super().setUp()
+        self.logged = []
+        self.handler = setuplogging.LOGGING_HANDLER
+        setuplogging.LOGGING_HANDLER = self.logged.append
+
+    def tearDown(self):
+        setuplogging.LOGGING_HANDLER = self.handler
+        memory.initialize_diagnostics(enabled=False)
+        super().tearDown()
+
+    def test_off_by_default(self):
+        assert memory.initialize_diagnostics() is None
+        assert not tracemalloc.is_tracing()
+
+    def test_deep_size(self):
+        strings = ['x' * 1000, 'y' * 1000]
+        assert memory.deep_size(strings) >= sys.getsizeof(strings) + 2000
+        # shared objects are only counted once
+        assert memory.deep_size([strings, strings]) < 2 * memory.deep_size(strings)
+        # modules & functions aren't data
+        assert memory.deep_size({'module': sys, 'function': len}) < 1000
+
+    def test_deep_size_slots(self):
+        stats = memory.deep_size(codec._StringTable())
+        table = codec._StringTable()
+        table.add('z' * 5000)
+        assert memory.deep_size(table) > stats + 5000
+
+    def test_long_lived_sizes(self):
+        codec._from_epoch(0)  # makes sure there's an hour offset cached
+        sizes = memory.long_lived_sizes()
+        assert sizes['codec_hour_offsets'] > 0
+        assert 'upstream_metrics' in sizes
+
+    def test_long_lived_measured_once(self):
+        codec._from_epoch(0)
+        measured = {}
+        sizes = memory.long_lived_sizes(measured)
+        offsets, size = measured['codec_hour_offsets']
+        assert sizes['codec_hour_offsets'] == size
+        # the same global isn't walked again, a rebuilt one is
+        measured['codec_hour_offsets'] = (offsets, -1)
+        assert memory.long_lived_sizes(measured)['codec_hour_offsets'] == -1
+        measured['codec_hour_offsets'] = ({}, -1)
+        assert memory.long_lived_sizes(measured)['codec_hour_offsets'] == size
+
+    def test_station_grid(self):
+        station_grid.initialize_station_grid(
+            test_station_names.TestStationNameIndex.read_stations())
+        assert memory.long_lived_sizes()['station_grid'] > 0
+
+    def test_run(self):
+        diagnostics = memory.initialize_diagnostics(enabled=True)
+        assert tracemalloc.is_tracing()
+        kept = diagnostics.run('Allocate', lambda size: [str(index) * 100 for index in range(size)], 1000)
+        assert len(kept) == 1000
+        report = diagnostics.last_report
+        assert report['intent'] == 'Allocate'
+        assert report['growth'] > 100 * 1000
+        assert report['peak'] >= report['growth']
+        assert any('test_memory.py' in site['site'] for site in report['top'])
+        assert self.logged[-1].startswith('[MEMORY]: Allocate grew')
+
+    def test_on_intent(self):
+        memory.initialize_diagnostics(enabled=True)
+        request = {"type": "IntentRequest", "intent": {"name": "AMAZON.HelpIntent"}}
+        response = lambda_function.on_intent(request, {"new": False})
+        assert response['response']['outputSpeech']['text'] == lambda_function.HELP_MESSAGE
+        assert memory.DIAGNOSTICS.last_report['intent'] == 'AMAZON.HelpIntent'
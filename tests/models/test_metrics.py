@@ -0,0 +1,131 @@
+#!/usr/bin/python
+"""tests for the in-process metrics registry"""
+from unittest import TestCase
+import json
+from models import metrics
+
+
+class TestMetrics(TestCase):
+    """encapsulates our metrics tests"""
+
+    def test_call(self):
+        registry = metrics.MetricsRegistry()
+        with registry.call('getTrainScheduleXML') as call:
+            call.bytes = 100
+            call.lap('network')
+            call.lap('decode')
+            call.items = 5
+            call.lap('parse')
+        with registry.call('getTrainScheduleXML') as call:
+            call.bytes = 50
+            call.lap('network')
+
+        stats = registry.snapshot()['getTrainScheduleXML']
+        assert stats['calls'] == 2
+        assert stats['errors'] == 0
+        assert stats['bytes'] == 150
+        assert stats['items'] == 5
+        assert stats['network_ms'] >= 0 and 'parse_ms' in stats
+
+    def test_error(self):
+        registry = metrics.MetricsRegistry()
+        with self.assertRaises(ValueError):
+            with registry.call('getStationListXML'):
+                raise ValueError('bad xml')
+        assert registry.snapshot()['getStationListXML']['errors'] == 1
+
+    def test_emit(self):
+        logged = []
+        registry = metrics.MetricsRegistry()
+        assert registry.emit(logged.append) == {}
+        assert not logged  # nothing to say
+
+        with registry.call('getTrainStopListJSON') as call:
+            call.items = 12
+        snapshot = registry.emit(logged.append)
+        assert snapshot['getTrainStopListJSON']['items'] == 12
+        assert len(logged) == 1
+        assert json.loads(logged[0][len('[UPSTREAM]: '):]) == snapshot
+        assert not registry.snapshot()  # reset
+
+
+class TestEmbeddedMetrics(TestCase):
+    """encapsulates our CloudWatch EMF tests"""
+
+    def setUp(self):
+        self.lines = []
+        self.emf = metrics.InvocationMetrics(namespace='Test', write=self.lines.append)
+
+    def test_bucket(self):
+        assert metrics.bucket(0) == 0.0
+        assert metrics.bucket(100) == metrics.bucket(101)
+        for milliseconds in (0.3, 7, 100, 2500):
+            assert abs(metrics.bucket(milliseconds) - milliseconds) / milliseconds < 0.1
+
+    def test_histogram_limit(self):
+        """a busy histogram keeps its shape in EMF's 100 values"""
+        histogram = metrics.Histogram()
+        for _ in range(900):
+            histogram.observe(10)
+        for _ in range(100):
+            histogram.observe(1000)
+        values = histogram.values()
+        assert len(values) <= metrics.EMF_MAX_VALUES
+        fast, slow = values.count(metrics.bucket(10)), values.count(metrics.bucket(1000))
+        assert 8 <= fast / slow <= 10
+
+    def test_flush(self):
+        """everything in the invocation goes out as a single line"""
+        self.emf.dimension('Intent', 'NextTrain')
+        for _ in range(50):
+            self.emf.count('Cache.redis.Hit')
+        self.emf.count('Errors', 0)
+        self.emf.observe('Latency', 212)
+        document = self.emf.flush(enabled=True)
+        assert len(self.lines) == 1
+        assert json.loads(self.lines[0]) == document
+
+        directive = document['_aws']['CloudWatchMetrics'][0]
+        assert directive['Namespace'] == 'Test'
+        assert directive['Dimensions'] == [['Intent']]
+        assert {'Name': 'Latency', 'Unit': 'Milliseconds'} in directive['Metrics']
+        assert {'Name': 'Cache.redis.Hit', 'Unit': 'Count'} in directive['Metrics']
+        assert document['Intent'] == 'NextTrain'
+        assert document['Cache.redis.Hit'] == 50
+        assert document['Errors'] == 0
+        assert document['Latency'] == [metrics.bucket(212)]
+
+        # started over
+        assert self.emf.flush(enabled=True) == {}
+        assert len(self.lines) == 1
+
+    def test_property(self):
+        """in the line, not a metric"""
+        self.emf.count('Errors', 0)
+        self.emf.set_property('Upstream', {'getTrainScheduleXML': {'calls': 2}})
+        document = self.emf.flush(enabled=True)
+        assert document['Upstream'] == {'getTrainScheduleXML': {'calls': 2}}
+        names = [metric['Name'] for metric in document['_aws']['CloudWatchMetrics'][0]['Metrics']]
+        assert names == ['Errors']
+        assert not self.emf.properties
+
+    def test_disabled(self):
+        self.emf.count('Errors')
+        assert self.emf.flush(enabled=False) == {}
+        assert not self.lines
+        assert not self.emf.counters
+
+    def test_upstream_calls(self):
+        """the NJTransit calls are counted & timed by endpoint"""
+        registry = metrics.MetricsRegistry()
+        metrics.EMF.reset()
+        with registry.call('getTrainScheduleXML') as call:
+            call.lap('network')
+        with self.assertRaises(ValueError):
+            with registry.call('getTrainScheduleXML'):
+                raise ValueError('bad xml')
+        assert metrics.EMF.counters['Upstream.getTrainScheduleXML.Calls'] == 2
+        assert metrics.EMF.counters['Upstream.getTrainScheduleXML.Errors'] == 1
+        assert sum(metrics.EMF.histograms['Upstream.getTrainScheduleXML.Latency']
+                   .counts.values()) == 2
+        metrics.EMF.reset()
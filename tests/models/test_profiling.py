@@ -0,0 +1,70 @@
+#!/usr/bin/python
+"""tests for the opt-in handler profiling"""
+from unittest import TestCase
+import os
+import pstats
+import tempfile
+from models import profiling, setuplogging
+
+
+def busy(count: int) -> int:
+    return sum(range(count))
+
+
+class TestProfiling(TestCase):
+    """encapsulates our profiling tests"""
+
+    def setUp(self):
+        self.logged = []
+        self.handler = setuplogging.LOGGING_HANDLER
+        setuplogging.LOGGING_HANDLER = self.logged.append
+
+    def tearDown(self):
+        setuplogging.LOGGING_HANDLER = self.handler
+        profiling.PROFILER = None
+        os.environ.pop('PROFILE_SAMPLE_RATE', None)
+
+    def test_off_by_default(self):
+        assert profiling.initialize_profiler() is None
+
+    def test_environment_turns_on(self):
+        os.environ['PROFILE_SAMPLE_RATE'] = '0.25'
+        profiler = profiling.initialize_profiler()
+        assert profiler.sample_rate == 0.25
+        assert profiler.invocations == profiling.DEFAULT_INVOCATIONS
+
+    def test_not_sampled(self):
+        profiler = profiling.Profiler(0.1, sampler=lambda: 0.5)
+        assert profiler.run(busy, 10) == 45
+        assert profiler.stats is None
+
+    def test_aggregate_then_log(self):
+        profiler = profiling.Profiler(1.0, invocations=3, top=5)
+        for _ in range(2):
+            profiler.run(busy, 1000)
+        assert profiler.profiled == 2
+        assert 'busy' in profiler.summary()
+        profiler.run(busy, 1000)
+        assert profiler.profiled == 0  # reported & reset
+        assert self.logged[0].startswith('[PROFILE]: 3 invocations')
+        assert 'busy' in self.logged[0]
+
+    def test_dump_to_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'handler.prof')
+            profiler = profiling.Profiler(1.0, invocations=1, output_path=path)
+            profiler.run(busy, 1000)
+            stats = pstats.Stats(path)
+            assert any(name == 'busy' for _, _, name in stats.stats)
+
+    def test_exception_still_profiled(self):
+        profiler = profiling.Profiler(1.0, invocations=2)
+        self.assertRaises(ZeroDivisionError, profiler.run, lambda: 1 / 0)
+        assert profiler.profiled == 1
+
+    def test_profiled_handler(self):
+        handler = profiling.profiled(lambda event, context: event['value'])
+        assert handler({'value': 1}, None) == 1
+        profiling.PROFILER = profiling.Profiler(1.0, invocations=5)
+        assert handler({'value': 2}, None) == 2
+        assert profiling.PROFILER.profiled == 1
@@ -1,5 +1,7 @@
 #!/usr/bin/python
 from unittest import TestCase
+from datetime import datetime
+import pytz
 from models import cloudredis
 import fakeredis
 
@@ -42,6 +44,7 @@ class TestRedis(TestCase):
         cloudredis.REDIS_SERVER = 'foobar'
         cloudredis.initialize_cloud_redis(injected_server=None)
         assert cloudredis.REDIS_SERVER == 'foobar'
+        cloudredis.REDIS_SERVER = None
 
     def test_redis_cache_station_list(self):
         """verify we can cache a station list and get it back correctly"""
@@ -85,3 +88,28 @@ class TestRedis(TestCase):
         assert cloudredis.exists('station_list')
         cached_list = cloudredis.station_list()
         assert cached_list == to_cache
+
+    def test_redis_cache_train_schedule(self):
+        """a train schedule comes back with its times intact"""
+        fake = fakeredis.FakeStrictRedis()
+        cloudredis.initialize_cloud_redis(injected_server=fake)
+        timezone = pytz.timezone("America/New_York")
+        departure = timezone.localize(datetime(2018, 12, 11, 7, 35))
+        trains = [{'tid': '3711', 'destination': 'Trenton', 'departure': departure, 'index': 0,
+                   'stops': {'New York': {'time': departure, 'status': 'OnTime', 'departed': False}}}]
+
+        assert cloudredis.train_schedule('NY') is None
+        cloudredis.cache_train_schedule('NY', trains, seconds=60)
+        just_cached = cloudredis.train_schedule('NY')
+        assert just_cached == trains
+        assert just_cached[0]['stops']['New York']['time'].hour == 7
+        assert 0 < fake.ttl(cloudredis.board_key('NY')) <= 60
+
+    def test_redis_station_traffic(self):
+        """the busiest stations come first"""
+        fake = fakeredis.FakeStrictRedis()
+        cloudredis.initialize_cloud_redis(injected_server=fake)
+        for station in ['NY', 'CM', 'NY', 'HB', 'NY', 'CM']:
+            cloudredis.record_station_request(station)
+        assert cloudredis.top_stations(2) == ['NY', 'CM']
+        assert cloudredis.top_stations(10) == ['NY', 'CM', 'HB']
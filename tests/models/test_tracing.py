@@ -0,0 +1,85 @@
+#!/usr/bin/python
+"""tests for the request tracing"""
+from unittest import TestCase
+import json
+import os
+import tempfile
+from models import tracing
+
+
+class TestTracing(TestCase):
+    """encapsulates our tracing tests"""
+
+    def setUp(self):
+        self.tracer = tracing.Tracer()
+        self.logged = []
+
+    def test_spans(self):
+        """spans nest under the root, in the order they started"""
+        with self.tracer.trace('request', enabled=True, intent='NextTrain') as root:
+            with self.tracer.span('schedule', start='CM') as schedule:
+                with self.tracer.span('redis'):
+                    tracing.annotate(key='board')
+            with self.tracer.span('response'):
+                pass
+        assert tracing.CURRENT.get() is None
+
+        records = self.tracer.emit(self.logged.append, path='')
+        assert len(records) == 1 and len(self.logged) == 1
+        assert json.loads(self.logged[0][len('[TRACE]: '):]) == records[0]
+        spans = records[0]['spans']
+        assert [span['name'] for span in spans] == ['request', 'schedule', 'redis', 'response']
+        assert spans[0]['parent_id'] is None
+        assert spans[0]['attributes'] == {'intent': 'NextTrain'}
+        assert spans[1]['parent_id'] == root.span_id
+        assert spans[2]['parent_id'] == schedule.span_id
+        assert spans[2]['attributes'] == {'key': 'board'}
+        assert spans[3]['parent_id'] == root.span_id
+        assert spans[0]['duration_ms'] >= spans[1]['duration_ms'] >= spans[2]['duration_ms']
+        assert not self.tracer.emit(self.logged.append, path='')  # started over
+
+    def test_disabled(self):
+        """no trace, the spans are no-ops"""
+        with self.tracer.trace('request', enabled=False) as root:
+            with self.tracer.span('schedule') as span:
+                tracing.annotate(key='board')
+        assert root is None and span is None
+        assert self.tracer.emit(self.logged.append, path='') == []
+        assert not self.logged
+
+    def test_error(self):
+        with self.assertRaises(KeyError):
+            with self.tracer.trace('request', enabled=True):
+                with self.tracer.span('schedule'):
+                    raise KeyError('station')
+        spans = self.tracer.emit(self.logged.append, path='')[0]['spans']
+        assert spans[0]['attributes']['error'] == 'KeyError'
+        assert spans[1]['attributes']['error'] == 'KeyError'
+        assert tracing.CURRENT.get() is None
+
+    def test_traced(self):
+        @tracing.traced()
+        def lookup(value: int) -> int:
+            return value + 1
+
+        assert lookup(1) == 2  # outside a trace
+        with tracing.TRACER.trace('request', enabled=True):
+            assert lookup(2) == 3
+        spans = tracing.TRACER.emit(self.logged.append, path='')[0]['spans']
+        assert spans[1]['name'] == 'test_tracing.TestTracing.test_traced.<locals>.lookup'
+
+    def test_export_chrome(self):
+        """the trace file is a JSON array of Chrome trace events after every request"""
+        path = os.path.join(tempfile.mkdtemp(), 'traces.json')
+        for _ in range(2):
+            with self.tracer.trace('request', enabled=True):
+                with self.tracer.span('schedule'):
+                    pass
+            self.tracer.emit(self.logged.append, path=path)
+
+        with open(path) as trace_file:
+            events = json.load(trace_file)
+        assert [event['name'] for event in events] == ['request', 'schedule'] * 2
+        assert all(event['ph'] == 'X' and event['dur'] >= 0 for event in events)
+        assert events[0]['tid'] == events[1]['tid'] != events[2]['tid']
+        assert events[1]['args']['parent_id'] == events[0]['args']['span_id']
@@ -8,6 +8,7 @@ import xml.etree.ElementTree as ET
 from http import HTTPStatus
 import responses
 from njtransit.api import NJTransitAPI
+from models import metrics
 from configuration import config
 from requests import RequestException
 
@@ -79,6 +80,18 @@ class TestNJTransitAPI(TestCase):
         except RequestException:
             pass
 
+    @responses.activate
+    def test_share_train_stations(self):
+        """objects made after sharing don't fetch the station list"""
+        stations = {'Chatham': 'CM', 'CM': 'Chatham'}
+        NJTransitAPI.share_train_stations(stations)
+        try:
+            assert TestNJTransitAPI.create_tst_object().train_stations is stations
+            assert NJTransitAPI().train_stations is stations
+        finally:
+            NJTransitAPI.share_train_stations({})
+        assert len(responses.calls) == 0
+
     @responses.activate
     def test_station_list(self):
         njt = TestNJTransitAPI.create_tst_object()
@@ -104,6 +117,20 @@ class TestNJTransitAPI(TestCase):
         station_list = njt._NJTransitAPI__fetch_train_stations()
         assert not station_list
 
+    @responses.activate
+    def test_station_list_metrics_error(self):
+        """a parse error is counted against the endpoint"""
+        njt = TestNJTransitAPI.create_tst_object()
+
+        url = config.HOSTNAME + "/NJTTrainData.asmx/getStationListXML"
+        responses.add(responses.POST, url, body=b'<STATIONS>', status=HTTPStatus.CREATED)
+
+        metrics.UPSTREAM.reset()
+        self.assertRaises(ET.ParseError, njt._NJTransitAPI__fetch_train_stations)
+        stats = metrics.UPSTREAM.snapshot()['getStationListXML']
+        metrics.UPSTREAM.reset()
+        assert stats['calls'] == 1 and stats['errors'] == 1
+
     @responses.activate
     def test_station_list_parse_error(self):
         njt = TestNJTransitAPI.create_tst_object()
@@ -135,6 +162,24 @@ class TestNJTransitAPI(TestCase):
             assert 'departure' in train
             assert 'destination' in train
 
+    @responses.activate
+    def test_train_schedule_metrics(self):
+        """each call records its size, item count & timings"""
+        njt = TestNJTransitAPI.create_tst_object()
+
+        url = config.HOSTNAME + "/NJTTrainData.asmx/getTrainScheduleXML"
+        test_bytes = TestNJTransitAPI.read_data('train_schedule.xml')
+        responses.add(responses.POST, url, body=test_bytes, status=HTTPStatus.CREATED)
+
+        metrics.UPSTREAM.reset()
+        train_list = njt.train_schedule('NY')
+        stats = metrics.UPSTREAM.snapshot()['getTrainScheduleXML']
+        metrics.UPSTREAM.reset()
+        assert stats['calls'] == 1
+        assert stats['bytes'] == len(test_bytes)
+        assert stats['items'] == len(train_list)
+        assert stats['network_ms'] >= 0 and stats['decode_ms'] >= 0 and stats['parse_ms'] >= 0
+
     @responses.activate
     def test_train_schedule_404(self):
         njt = TestNJTransitAPI.create_tst_object()
@@ -228,6 +273,34 @@ class TestNJTransitAPI(TestCase):
         assert 'New York' in stops[0]
         assert 'Chatham' in stops[12]
 
+    def test_to_ET(self):
+        """picking the string apart gives what strptime does"""
+        for value in ('08-Dec-2018 12:05:30 AM', '08-Dec-2018 12:05:30 PM',
+                      '31-Jan-2019 01:00:00 AM', '10-Mar-2019 11:59:59 PM',
+                      '03-Nov-2019 01:30:00 AM'):
+            expected = pytz.timezone("America/New_York").\
+                localize(datetime.strptime(value, '%d-%b-%Y %I:%M:%S %p'))
+            assert NJTransitAPI.to_ET(value) == expected
+            assert NJTransitAPI.to_ET(value).utcoffset() == expected.utcoffset()
+
+        # not the usual layout, strptime handles it
+        assert NJTransitAPI.to_ET('8-Dec-2018 1:05:30 PM') == \
+            NJTransitAPI.to_ET('08-Dec-2018 01:05:30 PM')
+        self.assertRaises(ValueError, NJTransitAPI.to_ET, '08-Dec-2018 13:05:30 PM')
+
+    def test_train_stops_payload(self):
+        content = TestNJTransitAPI.read_data('train_stops.json')
+        payload = NJTransitAPI.train_stops_payload(content)
+        assert payload.startswith(b'{') and payload.endswith(b'}')
+        assert NJTransitAPI.parse_train_stops(payload) == \
+            NJTransitAPI.parse_train_stops(ET.fromstring(content.decode('utf-8')).text)
+
+        # escaped characters, the XML is parsed to unescape them
+        content = b'<?xml version="1.0" encoding="utf-8"?>\n<string xmlns="http://x">' \
+                  b'{"Line": "Morris &amp; Essex"}</string>'
+        assert NJTransitAPI.train_stops_payload(content) == '{"Line": "Morris & Essex"}'
+        self.assertRaises(ET.ParseError, NJTransitAPI.train_stops_payload, b'<nothing/>')
+
     @responses.activate
     def test_station_stops_request_exception(self):
         njt = TestNJTransitAPI.create_tst_object()
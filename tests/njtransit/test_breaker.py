@@ -0,0 +1,147 @@
+#!/usr/bin/python
+"""tests for the NJTransit circuit breaker"""
+from unittest import TestCase
+from http import HTTPStatus
+import fakeredis
+import redis
+import requests
+import responses
+from njtransit import breaker
+from njtransit.api import NJTransitAPI
+from models import cloudredis
+from configuration import config
+
+
+class Clock:
+    """time that only moves when we say so"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def fail():
+    raise requests.ConnectionError('down')
+
+
+class DownRedis:
+    """every redis command fails"""
+
+    def __getattr__(self, name):
+        def command(*args, **kwargs):
+            raise redis.ConnectionError('redis is down')
+        return command
+
+
+class TestBreaker(TestCase):
+    """encapsulates our circuit breaker tests"""
+
+    def setUp(self):
+        self.server = cloudredis.REDIS_SERVER
+        cloudredis.REDIS_SERVER = None
+        self.clock = Clock()
+
+    def tearDown(self):
+        cloudredis.REDIS_SERVER = self.server
+
+    def make_breaker(self) -> breaker.CircuitBreaker:
+        return breaker.CircuitBreaker('test', failures=2, window_seconds=60,
+                                      open_seconds=30, slow_seconds=1, clock=self.clock)
+
+    def test_disabled(self):
+        circuit = breaker.CircuitBreaker('test', failures=0)
+        for _ in range(10):
+            self.assertRaises(requests.ConnectionError, circuit.call, fail)
+        assert circuit.state() == 'closed'
+        assert circuit.call(lambda: 1) == 1
+
+    def test_opens(self):
+        circuit = self.make_breaker()
+        self.assertRaises(requests.ConnectionError, circuit.call, fail)
+        assert circuit.state() == 'closed'
+        self.assertRaises(requests.ConnectionError, circuit.call, fail)
+        assert circuit.state() == 'open'
+        # fail fast, func isn't called
+        self.assertRaises(breaker.CircuitOpenError, circuit.call, fail)
+
+    def test_failures_expire(self):
+        circuit = self.make_breaker()
+        self.assertRaises(requests.ConnectionError, circuit.call, fail)
+        self.clock.now += 61
+        self.assertRaises(requests.ConnectionError, circuit.call, fail)
+        assert circuit.state() == 'closed'
+
+    def test_half_open(self):
+        circuit = self.make_breaker()
+        circuit.failure()
+        circuit.failure()
+        self.clock.now += 31
+        assert circuit.state() == 'half-open'
+
+        # the probe fails, open again
+        self.assertRaises(requests.ConnectionError, circuit.call, fail)
+        assert circuit.state() == 'open'
+
+        # the next probe works, closed
+        self.clock.now += 31
+        assert circuit.call(lambda: 'ok') == 'ok'
+        assert circuit.state() == 'closed'
+
+    def test_one_probe(self):
+        circuit = self.make_breaker()
+        circuit.failure()
+        circuit.failure()
+        self.clock.now += 31
+        assert circuit.allow()  # we're the probe
+        other = self.make_breaker()
+        other._local = circuit._local  # same process
+        assert not other.allow()
+
+    def test_slow_and_server_errors(self):
+        circuit = self.make_breaker()
+        circuit.success(seconds=5)  # too slow
+        circuit.call(lambda: HTTPStatus.BAD_GATEWAY, is_failure=lambda status: status >= 500)
+        assert circuit.state() == 'open'
+
+    def test_shared_in_redis(self):
+        cloudredis.REDIS_SERVER = fakeredis.FakeStrictRedis()
+        first = self.make_breaker()
+        second = self.make_breaker()
+        first.failure()
+        second.failure()
+        assert first.state() == 'open'
+        self.clock.now += 31
+        assert second.allow()  # second container probes
+        assert not first.allow()
+        second.success(seconds=0.1)
+        assert first.state() == 'closed'
+        cloudredis.REDIS_SERVER.flushall()
+
+    def test_redis_down(self):
+        """the breaker still works, in process, when redis doesn't"""
+        cloudredis.REDIS_SERVER = DownRedis()
+        circuit = self.make_breaker()
+        self.assertRaises(requests.ConnectionError, circuit.call, fail)
+        self.assertRaises(requests.ConnectionError, circuit.call, fail)
+        assert circuit.state() == 'open'
+        self.assertRaises(breaker.CircuitOpenError, circuit.call, fail)
+        self.clock.now += 31
+        assert circuit.call(lambda: 'ok') == 'ok'
+        assert circuit.state() == 'closed'
+
+    @responses.activate
+    def test_api_fails_fast(self):
+        url = config.HOSTNAME + "/NJTTrainData.asmx/getTrainScheduleXML"
+        responses.add(responses.POST, url, body=b'', status=HTTPStatus.SERVICE_UNAVAILABLE)
+        saved = breaker.BREAKER
+        breaker.BREAKER = self.make_breaker()
+        try:
+            njt = NJTransitAPI()
+            assert njt.train_schedule('NY') == []
+            assert njt.train_schedule('NY') == []
+            self.assertRaises(breaker.CircuitOpenError, njt.train_schedule, 'NY')
+            assert len(responses.calls) == 2
+        finally:
+            breaker.BREAKER = saved
@@ -0,0 +1,64 @@
+#!/usr/bin/python
+"""every XML parser backend gives the same answer as ElementTree"""
+from unittest import TestCase
+import os
+import xml.etree.ElementTree as ET
+from njtransit import parsers
+from njtransit.api import NJTransitAPI
+
+
+class TestParsers(TestCase):
+    """encapsulates our parser backend tests"""
+
+    @staticmethod
+    def read_data(filename: str) -> bytes:
+        cwd = os.getcwd().replace('\\', '/')
+        root = cwd.split('/tests')[0]
+        file_pointer = open(root + '/tests/data/' + filename, mode='rb')
+        data = file_pointer.read()
+        file_pointer.close()
+        return data
+
+    def compare(self, filename: str, parse: str, expected) -> None:
+        content = TestParsers.read_data(filename)
+        for name in parsers.BACKENDS:
+            backend = parsers.get_backend(name)
+            assert backend.name == name
+            actual = getattr(backend, parse)(backend.decode(content))
+            self.assertEqual(actual, expected, '{0} {1}'.format(name, filename))
+
+    def test_train_schedule(self):
+        for filename in ('train_schedule.xml', 'NY_train_schedule.xml', 'CM_train_schedule.xml',
+                         'getTrainScheduleXML_Hoboken.xml'):
+            root = ET.fromstring(TestParsers.read_data(filename).decode('utf-8'))
+            self.compare(filename, 'train_schedule', NJTransitAPI.parse_train_schedule(root))
+
+    def test_station_schedule(self):
+        for filename in ('station_schedule.xml', 'getStationScheduleXML_Hoboken.xml'):
+            root = ET.fromstring(TestParsers.read_data(filename).decode('utf-8'))
+            self.compare(filename, 'station_schedule', NJTransitAPI.parse_station_schedule(root))
+
+    def test_station_list(self):
+        root = ET.fromstring(TestParsers.read_data('train_stations.xml').decode('utf-8'))
+        expected = NJTransitAPI.parse_station_list(root)
+        assert len(expected) == 174 * 2
+        self.compare('train_stations.xml', 'station_list', expected)
+
+    def test_incomplete_item(self):
+        """a train without all of its details is left out"""
+        content = b'<STATION><ITEMS><ITEM><TRAIN_ID>1</TRAIN_ID><STOPS><STOP><NAME>A</NAME>' \
+                  b'<TIME></TIME></STOP></STOPS></ITEM></ITEMS></STATION>'
+        self.compare_content(content, 'train_schedule', [])
+
+    def compare_content(self, content: bytes, parse: str, expected) -> None:
+        for name in parsers.BACKENDS:
+            backend = parsers.get_backend(name)
+            self.assertEqual(getattr(backend, parse)(backend.decode(content)), expected, name)
+
+    def test_parse_error(self):
+        for name in parsers.BACKENDS:
+            backend = parsers.get_backend(name)
+            self.assertRaises(ET.ParseError, backend.station_list, backend.decode(b'<STATIONS>'))
+
+    def test_unknown_backend(self):
+        assert parsers.get_backend('sax2000').name == parsers.DEFAULT_BACKEND
@@ -0,0 +1,103 @@
+#!/usr/bin/python
+"""tests for the per-train stop list cache"""
+from datetime import timedelta
+from njtransit.api import NJTransitAPI
+from models import cloudredis
+from tests.setupmocking import TestwithMocking
+
+
+class TestStopCache(TestwithMocking):
+    """encapsulates our stop list cache tests"""
+
+    def setUp(self):
+        super().setUp()
+        NJTransitAPI.stop_list_cache = True
+        self.njt = NJTransitAPI()
+        self.fetched = []
+        self.status = 'OnTime'
+        self.njt.train_stops = self.train_stops  # NJTransit, canned
+
+    def tearDown(self):
+        NJTransitAPI.stop_list_cache = False
+        super().tearDown()
+
+    def train_stops(self, train_id: str) -> dict:
+        self.fetched.append(train_id)
+        return {train_id: [
+            {'Chatham': {'time': NJTransitAPI.to_ET('08-Dec-2018 10:00:00 AM'),
+                         'departed': 'NO', 'status': self.status}},
+            {'New York': {'time': NJTransitAPI.to_ET('08-Dec-2018 10:50:00 AM'),
+                          'departed': 'NO', 'status': self.status}}]}
+
+    def test_round_trip(self):
+        stops = self.train_stops('6919')['6919']
+        departure = NJTransitAPI.to_ET('08-Dec-2018 10:00:00 AM')
+        cloudredis.cache_train_stops('6919', departure.date(), stops, 60)
+        assert cloudredis.train_stops('6919', departure.date()) == stops
+        assert cloudredis.train_stops('6919', departure.date() + timedelta(days=1)) is None
+
+    def test_cached_until_near_departure(self):
+        departure = NJTransitAPI.to_ET('08-Dec-2018 10:00:00 AM')
+        early = departure - timedelta(hours=2)
+        stops = self.njt.cached_train_stops('6919', departure, now=early)
+        assert self.fetched == ['6919']
+        assert self.njt.cached_train_stops('6919', departure, now=early) == stops
+        assert self.fetched == ['6919']  # from redis
+
+        # expires a while after the last stop
+        ttl = cloudredis.REDIS_SERVER.ttl(cloudredis.stops_key('6919', departure.date()))
+        assert ttl == int((timedelta(hours=2, minutes=50) + NJTransitAPI.stop_list_grace).
+                          total_seconds())
+
+    def test_after_midnight(self):
+        """every station the train stops at shares the day it left its origin"""
+        late = NJTransitAPI.to_ET('08-Dec-2018 11:30:00 PM')
+        after_midnight = NJTransitAPI.to_ET('09-Dec-2018 12:20:00 AM')
+
+        def train_stops(train_id: str) -> dict:
+            self.fetched.append(train_id)
+            return {train_id: [
+                {'New York': {'time': late, 'departed': 'NO', 'status': 'OnTime'}},
+                {'Chatham': {'time': after_midnight, 'departed': 'NO', 'status': 'OnTime'}}]}
+        self.njt.train_stops = train_stops
+
+        early = late - timedelta(hours=2)
+        stops = self.njt.cached_train_stops('6999', late, now=early)
+        assert self.njt.cached_train_stops('6999', after_midnight, now=early) == stops
+        assert self.fetched == ['6999']
+        assert NJTransitAPI.service_date(after_midnight) == late.date()
+
+    def test_no_stop_times(self):
+        self.njt.train_stops = lambda train_id: {train_id: [
+            {'Chatham': {'time': None, 'departed': 'NO', 'status': None}}]}
+        departure = NJTransitAPI.to_ET('08-Dec-2018 10:00:00 AM')
+        stops = self.njt.cached_train_stops('6919', departure, now=departure - timedelta(hours=2))
+        assert stops[0]['Chatham']['time'] is None
+        assert cloudredis.train_stops('6919', departure.date()) is None
+
+    def test_realtime_refresh(self):
+        departure = NJTransitAPI.to_ET('08-Dec-2018 10:00:00 AM')
+        self.njt.cached_train_stops('6919', departure, now=departure - timedelta(hours=2))
+
+        # about to leave, the status is refreshed
+        self.status = 'Late'
+        stops = self.njt.cached_train_stops('6919', departure,
+                                            now=departure - timedelta(minutes=5))
+        assert len(self.fetched) == 2
+        assert stops[0]['Chatham']['status'] == 'Late'
+        assert cloudredis.train_stops('6919', departure.date())[1]['New York']['status'] == 'Late'
+
+    def test_cache_off(self):
+        NJTransitAPI.stop_list_cache = False
+        departure = NJTransitAPI.to_ET('08-Dec-2018 10:00:00 AM')
+        for _ in range(2):
+            self.njt.cached_train_stops('6919', departure, now=departure - timedelta(hours=2))
+        assert len(self.fetched) == 2
+
+    def test_refresh_stop_status(self):
+        cached = [{'Chatham': {'time': 1, 'departed': 'NO', 'status': 'OnTime'}},
+                  {'Summit': {'time': 2, 'departed': 'NO', 'status': 'OnTime'}}]
+        fresh = [{'Chatham': {'time': 3, 'departed': 'YES', 'status': 'Late'}}]
+        assert NJTransitAPI.refresh_stop_status(cached, fresh) == \
+            [{'Chatham': {'time': 1, 'departed': 'YES', 'status': 'Late'}},
+             {'Summit': {'time': 2, 'departed': 'NO', 'status': 'OnTime'}}]
@@ -0,0 +1,159 @@
+#!/usr/bin/python
+"""tests for the standalone HTTP service"""
+import asyncio
+import json
+import os
+from http import HTTPStatus
+from urllib import parse
+import requests
+import responses
+from server import service
+from configuration import config
+from tests.setupmocking import TestwithMocking
+
+
+class TestService(TestwithMocking):
+    """encapsulates our HTTP service tests"""
+
+    @staticmethod
+    def read_data(filename: str) -> bytes:
+        cwd = os.getcwd().replace('\\', '/')
+        root = cwd.split('/tests')[0]
+        file_pointer = open(root + '/tests/data/' + filename, mode='rb')
+        data = file_pointer.read()
+        file_pointer.close()
+        return data
+
+    @staticmethod
+    def request_callback(request):
+        arguments = dict(parse.parse_qsl(request.body))
+        data = TestService.read_data('{0}_train_schedule.xml'.format(arguments['station']))
+        return HTTPStatus.CREATED, {'content-type': 'text/xml'}, data
+
+    def setUp(self):
+        super().setUp()
+        service.BOARDS.clear()
+        service.ServiceSchedule.station_list = None
+        url = config.HOSTNAME + "/NJTTrainData.asmx/getStationListXML"
+        responses.add(responses.POST, url, body=TestService.read_data('train_stations.xml'),
+                      status=HTTPStatus.CREATED)
+        url = config.HOSTNAME + "/NJTTrainData.asmx/getTrainScheduleXML"
+        responses.add_callback(responses.POST, url, callback=TestService.request_callback,
+                               content_type='text/xml')
+
+    def tearDown(self):
+        service.BOARDS.clear()
+        service.ServiceSchedule.station_list = None
+        super().tearDown()
+
+    @responses.activate
+    def test_next_train(self):
+        status, body = service.handle('GET', '/next-train?from=CM&to=New%20York'
+                                             '&time=2018-12-08T09:00:00-05:00')
+        assert status == HTTPStatus.OK
+        assert body['from'] == 'Chatham' and body['to'] == 'New York'
+        assert 'direct' in body or 'indirect' in body
+
+    @responses.activate
+    def test_next_trains(self):
+        status, body = service.handle('GET', '/next-trains?from=CM&to=New%20York&count=3'
+                                             '&time=2018-12-08T09:00:00-05:00')
+        assert status == HTTPStatus.OK
+        assert len(body['routes']) == 3
+        arrivals = [route['direct']['stops']['New York']['time'] if 'direct' in route else
+                    route['indirect']['transfer']['stops']['New York']['time']
+                    for route in body['routes']]
+        assert arrivals == sorted(arrivals)
+        assert service.handle('GET', '/next-trains?from=CM&to=NY&count=0')[0] == \
+            HTTPStatus.BAD_REQUEST
+
+    @responses.activate
+    def test_memory_cache(self):
+        service.handle('GET', '/route?from=CM&to=NY&time=2018-12-08T09:00:00-05:00')
+        calls = len(responses.calls)
+        status, body = service.handle('GET', '/route?from=CM&to=NY'
+                                             '&time=2018-12-08T09:00:00-05:00')
+        assert status == HTTPStatus.OK
+        assert body['direct']
+        assert len(responses.calls) == calls  # stations & both boards from memory
+
+    @responses.activate
+    def test_bad_requests(self):
+        assert service.handle('GET', '/next-train?from=CM')[0] == HTTPStatus.BAD_REQUEST
+        assert service.handle('GET', '/next-train?from=CM&to=Nowhere%20Junction')[0] == \
+            HTTPStatus.BAD_REQUEST
+        assert service.handle('GET', '/next-train?from=CM&to=CM')[0] == HTTPStatus.BAD_REQUEST
+        assert service.handle('GET', '/next-train?from=CM&to=NY&time=tuesday')[0] == \
+            HTTPStatus.BAD_REQUEST
+        assert service.handle('GET', '/departures')[0] == HTTPStatus.NOT_FOUND
+        assert service.handle('POST', '/route')[0] == HTTPStatus.METHOD_NOT_ALLOWED
+
+    @responses.activate
+    def test_nearest_station(self):
+        """a location instead of 'from' starts at the nearest station"""
+        status, body = service.handle('GET', '/next-train?lat=40.7402&lon=-74.3848&to=NY'
+                                             '&time=2018-12-08T09:00:00-05:00')
+        assert status == HTTPStatus.OK
+        assert body['from'] == 'Chatham'
+        assert service.handle('GET', '/next-train?lat=0&lon=0&to=NY')[0] == \
+            HTTPStatus.BAD_REQUEST
+        assert service.handle('GET', '/next-train?lat=north&lon=0&to=NY')[0] == \
+            HTTPStatus.BAD_REQUEST
+
+    def test_parse_time(self):
+        eastern = service.parse_time('2018-12-08T09:00:00-05:00')
+        assert eastern.utcoffset().total_seconds() == -5 * 3600
+        assert service.parse_time('2018-12-08T14:00:00Z') == eastern
+        # an unescaped '+' in the query string is a space by the time we see it
+        assert service.parse_time('2018-12-08T15:00:00 01:00') == eastern
+        assert service.parse_time('2018-12-08T15:00:00+01:00') == eastern
+        self.assertRaises(service.BadRequest, service.parse_time, '2018-12-08T15:00:00')
+
+    @responses.activate
+    def test_plus_offset(self):
+        status, body = service.handle('GET', '/next-train?from=CM&to=NY'
+                                             '&time=2018-12-08T15:00:00+01:00')
+        assert status == HTTPStatus.OK
+        assert body['time'] == service.parse_time('2018-12-08T09:00:00-05:00')
+
+    @responses.activate
+    def test_upstream_down(self):
+        responses.replace(responses.POST,
+                          config.HOSTNAME + "/NJTTrainData.asmx/getTrainScheduleXML",
+                          body=requests.ConnectionError('down'))
+        status, body = service.handle('GET', '/route?from=CM&to=NY')
+        assert status == HTTPStatus.SERVICE_UNAVAILABLE
+
+    @responses.activate
+    def test_http(self):
+        """two requests on one keep-alive connection"""
+        loop = asyncio.new_event_loop()
+        sock = service.listen('127.0.0.1', 0)
+        port = sock.getsockname()[1]
+        http_service = service.HTTPService(threads=2)
+
+        async def client():
+            server = await http_service.start(sock)
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            answers = []
+            for target in ('/health', '/next-train?from=CM&to=NY&time=2018-12-08T09:00:00-05:00'):
+                writer.write('GET {0} HTTP/1.1\r\nHost: test\r\n\r\n'.format(target).
+                             encode('latin-1'))
+                head = await reader.readuntil(b'\r\n\r\n')
+                length = int(head.split(b'Content-Length: ')[1].split(b'\r\n')[0])
+                answers.append((head, json.loads((await reader.readexactly(length)).
+                                                 decode('utf-8'))))
+            writer.close()
+            await asyncio.sleep(0.1)  # the server sees the close
+            server.close()
+            await server.wait_closed()
+            return answers
+
+        try:
+            answers = loop.run_until_complete(client())
+        finally:
+            loop.close()
+            sock.close()
+        assert answers[0][0].startswith(b'HTTP/1.1 200 OK')
+        assert answers[0][1] == {'status': 'ok'}
+        assert answers[1][1]['from'] == 'Chatham'
@@ -1,5 +1,7 @@
 """testing for the AWS lambda function interface"""
 import os
+import json
+from unittest import mock
 from datetime import datetime
 import pytz
 from http import HTTPStatus
@@ -8,7 +10,8 @@ import fakeredis
 import responses
 from urllib import parse
 from tests.setupmocking import TestwithMocking
-from models import cloudredis
+from models import cloudredis, metrics
+from controllers import train_scheduler
 from configuration import config
 from tests.njtransit.test_NJTransitAPI import TestNJTransitAPI
 from tests.test_data_generator import TrainScheduleData, TestSchedulerGeneratedData
@@ -67,6 +70,50 @@ class TestAWSlambda(TestwithMocking):
         assert not response['response']['shouldEndSession']
         assert response['response']['outputSpeech']['text'] == lambda_function.HELP_MESSAGE
 
+    def test_emf_metrics(self):
+        """one EMF line per invocation, dimensioned by the intent"""
+        get_help = {"request": {"type": "IntentRequest",
+                                "intent": {"name": "AMAZON.HelpIntent", "mocked": True}},
+                    "session": {"new": False}}
+        lines = []
+        with mock.patch.dict(os.environ, {'EMF_METRICS': 'true'}), \
+                mock.patch.object(metrics.EMF, 'write', lines.append):
+            lambda_function.lambda_handler(event=get_help, context=None)
+            with self.assertRaises(KeyError):
+                lambda_function.lambda_handler(event={"request": {}}, context=None)
+        assert len(lines) == 2
+        document = json.loads(lines[0])
+        assert document['Intent'] == 'AMAZON.HelpIntent'
+        assert document['Errors'] == 0
+        assert len(document['Latency']) == 1
+        assert json.loads(lines[1])['Errors'] == 1
+
+    @responses.activate
+    def test_emf_upstream(self):
+        """the NJTransit totals go in the EMF line, not a line of their own"""
+        url = config.HOSTNAME + "/NJTTrainData.asmx/getStationListXML"
+        test_bytes = TestNJTransitAPI.read_data('train_stations.xml')
+        responses.add(responses.POST, url, body=test_bytes, status=HTTPStatus.CREATED)
+        set_home_event = {
+            "request": {"type": "IntentRequest", "intent": {"name": "SetHome", "mocked": True,
+                                                            "slots": {"station": {"value": "Chatham"}}}},
+            "session": {"new": False, "user": {"userId": "bogus_user_id"}}}
+
+        lines = []
+        logged = []
+        with mock.patch.dict(os.environ, {'EMF_METRICS': 'true'}), \
+                mock.patch.object(metrics.EMF, 'write', lines.append), \
+                mock.patch.object(lambda_function, 'log', logged.append):
+            lambda_function.lambda_handler(event=set_home_event, context=None)
+        assert json.loads(lines[0])['Upstream']['getStationListXML']['calls'] == 1
+        assert not [message for message in logged if message.startswith('[UPSTREAM]: ')]
+
+        # EMF is off, the totals are logged by themselves
+        with mock.patch.dict(os.environ, {'EMF_METRICS': 'false'}), \
+                mock.patch.object(lambda_function, 'log', logged.append):
+            lambda_function.lambda_handler(event=set_home_event, context=None)
+        assert len([message for message in logged if message.startswith('[UPSTREAM]: ')]) == 1
+
     def test_unknown_intent_response(self):
         get_unknown = {"request" : {"type": "IntentRequest", "intent":\
                                     {"name": "JerseyTrains.UNKNOWN_INTENT", "mocked": True}},\
@@ -127,6 +174,21 @@ class TestAWSlambda(TestwithMocking):
         response = lambda_function.lambda_handler(event=set_home_event, context=None)
         assert response['response']['outputSpeech']['text'] == lambda_function.HOME_STATION_SET.format('Chatham')
 
+    @responses.activate
+    def test_set_home_station_resolved(self):
+        """the reply names the station we set, not what was said"""
+        url = config.HOSTNAME + "/NJTTrainData.asmx/getStationListXML"
+        test_bytes = TestNJTransitAPI.read_data('train_stations.xml')
+        responses.add(responses.POST, url, body=test_bytes, status=HTTPStatus.CREATED)
+
+        set_home_event = {
+            "request": {"type": "IntentRequest", "intent": {"name": "SetHome", "mocked": True,\
+                                                            "slots": {"station": {"value": "chatam"}}}},\
+            "session": {"new": False, "user": {"userId": "bogus_user_id"}}}
+
+        response = lambda_function.lambda_handler(event=set_home_event, context=None)
+        assert response['response']['outputSpeech']['text'] == lambda_function.HOME_STATION_SET.format('Chatham')
+
     def test_get_home_station_not_set(self):
         get_home_event = {
             "request": {"type": "IntentRequest", "intent": {"name": "GetHome", "mocked": True}},\
@@ -160,6 +222,17 @@ class TestAWSlambda(TestwithMocking):
         speech_time = lambda_function.format_speech_time(test_time)
         assert speech_time == '12:10 AM'
 
+    @staticmethod
+    def request_callback_late_train_schedule(request):
+        """the test schedule with a train leaving Line 1 Station 1 at 5:30"""
+        arguments = dict(parse.parse_qsl(request.body))
+        train_stops = dict(TestAWSlambda.test_data['test_schedule'])
+        train_stops['07'] = {'depart': '11-Dec-2018 05:30:00 AM', 'stops': ['11', '12', '13', '14']}
+        tsd = TrainScheduleData(train_stops=train_stops)
+        current_time = datetime.strptime('11-Dec-2018 01:30:00 AM', '%d-%b-%Y %I:%M:%S %p')
+        schedule = tsd.generate_train_schedule(station_name=arguments['station'], current_time=current_time)
+        return HTTPStatus.CREATED, {'content-type': 'text/xml'}, schedule
+
     @staticmethod
     def request_callback_station_list(request):
         arguments = dict(parse.parse_qsl(request.body))
@@ -329,6 +402,50 @@ class TestAWSlambda(TestwithMocking):
                             ' will leave at 2:00 AM and arrive at 5:00 AM</speak>'
         assert response['response']['outputSpeech']['ssml'] == expected_response
 
+    @responses.activate
+    def test_lambda_trace(self):
+        """a NextTrain request is one trace record, the layers nested under the handler"""
+        url = config.HOSTNAME + "/NJTTrainData.asmx/getStationListXML"
+        responses.add_callback(
+            responses.POST, url,
+            callback=TestAWSlambda.request_callback_station_list,
+            content_type='text/xml',)
+
+        url = config.HOSTNAME + "/NJTTrainData.asmx/getTrainScheduleXML"
+        responses.add_callback(
+            responses.POST, url,
+            callback=TestAWSlambda.request_callback_train_schedule,
+            content_type='text/xml',)
+
+        cloudredis.initialize_cloud_redis(injected_server=fakeredis.FakeStrictRedis())
+        cloudredis.REDIS_SERVER.set(cloudredis.home_key('bogus_user_id'), 'Line 1 Station 1')
+        next_station_event = {
+            "request": {"type": "IntentRequest",
+                        "intent": {"name": "NextTrain", "time": to_ET('11-Dec-2018 01:30:00 AM'),
+                                   "slots": {"station": {"value": 'Line 1 Station 9'}}}},
+            "session": {"new": False, "user": {"userId": "bogus_user_id"}}}
+
+        logged = []
+        with mock.patch.dict(os.environ, {'TRACING': 'true'}), \
+                mock.patch.object(lambda_function, 'log', logged.append), \
+                mock.patch.object(train_scheduler.TrainSchedule, 'board_cache_seconds', 60):
+            lambda_function.lambda_handler(event=next_station_event, context=None)
+        traces = [message for message in logged if message.startswith('[TRACE]: ')]
+        assert len(traces) == 1
+        spans = json.loads(traces[0][len('[TRACE]: '):])['spans']
+        names = [span['name'] for span in spans]
+        assert names[0] == 'lambda_handler'
+        assert spans[0]['attributes'] == {'intent': 'NextTrain'}
+        assert 'ScheduleUser.get_home_station' in names
+        assert 'NJTransitAPI.getTrainScheduleXML' in names
+        schedule = spans[names.index('TrainSchedule.schedule')]
+        assert schedule['parent_id'] == spans[0]['span_id']
+        assert schedule['attributes'] == {'start': '11', 'destination': '19'}
+        board = spans[names.index('cloudredis.train_schedule')]
+        assert board['parent_id'] == schedule['span_id']
+        indirect = spans[names.index('TrainSchedule.schedule_indirect_routes')]
+        assert indirect['parent_id'] == schedule['span_id']
+
     @responses.activate
     def test_lambda_next_train_indirect(self):
         """Since the train scheduler calls the getTrainScheduleXML
@@ -367,6 +484,65 @@ class TestAWSlambda(TestwithMocking):
         response = lambda_function.lambda_handler(event=next_station_event, context=None)
         assert response
 
+    @responses.activate
+    def test_lambda_arrive_by(self):
+        """the latest train that gets there by the time asked for"""
+        url = config.HOSTNAME + "/NJTTrainData.asmx/getStationListXML"
+        responses.add_callback(
+            responses.POST, url,
+            callback=TestAWSlambda.request_callback_station_list,
+            content_type='text/xml',)
+
+        url = config.HOSTNAME + "/NJTTrainData.asmx/getTrainScheduleXML"
+        responses.add_callback(
+            responses.POST, url,
+            callback=TestAWSlambda.request_callback_late_train_schedule,
+            content_type='text/xml',)
+
+        set_home_event = {
+            "request": {"type": "IntentRequest", "intent": {"name": "SetHome",
+                                                            "slots": {"station": {"value": 'Line 1 Station 1'}}}},
+            "session": {"new": False, "user": {"userId": "bogus_user_id"}}}
+        lambda_function.lambda_handler(event=set_home_event, context=None)
+
+        test_time = to_ET('11-Dec-2018 01:30:00 AM')
+        arrive_by_event = {
+            "request": {"type": "IntentRequest", "intent": {"name": "ArriveBy", "time": test_time,
+                                                            "slots": {"station": {"value": 'Line 1 Station 9'},
+                                                                      "time": {"value": '05:00'}}}},
+            "session": {"new": False, "user": {"userId": "bogus_user_id"}}}
+        response = lambda_function.lambda_handler(event=arrive_by_event, context=None)
+        assert response['response']['outputSpeech']['text'] == \
+            lambda_function.ARRIVE_BY_DIRECT.format('Line 1 Station 1', 'Line 1 Station 9',
+                                                    '5:00 AM', '2:00 AM', '5:00 AM')
+
+        # too early for any train
+        arrive_by_event['request']['intent']['slots']['time']['value'] = '02:00'
+        response = lambda_function.lambda_handler(event=arrive_by_event, context=None)
+        assert response['response']['outputSpeech']['text'] == \
+            lambda_function.NO_TRAINS_ARRIVE_BY.format('Line 1 Station 1', 'Line 1 Station 9',
+                                                       '2:00 AM')
+
+        # after the last train on the boards, & the timetable doesn't know these stations
+        arrive_by_event['request']['intent']['slots']['time']['value'] = '06:00'
+        response = lambda_function.lambda_handler(event=arrive_by_event, context=None)
+        assert response['response']['outputSpeech']['text'] == \
+            lambda_function.ARRIVE_BY_TOO_FAR.format('Line 1 Station 1', 'Line 1 Station 9',
+                                                     '6:00 AM')
+
+        # not a time of day
+        arrive_by_event['request']['intent']['slots']['time']['value'] = 'EV'
+        response = lambda_function.lambda_handler(event=arrive_by_event, context=None)
+        assert response['response']['outputSpeech']['text'] == lambda_function.ARRIVAL_TIME_INVALID
+
+    def test_arrival_time_slot(self):
+        """a time that's already passed today is tomorrow's"""
+        current_time = to_ET('11-Dec-2018 08:30:00 AM')
+        assert lambda_function.arrival_time_slot('09:15', current_time) == \
+            to_ET('11-Dec-2018 09:15:00 AM')
+        assert lambda_function.arrival_time_slot('08:00', current_time) == \
+            to_ET('12-Dec-2018 08:00:00 AM')
+
     def test_next_train_direct_response_error(self):
 
         route = {'stops': 'generate key error'}
@@ -411,6 +587,58 @@ class TestAWSlambda(TestwithMocking):
         assert 'The next train from' in response['response']['outputSpeech']['text']
         assert 'with a transfer at' in response['response']['outputSpeech']['text']
 
+    def test_next_train_response_indirect(self):
+        route = {'start': {'stops': {
+                    'Line 1 Station 1': {'time': to_datetime('11-Dec-2018 01:30:00 AM')}}},
+                 'transfer': {'stops': {
+                    'Line 1 Station 5': {'time': to_datetime('11-Dec-2018 02:25:00 AM')},
+                    'Line 1 Station 9': {'time': to_datetime('11-Dec-2018 03:10:00 AM')}}},
+                 'station': 'Line 1 Station 5'}
+        response = lambda_function.next_train_response('Line 1 Station 1', 'Line 1 Station 9',
+                                                       {'indirect': route})
+        assert response['response']['outputSpeech']['text'] == \
+            lambda_function.NEXT_TRAIN_INDIRECT.format('Line 1 Station 1', 'Line 1 Station 9',
+                                                       '1:30 AM', '3:10 AM', 'Line 1 Station 5')
+
+    def test_next_trains_response(self):
+        direct = {'stops': {
+            'Line 1 Station 1': {'time': to_datetime('11-Dec-2018 01:30:00 AM')},
+            'Line 1 Station 9': {'time': to_datetime('11-Dec-2018 02:10:00 AM')}}}
+        indirect = {'start': {'stops': {
+                        'Line 1 Station 1': {'time': to_datetime('11-Dec-2018 01:45:00 AM')}}},
+                    'transfer': {'stops': {
+                        'Line 1 Station 9': {'time': to_datetime('11-Dec-2018 03:10:00 AM')}}},
+                    'station': 'Line 1 Station 5'}
+        response = lambda_function.next_trains_response('Line 1 Station 1', 'Line 1 Station 9',
+                                                        [{'direct': direct},
+                                                         {'indirect': indirect}])
+        assert response['response']['outputSpeech']['text'] == \
+            'The next 2 trains from Line 1 Station 1 to Line 1 Station 9 leave at ' \
+            '1:30 AM and arrive at 2:10 AM, or at 1:45 AM and arrive at 3:10 AM ' \
+            'with a transfer at Line 1 Station 5'
+
+        response = lambda_function.next_trains_response('Line 1 Station 1', 'Line 1 Station 9',
+                                                        [{'indirect': {}}, {'direct': direct}])
+        assert response['response']['outputSpeech']['text'] == lambda_function.PROBLEM_WITH_ROUTE
+
+    def test_train_count_slot(self):
+        def request(value) -> dict:
+            return {'intent': {'slots': {'count': {'value': value}}}}
+        assert lambda_function.train_count_slot({'intent': {'slots': {}}}) == 1
+        assert lambda_function.train_count_slot(request('2')) == 2
+        assert lambda_function.train_count_slot(request('?')) == 1
+        assert lambda_function.train_count_slot(request('20')) == lambda_function.MAX_NEXT_TRAINS
+
+    def test_next_train_direct_response_stale(self):
+        route = {'stops': {
+            'Line 1 Station 1': {'time': to_datetime('11-Dec-2018 01:30:00 AM')},
+            'Line 1 Station 9': {'time': to_datetime('11-Dec-2018 03:10:00 AM')}}}
+
+        response = lambda_function.next_train_direct_response('Line 1 Station 1', 'Line 1 Station 9',
+                                                              route, stale=True)
+        assert response['response']['outputSpeech']['ssml'].\
+            startswith('<speak>' + lambda_function.STALE_SCHEDULE)
+
     @staticmethod
     def test_live_lambda_next_train():
         """Since the train scheduler calls the getTrainScheduleXML